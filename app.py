@@ -1,6 +1,8 @@
-from app import create_app
+# 进程池（spawn）的工作进程会以 __mp_main__ 的名字重新执行本文件，此时不创建应用
+if __name__ != '__mp_main__':
+    from app import create_app
 
-app = create_app()
+    app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8080) 
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=8080)
@@ -7,6 +7,9 @@ from app.models.chat_models import chat_archive_service
 class AIModelManager:
     """AI模型管理器"""
     
+    # 模型接口请求的默认超时（秒）
+    REQUEST_TIMEOUT = 30
+    
     def __init__(self):
         self.conversation_history = []
         self.user_identity = None  # 用户身份信息
@@ -30,8 +33,8 @@ class AIModelManager:
         if len(self.conversation_history) >= config.chat_storage_limit:
             self.chat_terminated = True
     
-    def get_system_prompt(self):
-        """获取系统提示词"""
+    def get_system_prompt(self, grounding=None):
+        """获取系统提示词（提供参考资料时要求模型依据资料回答）"""
         style_prompts = {
             'formal': '请用正式、专业的语言回复。',
             'casual': '请用轻松、友好的语言回复。',
@@ -47,6 +50,9 @@ class AIModelManager:
         if config.enable_emotions:
             system_prompt += "请在回复中表达适当的情感，让对话更加生动。"
         
+        if grounding:
+            system_prompt += f"\n请优先依据以下参考资料回答，资料中没有的内容不要编造：\n{grounding}"
+        
         return system_prompt.strip()
     
     def verify_identity(self, user_input):
@@ -128,8 +134,32 @@ class AIModelManager:
         message_lower = user_message.lower().strip()
         return any(keyword in message_lower for keyword in goodbye_keywords)
     
-    def get_response_sync(self, user_message):
-        """获取AI回复（同步版本）"""
+    def can_speculate(self, user_message):
+        """判断是否可以预先生成回复（身份验证、告别、已终止等有副作用的情况除外）"""
+        if self.chat_terminated:
+            return False
+        if config.enable_identity_verification and not self.is_identity_verified:
+            return False
+        return not self.detect_goodbye_intent(user_message)
+    
+    def generate_response_sync(self, user_message, grounding=None, timeout=None):
+        """调用当前模型生成回复（同步版本，不记录历史，出错时抛出异常；timeout 为请求超时秒数）"""
+        # 截止时间已过（剩余0秒）时不再发起请求，None 才表示使用默认超时
+        if timeout is not None and timeout <= 0:
+            raise TimeoutError("请求截止时间已过，未调用模型")
+        if config.current_provider == 'openai':
+            return self._call_openai_sync(user_message, grounding, timeout)
+        elif config.current_provider == 'anthropic':
+            return self._call_anthropic_sync(user_message, grounding, timeout)
+        elif config.current_provider == 'deepseek':
+            return self._call_deepseek_sync(user_message, grounding, timeout)
+        elif config.current_provider == 'local':
+            return self._call_local_sync(user_message, grounding, timeout)
+        else:
+            return self._get_mock_response(user_message)
+    
+    def get_response_sync(self, user_message, grounding=None, timeout=None):
+        """获取AI回复（同步版本，grounding 为可选的参考资料文本，timeout 为请求超时秒数）"""
         try:
             # 检查聊天是否已终止
             if self.chat_terminated:
@@ -164,16 +194,7 @@ class AIModelManager:
             # 检测是否是告别意图
             if self.detect_goodbye_intent(user_message):
                 # 先获取AI回复
-                if config.current_provider == 'openai':
-                    response = self._call_openai_sync(user_message)
-                elif config.current_provider == 'anthropic':
-                    response = self._call_anthropic_sync(user_message)
-                elif config.current_provider == 'deepseek':
-                    response = self._call_deepseek_sync(user_message)
-                elif config.current_provider == 'local':
-                    response = self._call_local_sync(user_message)
-                else:
-                    response = self._get_mock_response(user_message)
+                response = self.generate_response_sync(user_message, grounding, timeout)
                 
                 # 添加到历史记录
                 self.add_to_history(user_message, response)
@@ -184,16 +205,7 @@ class AIModelManager:
                 return response
             
             # 正常处理AI回复
-            if config.current_provider == 'openai':
-                response = self._call_openai_sync(user_message)
-            elif config.current_provider == 'anthropic':
-                response = self._call_anthropic_sync(user_message)
-            elif config.current_provider == 'deepseek':
-                response = self._call_deepseek_sync(user_message)
-            elif config.current_provider == 'local':
-                response = self._call_local_sync(user_message)
-            else:
-                response = self._get_mock_response(user_message)
+            response = self.generate_response_sync(user_message, grounding, timeout)
             
             # 添加到历史记录
             self.add_to_history(user_message, response)
@@ -422,9 +434,9 @@ class AIModelManager:
         else:
             raise Exception(f"本地模型API错误: {response.status_code}")
     
-    def _call_openai_sync(self, user_message):
+    def _call_openai_sync(self, user_message, grounding=None, timeout=None):
         """调用OpenAI API（同步版本）"""
-        messages = [{"role": "system", "content": self.get_system_prompt()}]
+        messages = [{"role": "system", "content": self.get_system_prompt(grounding)}]
         
         # 添加历史对话
         for conv in self.conversation_history[-5:]:  # 只保留最近5轮对话
@@ -450,7 +462,7 @@ class AIModelManager:
             f'{config.base_url}/chat/completions',
             headers=headers,
             json=data,
-            timeout=30
+            timeout=self.REQUEST_TIMEOUT if timeout is None else timeout
         )
         
         if response.status_code == 200:
@@ -460,7 +472,7 @@ class AIModelManager:
         else:
             raise Exception(f"OpenAI API错误: {response.status_code}")
     
-    def _call_anthropic_sync(self, user_message):
+    def _call_anthropic_sync(self, user_message, grounding=None, timeout=None):
         """调用Anthropic API（同步版本）"""
         headers = {
             'x-api-key': config.api_key,
@@ -469,7 +481,7 @@ class AIModelManager:
         }
         
         # 构建对话历史
-        conversation = self.get_system_prompt() + "\n\n"
+        conversation = self.get_system_prompt(grounding) + "\n\n"
         for conv in self.conversation_history[-5:]:
             conversation += f"Human: {conv['user']}\n\nAssistant: {conv['assistant']}\n\n"
         conversation += f"Human: {user_message}\n\nAssistant:"
@@ -485,7 +497,7 @@ class AIModelManager:
             f'{config.base_url}/v1/messages',
             headers=headers,
             json=data,
-            timeout=30
+            timeout=self.REQUEST_TIMEOUT if timeout is None else timeout
         )
         
         if response.status_code == 200:
@@ -495,9 +507,9 @@ class AIModelManager:
         else:
             raise Exception(f"Anthropic API错误: {response.status_code}")
     
-    def _call_deepseek_sync(self, user_message):
+    def _call_deepseek_sync(self, user_message, grounding=None, timeout=None):
         """调用DeepSeek API（同步版本）"""
-        messages = [{"role": "system", "content": self.get_system_prompt()}]
+        messages = [{"role": "system", "content": self.get_system_prompt(grounding)}]
         
         # 添加历史对话
         for conv in self.conversation_history[-5:]:  # 只保留最近5轮对话
@@ -523,7 +535,7 @@ class AIModelManager:
             f'{config.base_url}/chat/completions',
             headers=headers,
             json=data,
-            timeout=30
+            timeout=self.REQUEST_TIMEOUT if timeout is None else timeout
         )
         
         if response.status_code == 200:
@@ -533,9 +545,9 @@ class AIModelManager:
         else:
             raise Exception(f"DeepSeek API错误: {response.status_code} - {response.text}")
     
-    def _call_local_sync(self, user_message):
+    def _call_local_sync(self, user_message, grounding=None, timeout=None):
         """调用本地模型API（同步版本）"""
-        messages = [{"role": "system", "content": self.get_system_prompt()}]
+        messages = [{"role": "system", "content": self.get_system_prompt(grounding)}]
         
         # 添加历史对话
         for conv in self.conversation_history[-5:]:
@@ -558,7 +570,7 @@ class AIModelManager:
             f'{config.base_url}/chat/completions',
             headers=headers,
             json=data,
-            timeout=30
+            timeout=self.REQUEST_TIMEOUT if timeout is None else timeout
         )
         
         if response.status_code == 200:
@@ -1,10 +1,17 @@
 """
 大语言模型相关路由
 """
-from flask import Blueprint, request, jsonify
+import json
+import hashlib
+import time
+import threading
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from app.app_config import config
 from app.models import ai_manager
 from app.service.llm import intent_handler_manager, intent_sync_adapter
+from app.service.kb import kb_service, faq_store, suggest_index
+from app.service.kb.ingest import ingestion_manager
+from app.service.vector import vector_store
 
 llm_bp = Blueprint('llm', __name__, url_prefix='/llm')
 
@@ -17,6 +24,72 @@ def get_client_ip():
     else:
         return request.environ.get('REMOTE_ADDR', 'unknown')
 
+def get_session_id():
+    """根据客户端IP和浏览器信息生成会话ID"""
+    raw = f"{get_client_ip()}|{request.headers.get('User-Agent', 'unknown')}"
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+def format_sse(event, data):
+    """格式化为SSE事件"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+def stream_intent_chat(user_message, context, parallel_processing):
+    """
+    以SSE方式返回意图处理结果：每个处理器完成后立即推送 result 事件，最后推送 final 合并结果
+    """
+    def generate():
+        for event in intent_sync_adapter.stream_message_sync(
+            intent_handler_manager,
+            user_message,
+            context,
+            parallel_processing
+        ):
+            if event['event'] != 'final':
+                yield format_sse(event['event'], event['data'])
+                continue
+            
+            intent_result = event['data']
+            if intent_result.get('success'):
+                response = intent_result.get('response', '')
+                
+                # 将意图识别的响应添加到对话历史（普通聊天处理器已自行记录）
+                intent_types = {intent.get('type') for intent in intent_result.get('intents', [])}
+                if response and intent_types != {'chat'}:
+                    ai_manager.add_to_history(user_message, response)
+                
+                final = {
+                    'success': True,
+                    'response': response,
+                    'intent_detection': True,
+                    'intents': intent_result.get('intents', []),
+                    'intent_data': intent_result.get('data', {}),
+                    'partial': intent_result.get('partial', False),
+                    'timed_out_intents': intent_result.get('timed_out_intents', []),
+                    'rejected_intents': intent_result.get('rejected_intents', [])
+                }
+            else:
+                # 意图处理失败，回退到普通聊天
+                print(f"意图处理失败，回退到普通聊天: {intent_result.get('error')}")
+                final = {
+                    'success': True,
+                    'response': ai_manager.get_response_sync(user_message),
+                    'intent_detection': False
+                }
+            
+            final.update({
+                'provider': config.current_provider,
+                'model': config.model,
+                'virtual_human_name': config.virtual_human_name
+            })
+            yield format_sse('final', final)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @llm_bp.route('/chat', methods=['POST'])
 def chat():
     """聊天API"""
@@ -48,12 +121,21 @@ def chat():
                 "ai_manager": ai_manager,
                 "config": config,
                 "session_info": ai_manager.session_info,
+                "session_id": get_session_id(),
                 "conversation_history": ai_manager.conversation_history[-10:]  # 最近10条对话
             }
             
+            # 是否与意图处理同时预先生成聊天回复（未指定时使用配置）
+            if 'speculative_chat' in data:
+                context['speculative_chat'] = bool(data['speculative_chat'])
+            
             # 是否并行处理多个意图
             parallel_processing = data.get('parallel_intents', True)
             
+            # 流式模式：每个处理器完成后立即推送结果
+            if data.get('stream', False):
+                return stream_intent_chat(user_message, context, parallel_processing)
+            
             # 调用意图处理
             print(f"开始处理意图，消息: {user_message}")
             intent_result = intent_sync_adapter.process_message_sync(
@@ -68,10 +150,10 @@ def chat():
             if intent_result.get('success'):
                 response = intent_result.get('response', '')
                 
-                # 将意图识别的响应添加到对话历史
-                if response:
-                    ai_manager.add_to_history('user', user_message)
-                    ai_manager.add_to_history('assistant', response)
+                # 将意图识别的响应添加到对话历史（普通聊天处理器已自行记录）
+                intent_types = {intent.get('type') for intent in intent_result.get('intents', [])}
+                if response and intent_types != {'chat'}:
+                    ai_manager.add_to_history(user_message, response)
                 
                 return jsonify({
                     'success': True,
@@ -81,7 +163,10 @@ def chat():
                     'virtual_human_name': config.virtual_human_name,
                     'intent_detection': True,
                     'intents': intent_result.get('intents', []),
-                    'intent_data': intent_result.get('data', {})
+                    'intent_data': intent_result.get('data', {}),
+                    'partial': intent_result.get('partial', False),
+                    'timed_out_intents': intent_result.get('timed_out_intents', []),
+                    'rejected_intents': intent_result.get('rejected_intents', [])
                 })
             else:
                 # 意图处理失败，回退到普通聊天
@@ -157,6 +242,192 @@ def list_intent_handlers():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@llm_bp.route('/intent/metrics', methods=['GET'])
+def get_intent_metrics():
+    """获取意图识别与处理的运行指标"""
+    try:
+        metrics = intent_handler_manager.get_metrics()
+        metrics['event_loops'] = intent_sync_adapter.get_metrics()
+        return jsonify({
+            'success': True,
+            'metrics': metrics
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@llm_bp.route('/kb/ingest', methods=['POST'])
+def start_kb_ingest():
+    """启动知识库文档导入任务（后台执行）"""
+    try:
+        data = request.get_json() or {}
+        kb_id = data.get('kb_id', 'default')
+        directory = data.get('directory')
+        documents = data.get('documents')
+        
+        if not isinstance(kb_id, str) or not kb_id.strip():
+            return jsonify({'error': '知识库ID必须是非空字符串'}), 400
+        kb_id = kb_id.strip()
+        # 只允许导入到配置的知识库（KB_IDS），避免按任意ID创建索引目录
+        if kb_id not in kb_service.kb_ids:
+            return jsonify({'error': f'知识库未配置: {kb_id}'}), 400
+        if not directory and not documents:
+            return jsonify({'error': '需要提供 directory 或 documents'}), 400
+        if directory and not isinstance(directory, str):
+            return jsonify({'error': 'directory 必须是字符串'}), 400
+        if documents and not (isinstance(documents, list) and all(isinstance(doc, dict) for doc in documents)):
+            return jsonify({'error': 'documents 必须是文档对象列表'}), 400
+        
+        job = ingestion_manager.start(kb_id, directory=directory, documents=documents)
+        return jsonify({
+            'success': True,
+            'job': job.to_dict()
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@llm_bp.route('/kb/ingest/<job_id>', methods=['GET'])
+def get_kb_ingest_job(job_id):
+    """查询知识库导入任务状态"""
+    job = ingestion_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '导入任务不存在'}), 404
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
+@llm_bp.route('/kb/stats', methods=['GET'])
+def get_kb_stats():
+    """获取本地知识库统计信息和导入任务"""
+    try:
+        # 只打开配置的知识库，避免按任意ID创建并缓存知识库实例
+        for kb_id in request.args.get('kb_ids', '').split(','):
+            if kb_id.strip() in kb_service.kb_ids:
+                kb_service.get_knowledge_base(kb_id.strip())
+        return jsonify({
+            'success': True,
+            'knowledge_bases': kb_service.stats(),
+            'faq': faq_store.stats(),
+            'jobs': ingestion_manager.list_jobs()
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@llm_bp.route('/kb/faq', methods=['GET'])
+def list_kb_faq():
+    """获取常见问题列表"""
+    try:
+        return jsonify({
+            'success': True,
+            'entries': faq_store.list_entries(),
+            'stats': faq_store.stats()
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@llm_bp.route('/kb/faq', methods=['POST'])
+def add_kb_faq():
+    """添加常见问题，支持单条（question/answer）或批量（entries）"""
+    try:
+        data = request.get_json() or {}
+        
+        if data.get('entries'):
+            added = faq_store.add_many(data['entries'])
+            return jsonify({'success': True, 'added': added})
+        
+        question = data.get('question', '').strip()
+        answer = data.get('answer', '').strip()
+        if not question or not answer:
+            return jsonify({'error': '问题和答案不能为空'}), 400
+        
+        entry = faq_store.add(question, answer, source=data.get('source', 'FAQ'))
+        return jsonify({'success': True, 'entry': entry})
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@llm_bp.route('/kb/faq/<entry_id>', methods=['DELETE'])
+def delete_kb_faq(entry_id):
+    """删除常见问题"""
+    if not faq_store.remove(entry_id):
+        return jsonify({'success': False, 'error': '常见问题不存在'}), 404
+    return jsonify({'success': True})
+
+@llm_bp.route('/kb/suggest', methods=['GET'])
+def get_kb_suggestions():
+    """输入联想：按前缀补全知识库文档标题和常见问题"""
+    try:
+        prefix = request.args.get('q', '')
+        limit = request.args.get('limit', type=int)
+        kb_ids = [kb_id.strip() for kb_id in request.args.get('kb_ids', '').split(',') if kb_id.strip()]
+        
+        start_time = time.perf_counter()
+        suggestions = suggest_index.suggest(prefix, limit=limit, kb_ids=kb_ids or None)
+        return jsonify({
+            'success': True,
+            'suggestions': suggestions,
+            'elapsed_ms': round((time.perf_counter() - start_time) * 1000, 3)
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@llm_bp.route('/vector/stats', methods=['GET'])
+def get_vector_stats():
+    """获取本地向量库统计信息"""
+    try:
+        # 只打开配置的集合，避免按任意名称创建并缓存集合实例
+        for collection_name in request.args.get('collections', '').split(','):
+            if collection_name.strip() in vector_store.collections:
+                vector_store.get_collection(collection_name.strip())
+        return jsonify({
+            'success': True,
+            'collections': vector_store.stats()
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@llm_bp.route('/vector/index', methods=['POST'])
+def build_vector_index():
+    """为向量集合建立（type=ivf）或删除（type=flat）近似索引，可指定量化方式（quantization），在后台执行"""
+    try:
+        data = request.get_json() or {}
+        
+        collection_name = data.get('collection', vector_store.collection_name)
+        # 只允许为配置的集合建立索引，避免按任意名称创建集合目录
+        if not isinstance(collection_name, str) or collection_name not in vector_store.collections:
+            return jsonify({'error': f'集合未配置: {collection_name}'}), 400
+        collection = vector_store.get_collection(collection_name)
+        index_type = data.get('type', 'ivf')
+        if index_type not in ('ivf', 'flat'):
+            return jsonify({'error': '索引类型只能是 ivf 或 flat'}), 400
+        quantization = data.get('quantization')
+        if quantization not in (None, 'none', 'int8', 'pq'):
+            return jsonify({'error': '量化方式只能是 none、int8 或 pq'}), 400
+        
+        threading.Thread(target=collection.build_index, args=(index_type, data.get('nlist'), quantization),
+                         daemon=True).start()
+        return jsonify({'success': True, 'collection': collection.name, 'type': index_type,
+                        'quantization': quantization or vector_store.quantization}), 202
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @llm_bp.route('/providers', methods=['GET'])
 def get_providers():
     """获取可用的模型提供商"""
@@ -231,6 +502,7 @@ def clear_chat_history():
             )
         
         ai_manager.clear_history(end_reason)
+        intent_handler_manager.session_store.reset(get_session_id())
         return jsonify({
             'success': True,
             'message': '聊天历史已清空并归档'
@@ -1,7 +1,21 @@
 # Service package initialization
 # 服务层模块初始化
-from .llm.llm_service import LLMService
-from .vision.vision_service import VisionService
-from .speech.speech_service import SpeechService
+# 各服务在首次访问时才导入：进程池（spawn）的工作进程只导入用到的子模块，不会连带加载全部服务
+import importlib
 
-__all__ = ['LLMService', 'VisionService', 'SpeechService'] 
\ No newline at end of file
+_EXPORTS = {
+    'LLMService': '.llm.llm_service',
+    'VisionService': '.vision.vision_service',
+    'SpeechService': '.speech.speech_service',
+}
+
+__all__ = ['LLMService', 'VisionService', 'SpeechService']
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,35 @@
+"""
+知识库服务包
+提供基于倒排索引和BM25打分的本地知识库
+
+文档导入见 ingest 模块（可通过 python -m app.service.kb.ingest 运行）
+"""
+from .tokenizer import tokenize
+from .segment import Segment, write_segment, merge_segments
+from .knowledge_base import KnowledgeBase, content_hash
+from .kb_service import KnowledgeBaseService, kb_service
+from .keywords import KeywordExtractor, keyword_extractor
+from .faq_store import FAQStore, faq_store, normalize_question
+from .summarizer import ExtractiveSummarizer, extractive_summarizer, split_sentences
+from .suggest import SuggestIndex, suggest_index
+
+__all__ = [
+    'tokenize',
+    'Segment',
+    'write_segment',
+    'merge_segments',
+    'KnowledgeBase',
+    'content_hash',
+    'KnowledgeBaseService',
+    'kb_service',
+    'KeywordExtractor',
+    'keyword_extractor',
+    'FAQStore',
+    'faq_store',
+    'normalize_question',
+    'ExtractiveSummarizer',
+    'extractive_summarizer',
+    'split_sentences',
+    'SuggestIndex',
+    'suggest_index',
+]
@@ -0,0 +1,430 @@
+"""
+常见问题（FAQ）快速匹配
+问题规范化后切分为字符片段（shingle，单字和相邻字组），用 MinHash 生成指纹并按 LSH 分桶；
+查询时只与同桶的候选问题比较，相似度达到阈值即直接返回预设答案，不需要检索知识库或调用模型。
+
+FAQ 来源：
+- 人工维护（add）
+- 自动学习：同一个问题多次得到知识库答案后加入（record_answer，默认关闭）；
+  学习到的答案是某一时刻的知识库内容，超过 learn_ttl 秒后失效，避免知识库更新后继续返回过时的答案
+"""
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import atexit
+import random
+import threading
+import dotenv
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+
+# 规范化时去除的字符：空白和标点
+_NOISE_PATTERN = re.compile(r"[\s\u3000-\u303f\uff00-\uff0f\uff1a-\uff20\uff3b-\uff40\uff5b-\uff65!-/:-@\[-`{-~]+")
+
+# 规范化时去除的语气词和客套词，它们不影响问题的含义
+_FILLER_PATTERN = re.compile(r"请问|麻烦问一下|一下|的|了|吗|呢|吧|啊|呀")
+
+# MinHash 使用的梅森素数
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_question(text: str) -> str:
+    """问题规范化：去除空白、标点和语气词，字母转小写"""
+    return _FILLER_PATTERN.sub("", _NOISE_PATTERN.sub("", text)).lower()
+
+
+class FAQStore:
+    """基于 MinHash + LSH 的近似重复问题匹配"""
+
+    # 学习计数最多跟踪的问题数
+    MAX_TRACKED_QUESTIONS = 10000
+
+    # 命中次数（用于输入联想排序）的最短持久化间隔（秒）
+    HITS_SAVE_INTERVAL = 60
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        初始化 FAQ 库
+
+        Args:
+            path: FAQ 持久化文件路径，默认使用配置
+        """
+        self._load_faq_config()
+        if path:
+            self.path = path
+
+        # 固定随机种子，保证指纹在不同进程和重启之间一致
+        rng = random.Random(20240601)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(self.num_perm)
+        ]
+        self._rows = self.num_perm // self.bands
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._exact: Dict[str, str] = {}
+        self._shingles: Dict[str, FrozenSet[str]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        # 条目变化时递增，供依赖 FAQ 的索引（如输入联想）判断是否需要重建
+        self.version = 0
+        # 命中次数持久化时递增（按 HITS_SAVE_INTERVAL 限频），供输入联想按最新命中次数重新排序
+        self.hits_version = 0
+        self.lookups = 0
+        self.hits = 0
+        self._hits_dirty = False
+        self._hits_saved_at = time.time()
+        self._load()
+
+    def _load_faq_config(self):
+        """加载 FAQ 配置"""
+        app_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        kb_config_path = os.path.join(app_dir, "config", "config_knowledge.env")
+
+        # 设置配置属性默认值
+        self.enabled = True
+        self.path = os.path.join(os.path.dirname(app_dir), "data", "knowledge_base", "faq.json")
+        self.threshold = 0.8
+        self.shingle_size = 2
+        self.num_perm = 64
+        self.bands = 16
+        self.learn = False
+        self.learn_min_hits = 3
+        self.learn_ttl = 86400
+
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(kb_config_path):
+            kb_config = dotenv.dotenv_values(kb_config_path)
+
+            self.enabled = kb_config.get("KB_FAQ_ENABLED", "true").lower() == "true"
+            faq_path = kb_config.get("KB_FAQ_PATH")
+            if faq_path:
+                # 相对路径以项目根目录为基准
+                self.path = faq_path if os.path.isabs(faq_path) else os.path.join(os.path.dirname(app_dir), faq_path)
+            self.threshold = float(kb_config.get("KB_FAQ_THRESHOLD", self.threshold))
+            self.shingle_size = int(kb_config.get("KB_FAQ_SHINGLE_SIZE", self.shingle_size))
+            self.num_perm = int(kb_config.get("KB_FAQ_NUM_PERM", self.num_perm))
+            self.bands = int(kb_config.get("KB_FAQ_LSH_BANDS", self.bands))
+            self.learn = kb_config.get("KB_FAQ_LEARN", "false").lower() == "true"
+            self.learn_min_hits = int(kb_config.get("KB_FAQ_LEARN_MIN_HITS", self.learn_min_hits))
+            self.learn_ttl = int(kb_config.get("KB_FAQ_LEARN_TTL", self.learn_ttl))
+
+        # 每个分桶的行数需为整数
+        self.bands = max(1, min(self.bands, self.num_perm))
+        self.num_perm -= self.num_perm % self.bands
+
+    # ---- 指纹 ----
+
+    def _shingle(self, normalized: str) -> FrozenSet[str]:
+        """
+        切分字符片段：长度 1~shingle_size 的所有字符n元组
+
+        短问题只差一两个字时，单字片段使相似度不会下降过多，多字片段保留字序信息。
+        """
+        return frozenset(
+            normalized[i:i + size]
+            for size in range(1, self.shingle_size + 1)
+            for i in range(len(normalized) - size + 1)
+        ) or frozenset([normalized])
+
+    def _signature(self, shingles: FrozenSet[str]) -> Tuple[int, ...]:
+        """计算 MinHash 签名"""
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._permutations
+        )
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        """LSH 分桶键：签名按行数切分，每段一个桶"""
+        rows = self._rows
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    @staticmethod
+    def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+        """字符片段集合的 Jaccard 相似度"""
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    # ---- 索引维护 ----
+
+    def _index(self, entry: Dict[str, Any]):
+        """将问题加入精确匹配表和 LSH 分桶（调用方需持有锁）"""
+        entry_id = entry["id"]
+        normalized = normalize_question(entry["question"])
+        shingles = self._shingle(normalized)
+        self._entries[entry_id] = entry
+        self._exact[normalized] = entry_id
+        self._shingles[entry_id] = shingles
+        for key in self._band_keys(self._signature(shingles)):
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+    def _unindex(self, entry_id: str):
+        """从索引中移除问题（调用方需持有锁）"""
+        entry = self._entries.pop(entry_id)
+        normalized = normalize_question(entry["question"])
+        if self._exact.get(normalized) == entry_id:
+            del self._exact[normalized]
+        shingles = self._shingles.pop(entry_id)
+        for key in self._band_keys(self._signature(shingles)):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _load(self):
+        """从文件加载 FAQ"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f).get("entries", [])
+        except Exception as e:
+            print(f"FAQ 加载失败: {str(e)}")
+            return
+        with self._lock:
+            for entry in entries:
+                if entry.get("question") and entry.get("answer"):
+                    self._index(entry)
+        print(f"FAQ 已加载: {len(self._entries)} 条 ({self.path})")
+
+    def _save(self, changed: bool = True):
+        """
+        原子写入 FAQ 文件（调用方需持有锁）
+
+        Args:
+            changed: 条目是否有增删改（只有命中次数变化时为False，不递增版本号）
+        """
+        if changed:
+            self.version += 1
+        if self._hits_dirty:
+            self.hits_version += 1
+        self._hits_dirty = False
+        self._hits_saved_at = time.time()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": list(self._entries.values())}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        """自动学习的条目是否已超过有效期"""
+        return bool(entry.get("learned") and self.learn_ttl > 0
+                    and now - entry.get("created_at", 0) > self.learn_ttl)
+
+    def flush(self):
+        """持久化尚未写入文件的命中次数"""
+        with self._lock:
+            if self._hits_dirty:
+                self._save(changed=False)
+
+    # ---- 对外接口 ----
+
+    def _put(self, question: str, answer: str, source: str, learned: bool) -> Optional[Dict[str, Any]]:
+        """写入一条 FAQ，规范化后相同的问题覆盖原有答案（调用方需持有锁）"""
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return None
+        existing_id = self._exact.get(normalized)
+        if existing_id is not None:
+            self._unindex(existing_id)
+        entry = {
+            "id": existing_id or uuid.uuid4().hex[:12],
+            "question": question.strip(),
+            "answer": answer,
+            "source": source,
+            "learned": learned,
+            "hits": 0,
+            "created_at": time.time()
+        }
+        self._index(entry)
+        self._pending.pop(normalized, None)
+        return entry
+
+    def add(self, question: str, answer: str, source: str = "FAQ", learned: bool = False) -> Dict[str, Any]:
+        """
+        添加（或更新）FAQ，规范化后相同的问题会覆盖原有答案
+
+        Args:
+            question: 问题
+            answer: 答案
+            source: 答案来源
+            learned: 是否为自动学习的条目
+
+        Returns:
+            FAQ 条目
+        """
+        with self._lock:
+            entry = self._put(question, answer, source, learned)
+            if entry is None:
+                raise ValueError("问题和答案不能为空")
+            self._save()
+        return entry
+
+    def add_many(self, entries: List[Dict[str, Any]]) -> int:
+        """
+        批量添加人工维护的 FAQ（只写一次文件）
+
+        Args:
+            entries: [{"question", "answer", "source"}] 列表
+
+        Returns:
+            添加的条目数
+        """
+        with self._lock:
+            added = sum(
+                1 for item in entries
+                if self._put(item.get("question", ""), item.get("answer", ""), item.get("source", "FAQ"), False)
+            )
+            if added:
+                self._save()
+        return added
+
+    def remove(self, entry_id: str) -> bool:
+        """
+        删除 FAQ
+
+        Args:
+            entry_id: 条目ID
+
+        Returns:
+            是否删除成功
+        """
+        with self._lock:
+            if entry_id not in self._entries:
+                return False
+            self._unindex(entry_id)
+            self._save()
+        return True
+
+    def match(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        查找与问题近似重复的 FAQ
+
+        Args:
+            question: 用户问题
+
+        Returns:
+            命中时返回 {"id", "question", "answer", "source", "similarity"}，否则返回None
+        """
+        if not self.enabled or not self._entries:
+            return None
+
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            expired = []
+            best_id = self._exact.get(normalized)
+            if best_id is not None and self._expired(self._entries[best_id], now):
+                expired.append(best_id)
+                best_id = None
+            best_similarity = 1.0 if best_id else 0.0
+
+            if best_id is None:
+                shingles = self._shingle(normalized)
+                candidates: Set[str] = set()
+                for key in self._band_keys(self._signature(shingles)):
+                    candidates.update(self._buckets.get(key, ()))
+                # LSH 只负责召回候选，最终用精确的 Jaccard 相似度判断
+                for entry_id in candidates:
+                    if entry_id in expired:
+                        continue
+                    if self._expired(self._entries[entry_id], now):
+                        expired.append(entry_id)
+                        continue
+                    similarity = self._jaccard(shingles, self._shingles[entry_id])
+                    if similarity > best_similarity:
+                        best_id, best_similarity = entry_id, similarity
+
+            # 过期的自动学习条目在被查到时删除
+            if expired:
+                for entry_id in expired:
+                    self._unindex(entry_id)
+                self._save()
+
+            if best_id is None or best_similarity < self.threshold:
+                return None
+
+            self.hits += 1
+            entry = self._entries[best_id]
+            entry["hits"] = entry.get("hits", 0) + 1
+            # 命中次数按间隔批量持久化，避免每次命中都写文件
+            self._hits_dirty = True
+            if now - self._hits_saved_at >= self.HITS_SAVE_INTERVAL:
+                self._save(changed=False)
+            return {
+                "id": entry["id"],
+                "question": entry["question"],
+                "answer": entry["answer"],
+                "source": entry.get("source", "FAQ"),
+                "similarity": round(best_similarity, 4)
+            }
+
+    def record_answer(self, question: str, answer: str, source: str = "知识库") -> Optional[Dict[str, Any]]:
+        """
+        记录一次知识库回答；同一问题（规范化后）得到回答达到 learn_min_hits 次时自动加入 FAQ
+
+        Args:
+            question: 用户问题
+            answer: 回答
+            source: 答案来源
+
+        Returns:
+            新学习到的 FAQ 条目，未达到次数时返回None
+        """
+        if not (self.enabled and self.learn and answer):
+            return None
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+
+        with self._lock:
+            pending = self._pending.pop(normalized, None) or {"count": 0}
+            pending["count"] += 1
+            pending["answer"] = answer
+            if pending["count"] < self.learn_min_hits:
+                self._pending[normalized] = pending
+                while len(self._pending) > self.MAX_TRACKED_QUESTIONS:
+                    self._pending.popitem(last=False)
+                return None
+
+        print(f"FAQ 自动学习: {question.strip()}")
+        return self.add(question, answer, source=source, learned=True)
+
+    def list_entries(self) -> List[Dict[str, Any]]:
+        """获取全部 FAQ 条目"""
+        with self._lock:
+            return [dict(entry) for entry in self._entries.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        """获取 FAQ 统计信息"""
+        with self._lock:
+            learned = sum(1 for entry in self._entries.values() if entry.get("learned"))
+            return {
+                "enabled": self.enabled,
+                "learn": self.learn,
+                "entries": len(self._entries),
+                "learned": learned,
+                "pending": len(self._pending),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0
+            }
+
+
+# 单例实例
+faq_store = FAQStore()
+atexit.register(faq_store.flush)
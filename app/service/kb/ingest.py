@@ -0,0 +1,378 @@
+"""
+知识库文档导入
+从目录中流式读取文档，切分为相互重叠的文本块，按内容哈希去重后分批写入新的索引段；
+分词在多个工作进程中并行执行，内存占用只与批大小有关，与语料总量无关。
+
+命令行用法::
+
+    python -m app.service.kb.ingest <目录> --kb faq [--chunk-size 500] [--overlap 100] [--workers 4] [--merge]
+"""
+import os
+import json
+import time
+import uuid
+import argparse
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from .kb_service import kb_service
+from .knowledge_base import KnowledgeBase
+from .tokenizer import tokenize
+
+
+# 读取文本文件的块大小（字符数）
+_READ_BLOCK_SIZE = 64 * 1024
+
+# 切分文本块时优先断开的位置（句末标点和换行）
+_BREAK_CHARS = "。！？；!?;\n"
+
+
+def chunk_text(blocks: Iterable[str], chunk_size: int = 500, overlap: int = 100) -> Iterator[str]:
+    """
+    将连续文本切分为相互重叠的文本块
+
+    尽量在句末标点或换行处断开（不早于块长度的一半），相邻两块重叠 overlap 个字符；
+    输入可以是按块读取的文本流，只在内存中保留不超过一个块的内容。
+
+    Args:
+        blocks: 文本片段序列（依次拼接为完整文本）
+        chunk_size: 文本块最大长度
+        overlap: 相邻文本块的重叠长度
+
+    Returns:
+        文本块迭代器（去除首尾空白，不含空块）
+    """
+    overlap = max(0, min(overlap, chunk_size // 2))
+    buffer = ""
+    start = 0
+    emitted = False
+
+    for block in blocks:
+        buffer = buffer[start:] + block
+        start = 0
+        while len(buffer) - start > chunk_size:
+            cut = start + chunk_size
+            for index in range(start + chunk_size - 1, start + chunk_size // 2 - 1, -1):
+                if buffer[index] in _BREAK_CHARS:
+                    cut = index + 1
+                    break
+            chunk = buffer[start:cut].strip()
+            if chunk:
+                yield chunk
+                emitted = True
+            start = max(cut - overlap, start + 1)
+
+    # 剩余内容已完全包含在上一块的重叠部分中时不再输出
+    tail = buffer[start:]
+    if tail.strip() and not (emitted and len(tail) <= overlap):
+        yield tail.strip()
+
+
+def _read_blocks(path: str) -> Iterator[str]:
+    """按块读取文本文件"""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        while True:
+            block = f.read(_READ_BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+def resolve_ingest_directory(directory: str, root: str) -> str:
+    """
+    解析通过接口提交的导入目录，只允许导入根目录之内的路径
+
+    Args:
+        directory: 目录（相对路径以导入根目录为基准）
+        root: 导入根目录，为空表示不允许通过接口导入目录
+
+    Returns:
+        解析符号链接后的绝对路径
+    """
+    if not root:
+        raise ValueError("未配置 KB_INGEST_ROOT，不允许通过接口导入目录")
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, directory))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"导入目录必须位于 {root} 之内: {directory}")
+    if not os.path.isdir(path):
+        raise ValueError(f"目录不存在: {directory}")
+    return path
+
+
+def iter_documents(directory: str, extensions: Sequence[str], chunk_size: int = 500,
+                   overlap: int = 100, root: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    流式遍历目录中的文档并切分为文本块
+
+    - .txt/.md 等文本文件：标题为相对路径，内容按块读取并切分
+    - .jsonl 文件：每行一个 {"title", "content", "source"} 对象，内容过长时同样切分
+
+    Args:
+        directory: 文档目录
+        extensions: 要导入的文件扩展名
+        chunk_size: 文本块最大长度
+        overlap: 相邻文本块的重叠长度
+        root: 指定时跳过（通过符号链接）指向该目录之外的文件
+
+    Returns:
+        文档块迭代器，每项包含 title、content、source、chunk
+    """
+    real_root = os.path.realpath(root) if root else None
+    for current_dir, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() not in extensions:
+                continue
+            path = os.path.join(current_dir, filename)
+            if real_root and os.path.commonpath([real_root, os.path.realpath(path)]) != real_root:
+                print(f"跳过导入根目录之外的文件: {path}")
+                continue
+            relative_path = os.path.relpath(path, directory)
+
+            if filename.lower().endswith(".jsonl"):
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            print(f"跳过无法解析的行: {relative_path}")
+                            continue
+                        title = record.get("title", "")
+                        source = record.get("source", relative_path)
+                        for index, chunk in enumerate(chunk_text([record.get("content", "")], chunk_size, overlap)):
+                            yield {"title": title, "content": chunk, "source": source, "chunk": index}
+                continue
+
+            title = os.path.splitext(relative_path)[0]
+            for index, chunk in enumerate(chunk_text(_read_blocks(path), chunk_size, overlap)):
+                yield {"title": title, "content": chunk, "source": relative_path, "chunk": index}
+
+
+# 分词进程池：所有导入任务共用，首次需要时创建，进程退出时关闭
+_tokenize_pool: Optional[ProcessPoolExecutor] = None
+_tokenize_pool_lock = threading.Lock()
+
+
+def _get_tokenize_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    获取（必要时创建）共享的分词进程池
+
+    服务进程是多线程的（导入任务本身就在后台线程中），fork 出的子进程可能继承其他线程持有的锁，因此用 spawn；
+    工作进程只执行 tokenizer.tokenize，导入分词模块即可，不创建应用和各服务单例。
+
+    Args:
+        workers: 创建进程池时的工作进程数（进程池已存在时忽略）
+
+    Returns:
+        进程池
+    """
+    global _tokenize_pool
+    with _tokenize_pool_lock:
+        if _tokenize_pool is None:
+            _tokenize_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _tokenize_pool
+
+
+def _shutdown_tokenize_pool():
+    """关闭分词进程池"""
+    with _tokenize_pool_lock:
+        if _tokenize_pool is not None:
+            _tokenize_pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown_tokenize_pool)
+
+
+class IngestionJob:
+    """一次导入任务，按批读取、分词、去重并写入索引段"""
+
+    def __init__(self, knowledge_base: KnowledgeBase, batch_size: int = 1000, workers: int = 1):
+        """
+        初始化导入任务
+
+        Args:
+            knowledge_base: 目标知识库
+            batch_size: 每批（每个新段）的最大文本块数
+            workers: 分词工作进程数，1表示在当前进程中分词（共享进程池只在首次创建时使用此值）
+        """
+        self.job_id = uuid.uuid4().hex[:12]
+        self.knowledge_base = knowledge_base
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.chunks_read = 0
+        self.documents_added = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def run(self, documents: Iterable[Dict[str, Any]]):
+        """
+        执行导入（阻塞直到完成）
+
+        Args:
+            documents: 文档迭代器（可以是惰性的，按批消费）
+        """
+        self.status = "running"
+        self.started_at = time.time()
+        executor = _get_tokenize_pool(self.workers) if self.workers > 1 else None
+        try:
+            batch = []
+            for document in documents:
+                record = self.knowledge_base.prepare_document(document)
+                if record is None:
+                    continue
+                batch.append(record)
+                self.chunks_read += 1
+                if len(batch) >= self.batch_size:
+                    self._write_batch(batch, executor)
+                    batch = []
+            if batch:
+                self._write_batch(batch, executor)
+            self.status = "completed"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            print(f"知识库 {self.knowledge_base.kb_id} 导入失败: {str(e)}")
+        finally:
+            self.finished_at = time.time()
+
+    def _write_batch(self, records: List[Dict[str, Any]], executor: Optional[ProcessPoolExecutor]):
+        """对一批文档分词并写入为新段"""
+        texts = [f"{record['title']}\n{record['content']}" for record in records]
+        if executor is not None:
+            chunksize = max(1, len(texts) // (self.workers * 4))
+            tokens = list(executor.map(tokenize, texts, chunksize=chunksize))
+        else:
+            tokens = [tokenize(text) for text in texts]
+
+        added = self.knowledge_base.add_tokenized(records, tokens)
+        self.documents_added += added
+        self.duplicates += len(records) - added
+        self.batches += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务状态"""
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "kb_id": self.knowledge_base.kb_id,
+            "status": self.status,
+            "error": self.error,
+            "chunks_read": self.chunks_read,
+            "documents_added": self.documents_added,
+            "duplicates": self.duplicates,
+            "batches": self.batches,
+            "elapsed_seconds": round(end - self.started_at, 2) if self.started_at else 0.0
+        }
+
+
+class IngestionManager:
+    """管理后台导入任务"""
+
+    # 保留的已结束任务数
+    MAX_FINISHED_JOBS = 50
+
+    def __init__(self):
+        """初始化任务管理器"""
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def create_job(self, kb_id: str) -> IngestionJob:
+        """按知识库配置创建导入任务"""
+        return IngestionJob(
+            kb_service.get_knowledge_base(kb_id),
+            batch_size=kb_service.ingest_batch_size,
+            workers=kb_service.ingest_workers
+        )
+
+    def start(self, kb_id: str, directory: Optional[str] = None,
+              documents: Optional[List[Dict[str, Any]]] = None) -> IngestionJob:
+        """
+        在后台线程中启动导入任务
+
+        Args:
+            kb_id: 目标知识库ID
+            directory: 文档目录（须位于 KB_INGEST_ROOT 之内，相对路径以其为基准）
+            documents: 直接提交的文档列表（与目录二选一）
+
+        Returns:
+            导入任务
+        """
+        if directory:
+            directory = resolve_ingest_directory(directory, kb_service.ingest_root)
+            source = iter_documents(directory, kb_service.ingest_extensions,
+                                    kb_service.chunk_size, kb_service.chunk_overlap, root=kb_service.ingest_root)
+        elif documents:
+            source = self._chunk_documents(documents)
+        else:
+            raise ValueError("需要提供 directory 或 documents")
+
+        job = self.create_job(kb_id)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+
+        threading.Thread(target=job.run, args=(source,), name=f"kb-ingest-{job.job_id}", daemon=True).start()
+        return job
+
+    @staticmethod
+    def _chunk_documents(documents: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """将直接提交的文档切分为文本块"""
+        for document in documents:
+            content = document.get("content", "")
+            for index, chunk in enumerate(chunk_text([content], kb_service.chunk_size, kb_service.chunk_overlap)):
+                yield {**document, "content": chunk, "chunk": index}
+
+    def _prune(self):
+        """清理过多的已结束任务（调用方需持有锁）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("completed", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """获取导入任务"""
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """获取所有任务状态"""
+        return [job.to_dict() for job in list(self._jobs.values())]
+
+
+# 单例实例
+ingestion_manager = IngestionManager()
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """命令行入口：导入目录中的文档"""
+    parser = argparse.ArgumentParser(description="导入文档到本地知识库")
+    parser.add_argument("directory", help="文档目录")
+    parser.add_argument("--kb", default="default", help="知识库ID")
+    parser.add_argument("--chunk-size", type=int, default=kb_service.chunk_size, help="文本块最大长度")
+    parser.add_argument("--overlap", type=int, default=kb_service.chunk_overlap, help="相邻文本块的重叠长度")
+    parser.add_argument("--batch-size", type=int, default=kb_service.ingest_batch_size, help="每个新段的最大文本块数")
+    parser.add_argument("--workers", type=int, default=kb_service.ingest_workers, help="分词工作进程数")
+    parser.add_argument("--merge", action="store_true", help="导入完成后将所有段合并为一个")
+    args = parser.parse_args(argv)
+
+    knowledge_base = kb_service.get_knowledge_base(args.kb)
+    job = IngestionJob(knowledge_base, batch_size=args.batch_size, workers=args.workers)
+    job.run(iter_documents(args.directory, kb_service.ingest_extensions, args.chunk_size, args.overlap))
+    if args.merge and job.status == "completed":
+        knowledge_base.merge()
+
+    print(json.dumps(job.to_dict(), ensure_ascii=False, indent=2))
+    print(json.dumps(knowledge_base.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
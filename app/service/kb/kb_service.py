@@ -0,0 +1,151 @@
+"""
+知识库服务
+管理本地知识库的打开和检索，提供知识库检索处理器使用的异步检索接口
+"""
+import os
+import re
+import threading
+import dotenv
+from typing import Any, Dict, List, Optional
+from .knowledge_base import KnowledgeBase
+
+
+# 知识库ID只允许字母、数字、下划线和连字符（用作目录名）
+_KB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+
+class KnowledgeBaseService:
+    """本地知识库服务"""
+
+    def __init__(self):
+        """初始化知识库服务（知识库在首次使用时打开）"""
+        self._load_kb_config()
+        self._knowledge_bases: Dict[str, KnowledgeBase] = {}
+        self._lock = threading.Lock()
+
+    def _load_kb_config(self):
+        """加载知识库配置"""
+        app_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        kb_config_path = os.path.join(app_dir, "config", "config_knowledge.env")
+
+        # 设置配置属性默认值
+        self.backend = "local"
+        self.kb_ids = ["default"]
+        self.index_dir = os.path.join(os.path.dirname(app_dir), "data", "knowledge_base")
+        self.bm25_k1 = 1.2
+        self.bm25_b = 0.75
+        self.merge_factor = 8
+        self.chunk_size = 500
+        self.chunk_overlap = 100
+        self.ingest_batch_size = 1000
+        self.ingest_workers = 2
+        self.ingest_extensions = [".txt", ".md", ".jsonl"]
+        self.ingest_root = os.path.join(os.path.dirname(app_dir), "data", "documents")
+
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(kb_config_path):
+            kb_config = dotenv.dotenv_values(kb_config_path)
+
+            self.backend = kb_config.get("KB_BACKEND", self.backend).lower()
+            self.kb_ids = [kb_id.strip() for kb_id in kb_config.get("KB_IDS", "default").split(",") if kb_id.strip()]
+            index_dir = kb_config.get("KB_INDEX_DIR")
+            if index_dir:
+                # 相对路径以项目根目录为基准
+                self.index_dir = index_dir if os.path.isabs(index_dir) else os.path.join(os.path.dirname(app_dir), index_dir)
+            self.bm25_k1 = float(kb_config.get("KB_BM25_K1", self.bm25_k1))
+            self.bm25_b = float(kb_config.get("KB_BM25_B", self.bm25_b))
+            self.merge_factor = int(kb_config.get("KB_MERGE_FACTOR", self.merge_factor))
+            self.chunk_size = int(kb_config.get("KB_CHUNK_SIZE", self.chunk_size))
+            self.chunk_overlap = int(kb_config.get("KB_CHUNK_OVERLAP", self.chunk_overlap))
+            self.ingest_batch_size = int(kb_config.get("KB_INGEST_BATCH_SIZE", self.ingest_batch_size))
+            self.ingest_workers = int(kb_config.get("KB_INGEST_WORKERS", self.ingest_workers))
+
+            ingest_root = kb_config.get("KB_INGEST_ROOT")
+            if ingest_root is not None:
+                # 相对路径以项目根目录为基准，空值表示不允许通过接口导入目录
+                self.ingest_root = (ingest_root if not ingest_root or os.path.isabs(ingest_root)
+                                    else os.path.join(os.path.dirname(app_dir), ingest_root))
+
+            extensions = kb_config.get("KB_INGEST_EXTENSIONS")
+            if extensions:
+                self.ingest_extensions = [ext.strip().lower() for ext in extensions.split(",") if ext.strip()]
+
+        # 分词工作进程数为0时按CPU核数设置
+        if self.ingest_workers <= 0:
+            self.ingest_workers = os.cpu_count() or 1
+
+    @property
+    def enabled(self) -> bool:
+        """是否使用本地知识库作为检索后端"""
+        return self.backend == "local"
+
+    def get_knowledge_base(self, kb_id: str) -> KnowledgeBase:
+        """
+        获取（必要时打开）知识库
+
+        Args:
+            kb_id: 知识库ID
+
+        Returns:
+            知识库实例
+        """
+        knowledge_base = self._knowledge_bases.get(kb_id)
+        if knowledge_base is not None:
+            return knowledge_base
+
+        if not _KB_ID_PATTERN.match(kb_id):
+            raise ValueError(f"无效的知识库ID: {kb_id}")
+
+        with self._lock:
+            knowledge_base = self._knowledge_bases.get(kb_id)
+            if knowledge_base is None:
+                knowledge_base = KnowledgeBase(kb_id, os.path.join(self.index_dir, kb_id),
+                                               k1=self.bm25_k1, b=self.bm25_b, merge_factor=self.merge_factor)
+                self._knowledge_bases[kb_id] = knowledge_base
+        return knowledge_base
+
+    def search_sync(self, query: str, kb_ids: List[str], max_results: int = 5,
+                    threshold: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        在多个知识库中同步检索并合并结果
+
+        Args:
+            query: 检索文本
+            kb_ids: 知识库ID列表
+            max_results: 返回的最大结果数
+            threshold: 归一化相关度阈值
+
+        Returns:
+            按相关度降序排列的结果列表
+        """
+        results = []
+        for kb_id in kb_ids:
+            results.extend(self.get_knowledge_base(kb_id).search_sync(query, max_results, threshold))
+        results.sort(key=lambda result: result["score"], reverse=True)
+        return results[:max_results]
+
+    async def search(self, query: str, kb_ids: List[str], max_results: int = 5,
+                     threshold: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        异步检索（在共享线程池中执行，不阻塞事件循环）
+
+        Args:
+            query: 检索文本
+            kb_ids: 知识库ID列表
+            max_results: 返回的最大结果数
+            threshold: 归一化相关度阈值
+
+        Returns:
+            按相关度降序排列的结果列表
+        """
+        # llm 包会导入各处理器，处理器又导入本包，在此处导入以免循环导入
+        from ..llm.executor_pools import THREAD_POOL, executor_pools
+        return await executor_pools.run(THREAD_POOL, self.search_sync, query, kb_ids, max_results, threshold)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """获取已打开知识库的统计信息"""
+        return [knowledge_base.stats() for knowledge_base in list(self._knowledge_bases.values())]
+
+
+# 单例实例
+kb_service = KnowledgeBaseService()
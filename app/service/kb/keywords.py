@@ -0,0 +1,151 @@
+"""
+知识库关键词提取
+在本地从问题中提取检索关键词：候选词来自分词（去除停用词），
+按 TF-IDF 或 TextRank 打分，逆文档频率取自知识库索引的语料统计
+"""
+import os
+import math
+import dotenv
+from typing import Dict, List, Optional, Sequence
+from ..nlp.word_segmenter import word_segmenter
+from .kb_service import kb_service
+
+
+class KeywordExtractor:
+    """基于知识库语料统计的 TF-IDF / TextRank 关键词提取器"""
+
+    # TextRank 参数
+    WINDOW_SIZE = 3
+    DAMPING = 0.85
+    MAX_ITERATIONS = 30
+    TOLERANCE = 1e-4
+
+    def __init__(self):
+        """初始化关键词提取器"""
+        self._load_keyword_config()
+
+    def _load_keyword_config(self):
+        """加载关键词提取配置"""
+        kb_config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                                      "config", "config_knowledge.env")
+
+        # 设置配置属性默认值
+        self.method = "tfidf"
+        self.top_k = 5
+
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(kb_config_path):
+            kb_config = dotenv.dotenv_values(kb_config_path)
+
+            self.method = kb_config.get("KB_KEYWORD_METHOD", self.method).lower()
+            self.top_k = int(kb_config.get("KB_KEYWORD_TOP_K", self.top_k))
+
+    def idf(self, terms: Sequence[str], kb_ids: Sequence[str]) -> Dict[str, float]:
+        """
+        按知识库语料计算逆文档频率（平滑）
+
+        语料中未出现的词无法命中任何文档，按最常见词的权重（1.0）处理，只在关键词不足时入选。
+
+        Args:
+            terms: 候选词
+            kb_ids: 提供语料统计的知识库ID
+
+        Returns:
+            候选词 -> 逆文档频率
+        """
+        doc_count = 0
+        dfs = {term: 0 for term in terms}
+        for kb_id in kb_ids:
+            kb_docs, kb_dfs = kb_service.get_knowledge_base(kb_id).term_stats(term.lower() for term in terms)
+            doc_count += kb_docs
+            for term in terms:
+                dfs[term] += kb_dfs.get(term.lower(), 0)
+        return {term: math.log((doc_count + 1) / (df + 1)) + 1 if df else 1.0 for term, df in dfs.items()}
+
+    def extract(self, text: str, kb_ids: Sequence[str], top_k: Optional[int] = None,
+                method: Optional[str] = None) -> List[str]:
+        """
+        提取关键词
+
+        Args:
+            text: 问题文本
+            kb_ids: 提供语料统计的知识库ID
+            top_k: 最多返回的关键词数，默认使用配置
+            method: tfidf 或 textrank，默认使用配置
+
+        Returns:
+            按重要性降序排列的关键词
+        """
+        top_k = top_k or self.top_k
+        method = method or self.method
+
+        words = word_segmenter.cut(text)
+        candidates = word_segmenter.extract_terms(text)
+        if len(candidates) <= 1:
+            return candidates
+
+        idf = self.idf(candidates, kb_ids)
+        if method == "textrank":
+            # 共现图上的中心度再乘以逆文档频率，避免语料中的常见词或未出现的词排在前面
+            ranks = self._textrank(words, candidates, idf)
+            scores = {term: ranks[term] * idf[term] for term in candidates}
+        else:
+            tf: Dict[str, int] = {}
+            for word in words:
+                if word in idf:
+                    tf[word] = tf.get(word, 0) + 1
+            scores = {term: tf.get(term, 1) * idf[term] for term in candidates}
+
+        # 得分相同时保持在问题中出现的顺序
+        ranked = sorted(candidates, key=lambda term: -scores[term])
+        return ranked[:top_k]
+
+    def _textrank(self, words: List[str], candidates: List[str], idf: Dict[str, float]) -> Dict[str, float]:
+        """
+        在候选词的共现图上计算 TextRank，跳转概率按逆文档频率加权
+
+        Args:
+            words: 分词结果（保持原文顺序）
+            candidates: 候选词
+            idf: 候选词的逆文档频率
+
+        Returns:
+            候选词 -> 得分
+        """
+        candidate_set = set(candidates)
+        sequence = [word for word in words if word in candidate_set]
+
+        # 窗口内共现的候选词之间连边，边权为共现次数
+        edges: Dict[str, Dict[str, float]] = {term: {} for term in candidates}
+        for i, word in enumerate(sequence):
+            for other in sequence[i + 1:i + self.WINDOW_SIZE]:
+                if other != word:
+                    edges[word][other] = edges[word].get(other, 0.0) + 1.0
+                    edges[other][word] = edges[other].get(word, 0.0) + 1.0
+
+        # 个性化向量按逆文档频率分配，使语料中罕见的词得分更高
+        idf_total = sum(idf.values())
+        teleport = {term: idf[term] / idf_total for term in candidates}
+        scores = dict(teleport)
+        out_weights = {term: sum(neighbors.values()) for term, neighbors in edges.items()}
+
+        for _ in range(self.MAX_ITERATIONS):
+            updated = {}
+            for term in candidates:
+                rank = sum(scores[other] * weight / out_weights[other]
+                           for other, weight in edges[term].items())
+                updated[term] = (1 - self.DAMPING) * teleport[term] + self.DAMPING * rank
+            # 孤立词没有出边，把它们的得分按个性化向量重新分配，保持总和为1
+            dangling = sum(scores[term] for term in candidates if not out_weights[term])
+            for term in candidates:
+                updated[term] += self.DAMPING * dangling * teleport[term]
+
+            delta = sum(abs(updated[term] - scores[term]) for term in candidates)
+            scores = updated
+            if delta < self.TOLERANCE:
+                break
+        return scores
+
+
+# 单例实例
+keyword_extractor = KeywordExtractor()
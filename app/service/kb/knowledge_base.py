@@ -0,0 +1,502 @@
+"""
+本地知识库
+一个知识库由若干只读索引段组成，段列表记录在 manifest.json 中；
+检索时在所有段上汇总文档频率和平均文档长度，按BM25打分并用堆取前K个结果。
+每批新文档写成一个新段，段数达到合并阈值后在后台线程中合并，检索始终读取段列表快照，不受写入和合并影响
+
+同一个索引目录可能同时被服务进程和导入命令行写入：修改 manifest 前先获取目录锁（.lock 文件）并重新读取 manifest，
+新段名在 manifest 中登记为写入中（记录进程号）；检索前发现 manifest 被其他进程替换时重新加载段列表。
+"""
+import os
+import re
+import json
+import math
+import heapq
+import shutil
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from .segment import Segment, write_segment, merge_segments
+from .tokenizer import tokenize
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+_MANIFEST_FILE = "manifest.json"
+_LOCK_FILE = ".lock"
+_SEGMENT_PREFIX = "seg_"
+_TMP_SUFFIX = ".tmp"
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def content_hash(text: str) -> str:
+    """
+    计算文档内容哈希（忽略空白差异），用于去重
+
+    Args:
+        text: 文档内容
+
+    Returns:
+        十六进制哈希
+    """
+    return hashlib.sha1(_WHITESPACE_PATTERN.sub(" ", text).strip().encode("utf-8")).hexdigest()
+
+
+def _process_alive(pid: int) -> bool:
+    """进程是否仍在运行（无法判断时按仍在运行处理）"""
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _DirectoryLock:
+    """索引目录的进程间互斥锁（阻塞等待，不可重入）"""
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, _LOCK_FILE)
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class KnowledgeBase:
+    """基于倒排索引和BM25打分的本地知识库"""
+
+    def __init__(self, kb_id: str, directory: str, k1: float = 1.2, b: float = 0.75, merge_factor: int = 8):
+        """
+        打开（或创建）知识库
+
+        Args:
+            kb_id: 知识库ID
+            directory: 知识库索引目录
+            k1: BM25词频饱和参数
+            b: BM25文档长度归一化参数
+            merge_factor: 段数达到此值时在后台合并最小的若干段，0表示不自动合并
+        """
+        self.kb_id = kb_id
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.merge_factor = merge_factor
+
+        # 进程内写入者之间用写锁互斥，进程之间用目录锁互斥；检索只读取当前段列表快照，不加锁
+        self._write_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._merge_run_lock = threading.Lock()
+        self._merge_thread: Optional[threading.Thread] = None
+        self._segments: Tuple[Segment, ...] = ()
+        self._hashes: Optional[Set[str]] = None
+        self._next_segment = 0
+        # 写入中的段：段名 -> 写入进程号（记录在 manifest 中）
+        self._pending: Dict[str, int] = {}
+        # 已加载的 manifest 的 (inode, 修改时间)，用于发现其他进程的更新
+        self._manifest_signature: Optional[Tuple[int, int]] = None
+        self._load()
+
+    def _load(self):
+        """读取 manifest、打开其中列出的索引段，并清理遗留的段目录"""
+        if not os.path.isdir(self.directory):
+            return
+        with self._write_lock, _DirectoryLock(self.directory):
+            self._reload()
+            self._remove_orphans()
+
+    def _read_signature(self) -> Optional[Tuple[int, int]]:
+        """manifest 的 (inode, 修改时间)，manifest 每次都整体替换，任一项变化即表示已更新"""
+        try:
+            stat = os.stat(os.path.join(self.directory, _MANIFEST_FILE))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _reload(self):
+        """manifest 有更新时重新读取（已打开的段直接复用；调用方需持有写锁）"""
+        signature = self._read_signature()
+        if signature is None or signature == self._manifest_signature:
+            return
+
+        with open(os.path.join(self.directory, _MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        opened = {segment.name: segment for segment in self._segments}
+        segments = []
+        complete = True
+        for name in manifest.get("segments", []):
+            segment = opened.get(name)
+            if segment is None:
+                try:
+                    segment = Segment(os.path.join(self.directory, name))
+                except Exception as e:
+                    # 可能刚被其他进程合并删除，下次检查时重新读取 manifest
+                    print(f"知识库 {self.kb_id} 索引段 {name} 加载失败: {str(e)}")
+                    complete = False
+                    continue
+                if self._hashes is not None:
+                    self._hashes.update(segment.hashes())
+            segments.append(segment)
+
+        self._segments = tuple(segments)
+        self._next_segment = max(self._next_segment, manifest.get("next_segment", len(segments)))
+        self._pending = {name: int(pid) for name, pid in manifest.get("pending", {}).items()}
+        self._manifest_signature = signature if complete else None
+
+    def refresh(self):
+        """其他进程（如导入命令行）更新了 manifest 时重新加载段列表；本进程正在写入时跳过，由写入者加载"""
+        if not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            self._reload()
+        except Exception as e:
+            print(f"知识库 {self.kb_id} 重新加载 manifest 失败: {str(e)}")
+        finally:
+            self._write_lock.release()
+
+    def _remove_orphans(self):
+        """
+        清理未被 manifest 引用的段目录（写入或合并中途退出时遗留；调用方需持有写锁和目录锁）
+
+        登记为写入中且写入进程仍在运行的段属于其他进程，不清理。
+        本进程刚打开知识库、尚未分配任何段，记录为本进程号的段只可能来自进程号相同的已退出进程。
+        """
+        live = {name for name, pid in self._pending.items() if pid != os.getpid() and _process_alive(pid)}
+        referenced = {segment.name for segment in self._segments}
+        for name in os.listdir(self.directory):
+            if not name.startswith(_SEGMENT_PREFIX):
+                continue
+            base = name[:-len(_TMP_SUFFIX)] if name.endswith(_TMP_SUFFIX) else name
+            if base not in referenced and base not in live:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+        if len(live) != len(self._pending):
+            self._pending = {name: pid for name, pid in self._pending.items() if name in live}
+            self._write_manifest(self._segments)
+
+    def _write_manifest(self, segments: Iterable[Segment]):
+        """原子替换 manifest（调用方需持有写锁和目录锁）"""
+        manifest = {
+            "kb_id": self.kb_id,
+            "segments": [segment.name for segment in segments],
+            "next_segment": self._next_segment,
+            "pending": self._pending
+        }
+        manifest_path = os.path.join(self.directory, _MANIFEST_FILE)
+        tmp_path = manifest_path + _TMP_SUFFIX
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+        self._manifest_signature = self._read_signature()
+
+    def _directory_lock(self) -> _DirectoryLock:
+        """获取目录锁（必要时创建目录；调用方需持有写锁）"""
+        os.makedirs(self.directory, exist_ok=True)
+        return _DirectoryLock(self.directory)
+
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        """当前索引段快照"""
+        self.refresh()
+        return self._segments
+
+    @property
+    def doc_count(self) -> int:
+        """文档总数"""
+        self.refresh()
+        return sum(segment.doc_count for segment in self._segments)
+
+    def term_stats(self, terms: Iterable[str]) -> Tuple[int, Dict[str, int]]:
+        """
+        获取检索词的语料统计（用于关键词提取等）
+
+        Args:
+            terms: 检索词
+
+        Returns:
+            (文档总数, 检索词 -> 文档频率)
+        """
+        self.refresh()
+        segments = self._segments
+        return (sum(segment.doc_count for segment in segments),
+                {term: sum(segment.df(term) for segment in segments) for term in terms})
+
+    def _known_hashes(self) -> Set[str]:
+        """已入库文档的内容哈希（调用方需持有写锁，首次使用时从各段读取）"""
+        if self._hashes is None:
+            self._hashes = set()
+            for segment in self._segments:
+                self._hashes.update(segment.hashes())
+        return self._hashes
+
+    def prepare_document(self, document: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        规范化待入库文档：补全来源和内容哈希
+
+        Args:
+            document: 文档，包含 title、content，可选 source、hash 及其他字段
+
+        Returns:
+            规范化后的文档，标题和内容都为空时返回None
+        """
+        title = document.get("title", "")
+        content = document.get("content", "")
+        if not (title or content):
+            return None
+        record = dict(document)
+        record.setdefault("source", self.kb_id)
+        record.setdefault("hash", content_hash(content or title))
+        return record
+
+    def add_documents(self, documents: Iterable[Dict[str, Any]]) -> int:
+        """
+        将一批文档写入为一个新的索引段（内容重复的文档被跳过）
+
+        Args:
+            documents: 文档列表，每个文档包含 title、content，可选 source 及其他字段
+
+        Returns:
+            写入的文档数
+        """
+        records = [record for record in map(self.prepare_document, documents) if record]
+        tokens = [tokenize(f"{record['title']}\n{record['content']}") for record in records]
+        return self.add_tokenized(records, tokens)
+
+    def add_tokenized(self, records: Sequence[Dict[str, Any]], tokens: Sequence[Sequence[str]]) -> int:
+        """
+        写入已规范化并分好词的一批文档
+
+        Args:
+            records: prepare_document 返回的文档
+            tokens: 每个文档的检索词列表
+
+        Returns:
+            写入的文档数（去除与已入库文档或本批其他文档内容重复的）
+        """
+        # 持有目录锁直到新段发布，其他进程的写入者随后才能基于新段去重
+        with self._write_lock, self._directory_lock():
+            self._reload()
+            known = self._known_hashes()
+            prepared = []
+            for record, doc_tokens in zip(records, tokens):
+                if record["hash"] in known:
+                    continue
+                known.add(record["hash"])
+                prepared.append((record, doc_tokens))
+
+            if not prepared:
+                return 0
+
+            path = self._allocate_segment_path()
+            try:
+                write_segment(path, prepared)
+                segment = Segment(path)
+            except Exception:
+                self._release_segment_path(path)
+                raise
+            self._publish(self._segments + (segment,), segment.name)
+
+        self._maybe_merge()
+        return len(prepared)
+
+    def _allocate_segment_path(self) -> str:
+        """分配新段的目录路径，在 manifest 中登记为本进程写入中（调用方需持有写锁和目录锁）"""
+        name = f"{_SEGMENT_PREFIX}{self._next_segment:06d}"
+        self._next_segment += 1
+        self._pending[name] = os.getpid()
+        self._write_manifest(self._segments)
+        return os.path.join(self.directory, name)
+
+    def _release_segment_path(self, path: str):
+        """放弃分配的段：删除目录并取消登记（调用方需持有写锁和目录锁）"""
+        shutil.rmtree(path, ignore_errors=True)
+        shutil.rmtree(path + _TMP_SUFFIX, ignore_errors=True)
+        self._pending.pop(os.path.basename(path), None)
+        self._write_manifest(self._segments)
+
+    def _publish(self, segments: Tuple[Segment, ...], written: Optional[str] = None):
+        """持久化并切换段列表快照（调用方需持有写锁和目录锁）"""
+        if written is not None:
+            self._pending.pop(written, None)
+        self._write_manifest(segments)
+        self._segments = segments
+
+    def _maybe_merge(self):
+        """段数达到阈值且没有正在进行的合并时，启动后台合并线程"""
+        if not self.merge_factor or len(self._segments) < self.merge_factor:
+            return
+        with self._merge_lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            self._merge_thread = threading.Thread(
+                target=self._background_merge, name=f"kb-merge-{self.kb_id}", daemon=True
+            )
+            self._merge_thread.start()
+
+    def _background_merge(self):
+        """后台合并：持续合并最小的若干段，直到段数低于阈值"""
+        try:
+            while len(self._segments) >= self.merge_factor:
+                smallest = sorted(self._segments, key=lambda segment: segment.doc_count)[:self.merge_factor]
+                self.merge(smallest)
+        except Exception as e:
+            print(f"知识库 {self.kb_id} 合并索引段失败: {str(e)}")
+
+    def merge(self, segments: Optional[Sequence[Segment]] = None) -> int:
+        """
+        合并索引段（检索不受影响，合并期间新写入的段会保留）
+
+        Args:
+            segments: 要合并的段，默认合并全部段
+
+        Returns:
+            合并后的段数
+        """
+        # 同一时间只进行一个合并，避免同一个段被重复合并
+        with self._merge_run_lock:
+            # 合并过程不持有写锁和目录锁，期间可以继续写入新段
+            with self._write_lock, self._directory_lock():
+                self._reload()
+                current = self._segments
+                segments = [segment for segment in (current if segments is None else segments) if segment in current]
+                if len(segments) < 2:
+                    return len(current)
+                path = self._allocate_segment_path()
+
+            try:
+                merge_segments(path, segments)
+                merged = Segment(path)
+            except Exception:
+                with self._write_lock, self._directory_lock():
+                    self._release_segment_path(path)
+                raise
+
+            with self._write_lock, self._directory_lock():
+                self._reload()
+                if any(segment not in self._segments for segment in segments):
+                    # 其他进程已合并了其中的段，放弃本次合并结果
+                    self._release_segment_path(path)
+                    print(f"知识库 {self.kb_id} 的索引段已被其他进程合并，放弃本次合并")
+                    return len(self._segments)
+
+                # 合并后的段放在第一个被合并段的位置，其余段保持原有顺序
+                remaining = []
+                for segment in self._segments:
+                    if segment not in segments:
+                        remaining.append(segment)
+                    elif merged not in remaining:
+                        remaining.append(merged)
+                self._publish(tuple(remaining), merged.name)
+
+        # 正在检索的请求仍持有旧段的映射，删除目录不影响已打开的映射
+        for segment in segments:
+            shutil.rmtree(segment.path, ignore_errors=True)
+
+        print(f"知识库 {self.kb_id} 已合并 {len(segments)} 个索引段 -> {merged.name}（{merged.doc_count} 个文档）")
+        return len(self._segments)
+
+    def search_sync(self, query: str, max_results: int = 5, threshold: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        同步检索
+
+        Args:
+            query: 检索文本
+            max_results: 返回的最大结果数
+            threshold: 归一化相关度阈值（0~1），低于此值的结果被过滤
+
+        Returns:
+            按相关度降序排列的结果列表
+        """
+        self.refresh()
+        segments = self._segments
+        query_terms = tokenize(query)
+        if not segments or not query_terms or max_results <= 0:
+            return []
+
+        doc_count = sum(segment.doc_count for segment in segments)
+        avg_length = sum(segment.total_length for segment in segments) / doc_count
+
+        query_tf: Dict[str, int] = {}
+        for term in query_terms:
+            query_tf[term] = query_tf.get(term, 0) + 1
+
+        # BM25得分的上界：每个检索词的词频项 tf*(k1+1)/(tf+norm) 在 tf 趋于无穷时趋近 k1+1，
+        # 因此 Σ idf*qtf*(k1+1) 是任何文档都达不到的上界，用于把得分归一化到0~1
+        idfs: Dict[str, float] = {}
+        max_score = 0.0
+        for term, qtf in query_tf.items():
+            df = sum(segment.df(term) for segment in segments)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            max_score += idf * qtf * (self.k1 + 1)
+            if df:
+                idfs[term] = idf
+
+        k1, b = self.k1, self.b
+        scores: Dict[Tuple[int, int], float] = {}
+        for seg_index, segment in enumerate(segments):
+            doclens = segment.doclens
+            for term, idf in idfs.items():
+                doc_ids, tfs = segment.postings(term)
+                weight = idf * query_tf[term]
+                for doc_id, tf in zip(doc_ids, tfs):
+                    norm = k1 * (1 - b + b * doclens[doc_id] / avg_length)
+                    key = (seg_index, doc_id)
+                    scores[key] = scores.get(key, 0.0) + weight * tf * (k1 + 1) / (tf + norm)
+
+        if not scores:
+            return []
+
+        top = heapq.nlargest(max_results, scores.items(), key=lambda item: item[1])
+
+        results = []
+        for (seg_index, doc_id), score in top:
+            relevance = min(1.0, score / max_score) if max_score else 0.0
+            if relevance < threshold:
+                break
+            document = segments[seg_index].document(doc_id)
+            results.append({
+                "id": document.get("hash", "")[:16],
+                "title": document.get("title", ""),
+                "content": document.get("content", ""),
+                "score": round(relevance, 4),
+                "source": document.get("source", self.kb_id),
+                "kb_id": self.kb_id
+            })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """获取知识库统计信息"""
+        self.refresh()
+        segments = self._segments
+        return {
+            "kb_id": self.kb_id,
+            "segments": len(segments),
+            "merging": self._merge_thread is not None and self._merge_thread.is_alive(),
+            "documents": sum(segment.doc_count for segment in segments),
+            "terms": sum(segment.meta.get("term_count", 0) for segment in segments)
+        }
@@ -0,0 +1,286 @@
+"""
+知识库索引段
+每个段是一个只读目录，写入后不再修改，查询时通过mmap按需读取：
+
+- meta.json      段信息（文档数、总词数、字节序等）
+- terms.json     词典：检索词 -> [倒排表偏移, 文档频率]
+- postings.bin   倒排表（uint32）：每个检索词依次存放文档编号和对应词频
+- doclens.bin    每个文档的词数（uint32）
+- docs.bin       文档内容（UTF-8 JSON 依次拼接）
+- docs.idx       文档在 docs.bin 中的起止偏移（uint64，文档数+1个）
+- hashes.txt     文档内容哈希（每行一个，用于去重）
+
+多个小段可以合并为一个新段（merge_segments），合并直接拼接倒排表和文档数据，不需要重新分词。
+"""
+import os
+import sys
+import json
+import mmap
+import shutil
+import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+SEGMENT_FORMAT_VERSION = 1
+
+_META_FILE = "meta.json"
+_TERMS_FILE = "terms.json"
+_POSTINGS_FILE = "postings.bin"
+_DOCLENS_FILE = "doclens.bin"
+_DOCS_FILE = "docs.bin"
+_DOCS_INDEX_FILE = "docs.idx"
+_HASHES_FILE = "hashes.txt"
+
+# 合并时复制文档数据的块大小
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def write_segment(path: str, documents: Iterable[Tuple[Dict[str, Any], Sequence[str]]]) -> Dict[str, Any]:
+    """
+    写入一个新的索引段（先写入临时目录，完成后原子重命名）
+
+    Args:
+        path: 段目录路径（不能已存在）
+        documents: (文档, 检索词列表) 序列，文档为可JSON序列化的字典
+
+    Returns:
+        段信息
+    """
+    tmp_path = _prepare_tmp_dir(path)
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doclens = array("I")
+    offsets = array("Q", [0])
+    total_length = 0
+
+    with open(os.path.join(tmp_path, _DOCS_FILE), "wb") as docs_file, \
+            open(os.path.join(tmp_path, _HASHES_FILE), "w", encoding="utf-8") as hashes_file:
+        for doc_id, (document, tokens) in enumerate(documents):
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+            doclens.append(len(tokens))
+            total_length += len(tokens)
+
+            record = json.dumps(document, ensure_ascii=False).encode("utf-8")
+            docs_file.write(record)
+            offsets.append(offsets[-1] + len(record))
+            hashes_file.write(document.get("hash", "") + "\n")
+
+    doc_count = len(doclens)
+    if doc_count == 0:
+        shutil.rmtree(tmp_path)
+        raise ValueError("索引段不能为空")
+
+    # 倒排表：按检索词排序写入，每个检索词先写文档编号再写词频
+    terms: Dict[str, List[int]] = {}
+    ints = array("I")
+    for term in sorted(postings):
+        entries = postings[term]
+        terms[term] = [len(ints), len(entries)]
+        ints.extend(doc_id for doc_id, _ in entries)
+        ints.extend(tf for _, tf in entries)
+
+    with open(os.path.join(tmp_path, _POSTINGS_FILE), "wb") as f:
+        ints.tofile(f)
+    with open(os.path.join(tmp_path, _DOCLENS_FILE), "wb") as f:
+        doclens.tofile(f)
+    with open(os.path.join(tmp_path, _DOCS_INDEX_FILE), "wb") as f:
+        offsets.tofile(f)
+    with open(os.path.join(tmp_path, _TERMS_FILE), "w", encoding="utf-8") as f:
+        json.dump(terms, f, ensure_ascii=False, separators=(",", ":"))
+
+    return _finish_segment(tmp_path, path, doc_count, total_length, len(terms))
+
+
+def merge_segments(path: str, segments: Sequence["Segment"]) -> Dict[str, Any]:
+    """
+    将多个索引段合并为一个新段（文档编号按段顺序依次偏移）
+
+    只在内存中保留合并后的词典，倒排表逐个检索词写出，文档数据按块复制。
+
+    Args:
+        path: 新段目录路径（不能已存在）
+        segments: 要合并的段
+
+    Returns:
+        新段信息
+    """
+    tmp_path = _prepare_tmp_dir(path)
+
+    bases = []
+    doc_count = 0
+    for segment in segments:
+        bases.append(doc_count)
+        doc_count += segment.doc_count
+    if doc_count == 0:
+        shutil.rmtree(tmp_path)
+        raise ValueError("索引段不能为空")
+
+    terms: Dict[str, List[int]] = {}
+    position = 0
+    with open(os.path.join(tmp_path, _POSTINGS_FILE), "wb") as f:
+        for term in sorted(set().union(*(segment.terms() for segment in segments))):
+            doc_ids = array("I")
+            tfs = array("I")
+            for base, segment in zip(bases, segments):
+                seg_doc_ids, seg_tfs = segment.postings(term)
+                doc_ids.extend(base + doc_id for doc_id in seg_doc_ids)
+                tfs.extend(seg_tfs)
+            terms[term] = [position, len(doc_ids)]
+            position += 2 * len(doc_ids)
+            doc_ids.tofile(f)
+            tfs.tofile(f)
+
+    doclens = array("I")
+    offsets = array("Q", [0])
+    total_length = 0
+    with open(os.path.join(tmp_path, _DOCS_FILE), "wb") as docs_file, \
+            open(os.path.join(tmp_path, _HASHES_FILE), "w", encoding="utf-8") as hashes_file:
+        for segment in segments:
+            doclens.extend(segment.doclens)
+            total_length += segment.total_length
+
+            base_offset = offsets[-1]
+            offsets.extend(base_offset + offset for offset in segment.doc_offsets()[1:])
+            with open(os.path.join(segment.path, _DOCS_FILE), "rb") as source:
+                shutil.copyfileobj(source, docs_file, _COPY_BUFFER_SIZE)
+            for doc_hash in segment.hashes():
+                hashes_file.write(doc_hash + "\n")
+
+    with open(os.path.join(tmp_path, _DOCLENS_FILE), "wb") as f:
+        doclens.tofile(f)
+    with open(os.path.join(tmp_path, _DOCS_INDEX_FILE), "wb") as f:
+        offsets.tofile(f)
+    with open(os.path.join(tmp_path, _TERMS_FILE), "w", encoding="utf-8") as f:
+        json.dump(terms, f, ensure_ascii=False, separators=(",", ":"))
+
+    return _finish_segment(tmp_path, path, doc_count, total_length, len(terms))
+
+
+def _prepare_tmp_dir(path: str) -> str:
+    """创建段的临时写入目录"""
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    return tmp_path
+
+
+def _finish_segment(tmp_path: str, path: str, doc_count: int, total_length: int, term_count: int) -> Dict[str, Any]:
+    """写入段信息并将临时目录原子重命名为正式段目录"""
+    meta = {
+        "version": SEGMENT_FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "doc_count": doc_count,
+        "total_length": total_length,
+        "term_count": term_count,
+        "created_at": time.time()
+    }
+    with open(os.path.join(tmp_path, _META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    os.replace(tmp_path, path)
+    return meta
+
+
+def _map_file(path: str) -> Optional[mmap.mmap]:
+    """只读映射文件，空文件返回None"""
+    if os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Segment:
+    """只读索引段"""
+
+    def __init__(self, path: str):
+        """
+        打开索引段
+
+        Args:
+            path: 段目录路径
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+
+        with open(os.path.join(path, _META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"索引段字节序不匹配: {path}")
+
+        with open(os.path.join(path, _TERMS_FILE), "r", encoding="utf-8") as f:
+            self._terms: Dict[str, List[int]] = json.load(f)
+
+        self.doc_count: int = self.meta["doc_count"]
+        self.total_length: int = self.meta["total_length"]
+
+        self._postings_map = _map_file(os.path.join(path, _POSTINGS_FILE))
+        self._doclens_map = _map_file(os.path.join(path, _DOCLENS_FILE))
+        self._docs_map = _map_file(os.path.join(path, _DOCS_FILE))
+        self._docs_index_map = _map_file(os.path.join(path, _DOCS_INDEX_FILE))
+
+        self._postings = memoryview(self._postings_map).cast("I") if self._postings_map else memoryview(b"").cast("I")
+        self.doclens = memoryview(self._doclens_map).cast("I")
+        self._docs_index = memoryview(self._docs_index_map).cast("Q")
+        self._titles: Optional[Dict[str, int]] = None
+
+    def df(self, term: str) -> int:
+        """检索词的文档频率"""
+        entry = self._terms.get(term)
+        return entry[1] if entry else 0
+
+    def postings(self, term: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """
+        获取检索词的倒排表
+
+        Returns:
+            (文档编号序列, 词频序列)，检索词不存在时为空序列
+        """
+        entry = self._terms.get(term)
+        if not entry:
+            return (), ()
+        offset, df = entry
+        return self._postings[offset:offset + df], self._postings[offset + df:offset + 2 * df]
+
+    def terms(self) -> Iterable[str]:
+        """段内的全部检索词"""
+        return self._terms.keys()
+
+    def document(self, doc_id: int) -> Dict[str, Any]:
+        """读取文档"""
+        start, end = self._docs_index[doc_id], self._docs_index[doc_id + 1]
+        return json.loads(self._docs_map[start:end].decode("utf-8"))
+
+    def doc_offsets(self) -> Sequence[int]:
+        """文档在 docs.bin 中的偏移（文档数+1个）"""
+        return self._docs_index
+
+    def hashes(self) -> List[str]:
+        """段内全部文档的内容哈希"""
+        hashes_path = os.path.join(self.path, _HASHES_FILE)
+        if not os.path.exists(hashes_path):
+            return [document.get("hash", "") for document in self.documents()]
+        with open(hashes_path, "r", encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f]
+
+    def titles(self) -> Dict[str, int]:
+        """段内文档标题及其文本块数（段只读，结果在首次调用后缓存）"""
+        if self._titles is None:
+            titles: Dict[str, int] = {}
+            for document in self.documents():
+                title = document.get("title", "")
+                if title:
+                    titles[title] = titles.get(title, 0) + 1
+            self._titles = titles
+        return self._titles
+
+    def documents(self) -> Iterable[Dict[str, Any]]:
+        """按编号顺序遍历全部文档"""
+        for doc_id in range(self.doc_count):
+            yield self.document(doc_id)
+
+    def __repr__(self):
+        return f"<Segment {self.name} docs={self.doc_count}>"
@@ -0,0 +1,159 @@
+"""
+知识库输入联想
+常见问题和知识库文档标题规范化后分别放入两个有序数组，按前缀二分查找得到候选区间，
+先取常见问题（按命中次数），不足N个时再用标题（按文本块数）补足；知识库段或常见问题变化后在下次查询时重建，
+只有命中次数变化（FAQ 按间隔持久化命中次数）时只重排常见问题
+"""
+import os
+import bisect
+import heapq
+import threading
+import dotenv
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .kb_service import kb_service
+from .faq_store import faq_store, normalize_question
+
+
+# 标题前缀区间内最多参与排序的条目数，保证很短的前缀也能在几毫秒内返回
+# （常见问题数量有限，不截断，保证命中次数最多的常见问题一定排在前面）
+_MAX_SCAN = 5000
+
+# 一个有序数组：规范化文本列表和对应的 (显示文本, 类型, 来源, 权重)
+_SortedEntries = Tuple[List[str], List[Tuple[str, str, str, int]]]
+
+
+class SuggestIndex:
+    """基于有序数组的前缀补全索引"""
+
+    def __init__(self):
+        """初始化索引（首次查询时构建）"""
+        self._load_suggest_config()
+        self._lock = threading.Lock()
+        self._faqs: _SortedEntries = ([], [])
+        self._titles: _SortedEntries = ([], [])
+        self._signature: Optional[Tuple] = None
+
+    def _load_suggest_config(self):
+        """加载输入联想配置"""
+        kb_config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                                      "config", "config_knowledge.env")
+
+        # 设置配置属性默认值
+        self.limit = 10
+
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(kb_config_path):
+            kb_config = dotenv.dotenv_values(kb_config_path)
+
+            self.limit = int(kb_config.get("KB_SUGGEST_LIMIT", self.limit))
+
+    def _current_signature(self, kb_ids: Sequence[str]) -> Tuple:
+        """索引数据来源的版本：各知识库的段列表、常见问题版本和命中次数版本（放在最后）"""
+        segments = tuple(
+            tuple(segment.name for segment in kb_service.get_knowledge_base(kb_id).segments)
+            for kb_id in kb_ids
+        )
+        return (tuple(kb_ids), segments, faq_store.version, faq_store.hits_version)
+
+    def _build(self, kb_ids: Sequence[str]):
+        """
+        重建索引
+
+        Args:
+            kb_ids: 提供标题的知识库ID
+        """
+        faqs = self._faq_entries()
+        titles: Dict[str, Tuple[str, str, str, int]] = {}
+        for kb_id in kb_ids:
+            for segment in kb_service.get_knowledge_base(kb_id).segments:
+                for title, chunk_count in segment.titles().items():
+                    # 与常见问题相同的标题只保留常见问题
+                    if normalize_question(title) not in faqs:
+                        self._put(titles, title, "kb_title", kb_id, chunk_count)
+
+        self._faqs = self._sorted_entries(faqs)
+        self._titles = self._sorted_entries(titles)
+
+    @classmethod
+    def _faq_entries(cls) -> Dict[str, Tuple[str, str, str, int]]:
+        """读取常见问题及其当前命中次数"""
+        faqs: Dict[str, Tuple[str, str, str, int]] = {}
+        for entry in faq_store.list_entries():
+            cls._put(faqs, entry["question"], "faq", entry.get("source", "FAQ"), entry.get("hits", 0))
+        return faqs
+
+    @staticmethod
+    def _put(merged: Dict[str, Tuple[str, str, str, int]], text: str, kind: str, source: str, weight: int):
+        """规范化文本 -> (显示文本, 类型, 来源, 权重)，同一规范化文本只保留权重最高的"""
+        key = normalize_question(text)
+        if key and (key not in merged or merged[key][3] < weight):
+            merged[key] = (text, kind, source, weight)
+
+    @staticmethod
+    def _sorted_entries(merged: Dict[str, Tuple[str, str, str, int]]) -> _SortedEntries:
+        keys = sorted(merged)
+        return keys, [merged[key] for key in keys]
+
+    @staticmethod
+    def _top(sorted_entries: _SortedEntries, key: str, limit: int, max_scan: Optional[int] = None) -> List[Tuple]:
+        """在有序数组中按前缀二分查找，取区间内权重最高的 limit 个条目"""
+        keys, entries = sorted_entries
+        start = bisect.bisect_left(keys, key)
+        # 前缀区间的上界：前缀后接最大码位字符
+        end = bisect.bisect_left(keys, key + "\U0010ffff")
+        if max_scan is not None:
+            end = min(end, start + max_scan)
+        top = heapq.nlargest(limit, range(start, end), key=lambda index: (entries[index][3], -index))
+        return [entries[index] for index in top]
+
+    def _ensure_fresh(self, kb_ids: Sequence[str]):
+        """数据来源变化时重建索引"""
+        signature = self._current_signature(kb_ids)
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature != self._signature:
+                if self._signature is not None and signature[:-1] == self._signature[:-1]:
+                    # 只有命中次数变化：常见问题集合不变，标题数组不用重建
+                    self._faqs = self._sorted_entries(self._faq_entries())
+                else:
+                    self._build(kb_ids)
+                self._signature = signature
+
+    def suggest(self, prefix: str, limit: Optional[int] = None, kb_ids: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        前缀补全
+
+        Args:
+            prefix: 用户已输入的文本
+            limit: 返回的最大条数，默认使用配置
+            kb_ids: 提供标题的知识库ID（须为配置的 KB_IDS 之一），默认使用全部配置的知识库
+
+        Returns:
+            [{"text", "type", "source"}]，常见问题在前（按命中次数降序），其后为标题（按文本块数降序）
+        """
+        limit = self.limit if limit is None else limit
+        if kb_ids:
+            unknown = [kb_id for kb_id in kb_ids if kb_id not in kb_service.kb_ids]
+            if unknown:
+                raise ValueError(f"未配置的知识库: {', '.join(unknown)}")
+        kb_ids = list(kb_ids or kb_service.kb_ids)
+        self._ensure_fresh(kb_ids)
+
+        key = normalize_question(prefix)
+        if not key or limit <= 0:
+            return []
+
+        faqs, titles = self._faqs, self._titles
+        top = self._top(faqs, key, limit)
+        if len(top) < limit:
+            top.extend(self._top(titles, key, limit - len(top), _MAX_SCAN))
+        return [{"text": text, "type": kind, "source": source} for text, kind, source, _ in top]
+
+    def stats(self) -> Dict[str, Any]:
+        """获取索引统计信息"""
+        return {"entries": len(self._faqs[0]) + len(self._titles[0]), "faqs": len(self._faqs[0])}
+
+
+# 单例实例
+suggest_index = SuggestIndex()
@@ -0,0 +1,149 @@
+"""
+知识库检索结果的抽取式摘要
+把检索结果切分为句子，按与问题的相关度打分，再用最大边际相关（MMR）逐句挑选，
+对与已选句子重复的内容施加惩罚，拼成简短的回答，不需要调用模型
+"""
+import os
+import re
+import math
+import dotenv
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from .tokenizer import tokenize
+
+
+# 句子切分：句末标点（保留在句尾）和换行
+_SENTENCE_PATTERN = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]*")
+_SENTENCE_ENDINGS = "。！？!?；;"
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    切分句子
+
+    Args:
+        text: 文本
+
+    Returns:
+        句子列表（去除首尾空白，不含空句）
+    """
+    return [sentence.strip() for sentence in _SENTENCE_PATTERN.findall(text) if sentence.strip()]
+
+
+class ExtractiveSummarizer:
+    """基于问题相关度和冗余惩罚的抽取式摘要"""
+
+    # 过短的句子（如标题残片）不参与摘要
+    MIN_SENTENCE_LENGTH = 6
+
+    # 与已选句子的相似度超过此值时视为重复，直接跳过（不同结果中常有改写过的同一句话）
+    MAX_REDUNDANCY = 0.6
+
+    def __init__(self):
+        """初始化摘要器"""
+        self._load_summary_config()
+
+    def _load_summary_config(self):
+        """加载摘要配置"""
+        kb_config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                                      "config", "config_knowledge.env")
+
+        # 设置配置属性默认值
+        self.max_sentences = 3
+        self.max_length = 300
+        self.diversity = 0.3
+
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(kb_config_path):
+            kb_config = dotenv.dotenv_values(kb_config_path)
+
+            self.max_sentences = int(kb_config.get("KB_SUMMARY_MAX_SENTENCES", self.max_sentences))
+            self.max_length = int(kb_config.get("KB_SUMMARY_MAX_LENGTH", self.max_length))
+            self.diversity = float(kb_config.get("KB_SUMMARY_DIVERSITY", self.diversity))
+
+    @staticmethod
+    def _similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+        """句子检索词集合的 Jaccard 相似度"""
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    def _candidates(self, query_terms: FrozenSet[str],
+                    results: List[Dict[str, Any]]) -> List[Tuple[float, int, int, str, FrozenSet[str]]]:
+        """
+        对检索结果中的句子打分
+
+        句子得分 = 命中的问题检索词占比 × 所在结果的相关度，按句子长度轻微归一化，避免长句占优。
+
+        Returns:
+            [(得分, 结果序号, 句子序号, 句子, 句子检索词集合)]
+        """
+        candidates = []
+        for rank, result in enumerate(results):
+            result_score = result.get("score", 0.0) or 0.0
+            for position, sentence in enumerate(split_sentences(result.get("content", ""))):
+                if len(sentence) < self.MIN_SENTENCE_LENGTH:
+                    continue
+                terms = frozenset(tokenize(sentence))
+                if not terms:
+                    continue
+                overlap = len(query_terms & terms) / len(query_terms) if query_terms else 0.0
+                # 没有命中检索词的句子只在所在结果排名靠前时保留少量得分（通常是结果的首句概述）
+                relevance = overlap if overlap else 0.1 / (1 + position)
+                score = relevance * (0.5 + 0.5 * result_score) / math.log2(2 + len(terms) / 20)
+                candidates.append((score, rank, position, sentence, terms))
+        return candidates
+
+    def summarize(self, query: str, results: List[Dict[str, Any]], max_sentences: Optional[int] = None,
+                  max_length: Optional[int] = None) -> str:
+        """
+        从检索结果中抽取与问题最相关且互不重复的句子组成摘要
+
+        Args:
+            query: 用户问题或检索词
+            results: 检索结果（按相关度降序）
+            max_sentences: 最多句数，默认使用配置
+            max_length: 摘要最大字数，默认使用配置
+
+        Returns:
+            摘要文本（句子按所在结果的排名和原文顺序排列），没有可用句子时返回空字符串
+        """
+        max_sentences = max_sentences or self.max_sentences
+        max_length = max_length or self.max_length
+
+        query_terms = frozenset(tokenize(query))
+        candidates = self._candidates(query_terms, results)
+        if not candidates:
+            return ""
+
+        top_score = max(candidate[0] for candidate in candidates) or 1.0
+        selected = []
+        length = 0
+        while candidates and len(selected) < max_sentences:
+            # 最大边际相关：相关度减去与已选句子的最大相似度
+            best_index, best_value, best_redundancy = -1, float("-inf"), 0.0
+            for index, (score, _, _, _, terms) in enumerate(candidates):
+                redundancy = max((self._similarity(terms, chosen[4]) for chosen in selected), default=0.0)
+                value = (1 - self.diversity) * score / top_score - self.diversity * redundancy
+                if value > best_value:
+                    best_index, best_value, best_redundancy = index, value, redundancy
+
+            candidate = candidates.pop(best_index)
+            if best_redundancy > self.MAX_REDUNDANCY:
+                continue
+            if selected and length + len(candidate[3]) > max_length:
+                continue
+            selected.append(candidate)
+            length += len(candidate[3])
+
+        selected.sort(key=lambda candidate: (candidate[1], candidate[2]))
+        summary = "".join(
+            sentence if sentence[-1] in _SENTENCE_ENDINGS else sentence + "。"
+            for sentence in (candidate[3] for candidate in selected)
+        )
+        if len(summary) > max_length:
+            summary = summary[:max_length] + "..."
+        return summary
+
+
+# 单例实例
+extractive_summarizer = ExtractiveSummarizer()
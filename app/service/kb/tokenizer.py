@@ -0,0 +1,56 @@
+"""
+知识库分词
+将文本切分为检索词：分词得到的词语 + 连续汉字片段内的二元字组
+"""
+import re
+from typing import Iterable, List, Optional
+from ..nlp.word_segmenter import word_segmenter, DEFAULT_STOP_WORDS
+
+
+# 二元字组的前缀，避免与两个字的词语混为同一个检索词
+BIGRAM_PREFIX = "#"
+
+_HAN_PATTERN = re.compile(r"^[\u4e00-\u9fff\u3400-\u4dbf]+$")
+
+
+def tokenize(text: str, stop_words: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    切分检索词
+
+    词语（去除停用词和标点，字母数字转小写）直接作为检索词；去除停用词后仍相邻的汉字词语
+    连成片段（空白和标点处断开），片段内的每两个相邻汉字再作为一个二元字组检索词，弥补词典未收录词语的召回。
+
+    Args:
+        text: 文本
+        stop_words: 停用词，默认使用内置停用词表
+
+    Returns:
+        检索词列表（保留重复，用于统计词频）
+    """
+    stop_words = DEFAULT_STOP_WORDS if stop_words is None else stop_words
+    tokens = []
+    run = []
+
+    def flush():
+        chars = "".join(run)
+        tokens.extend(BIGRAM_PREFIX + chars[i:i + 2] for i in range(len(chars) - 1))
+        run.clear()
+
+    # 分词会丢弃空白，先按空白切开，避免跨越空白组成二元字组
+    for chunk in text.split():
+        for word in word_segmenter.cut(chunk):
+            if _HAN_PATTERN.match(word):
+                if word in stop_words:
+                    flush()
+                    continue
+                tokens.append(word)
+                run.append(word)
+                continue
+
+            flush()
+            lowered = word.lower()
+            if lowered[0].isalnum() and lowered not in stop_words:
+                tokens.append(lowered)
+        flush()
+
+    return tokens
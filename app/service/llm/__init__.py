@@ -4,6 +4,7 @@ LLM服务包
 """
 from .llm_service import LLMService
 from .intent_detection_service import IntentDetectionService, IntentType, Intent, intent_detector
+from .intent_rule_store import IntentRuleStore, IntentRuleSnapshot
 from .intent_handler_manager import IntentHandlerManager, intent_handler_manager
 from .intent_sync_adapter import IntentSyncAdapter, intent_sync_adapter
 from .intent_handler_base import IntentHandlerBase
@@ -24,6 +25,8 @@ __all__ = [
     'IntentType',
     'Intent',
     'intent_detector',
+    'IntentRuleStore',
+    'IntentRuleSnapshot',
     
     # 意图处理管理
     'IntentHandlerManager',
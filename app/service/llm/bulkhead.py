@@ -0,0 +1,144 @@
+"""
+处理器舱壁隔离
+限制单类处理器的并发执行数，超出部分在有界队列中等待，队列满时立即拒绝，
+避免某个慢后端堆积大量协程拖垮其他处理器
+"""
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Tuple
+
+
+class BulkheadFullError(Exception):
+    """舱壁并发数和等待队列都已满"""
+    pass
+
+
+class Bulkhead:
+    """
+    带有界等待队列的并发限制器
+
+    与 asyncio.Semaphore 不同，状态由线程锁保护，等待者在各自所属的事件循环上被唤醒，
+    因此同一个舱壁可以被运行在不同事件循环上的请求共享。
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int = 0):
+        """
+        初始化舱壁
+
+        Args:
+            name: 名称（通常为意图类型）
+            max_concurrent: 最大并发执行数
+            max_queue: 最多排队等待的请求数，0表示不排队、满即拒绝
+        """
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+        # 统计信息
+        self.accepted = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.waited = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @property
+    def active(self) -> int:
+        """正在执行的数量"""
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        """当前排队数量"""
+        return len(self._waiters)
+
+    async def acquire(self):
+        """
+        获取执行槽位，无空闲槽位时排队等待
+
+        Raises:
+            BulkheadFullError: 并发和等待队列都已满
+        """
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                self.accepted += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise BulkheadFullError(f"{self.name} 并发已满（{self.max_concurrent}），等待队列已满（{self.max_queue}）")
+
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+
+        started = time.monotonic()
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    waiter = None
+            # 已被唤醒（槽位已移交）但随即被取消时归还槽位；
+            # 移交尚未送达时由 _grant 发现 future 已取消并继续移交
+            if waiter is not None and waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.accepted += 1
+            self.waited += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def release(self):
+        """释放执行槽位，有排队者时直接移交给最早的排队者"""
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                if future.cancelled() or loop.is_closed():
+                    continue
+                loop.call_soon_threadsafe(self._grant, future)
+                return
+            self._active -= 1
+
+    def _grant(self, future: asyncio.Future):
+        """在排队者所属的事件循环中唤醒它"""
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(True)
+
+    @asynccontextmanager
+    async def slot(self):
+        """以上下文管理器方式占用一个执行槽位"""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取舱壁统计信息"""
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queue_depth": len(self._waiters),
+                "max_queue_depth": self.max_queue_depth,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_time_total / self.waited * 1000, 2) if self.waited else 0.0,
+                "max_wait_ms": round(self.wait_time_max * 1000, 2)
+            }
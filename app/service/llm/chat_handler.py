@@ -2,7 +2,7 @@
 普通聊天意图处理器
 处理普通的对话交互
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from .intent_handler_base import IntentHandlerBase
 from .intent_detection_service import Intent, IntentType
 
@@ -10,6 +10,13 @@ from .intent_detection_service import Intent, IntentType
 class ChatHandler(IntentHandlerBase):
     """普通聊天处理器"""
     
+    # 同一消息中有检索意图时，等待检索结果并以其作为回答的参考资料
+    inputs = ("knowledge",)
+    
+    # 参考资料的最大条数和单条最大长度
+    MAX_REFERENCES = 5
+    MAX_REFERENCE_LENGTH = 300
+    
     def __init__(self):
         super().__init__()
         # 这里可以初始化需要的AI模型或服务
@@ -37,9 +44,24 @@ class ChatHandler(IntentHandlerBase):
             # 从上下文获取AI管理器（如果有）
             ai_manager = context.get("ai_manager") if context else None
             
+            references = self._collect_references(context)
+            
+            speculation = context.get("speculative_reply") if context else None
+            # 模型请求不超过请求截止时间
+            timeout = self.time_remaining(context)
+            
             if ai_manager:
-                # 使用现有的AI管理器进行对话
-                response = ai_manager.get_response_sync(message)
+                # 使用现有的AI管理器进行对话（阻塞的模型请求在线程池中执行），有检索结果时作为参考资料
+                if references:
+                    response = await self.run_in_pool(
+                        ai_manager.get_response_sync, message, grounding="\n".join(references), timeout=timeout
+                    )
+                elif speculation and speculation[0] == message.strip():
+                    # 采用与意图处理同时开始生成的回复（两边都是去除首尾空白后的消息）
+                    context.pop("speculative_reply", None)
+                    response = await self._await_speculation(ai_manager, message, speculation[1], timeout)
+                else:
+                    response = await self.run_in_pool(ai_manager.get_response_sync, message, timeout=timeout)
             else:
                 # 返回默认响应
                 response = f"收到您的消息：'{message}'。这是普通聊天的响应。"
@@ -49,7 +71,8 @@ class ChatHandler(IntentHandlerBase):
                 "response": response,
                 "data": {
                     "intent_type": "chat",
-                    "confidence": intent.confidence
+                    "confidence": intent.confidence,
+                    "references_count": len(references)
                 },
                 "need_continue": False  # 普通聊天通常不需要继续处理其他意图
             }
@@ -62,6 +85,59 @@ class ChatHandler(IntentHandlerBase):
                 "need_continue": False
             }
     
+    async def _await_speculation(self, ai_manager, message: str, future, timeout: Optional[float] = None) -> str:
+        """
+        等待预先生成的回复并记录到对话历史，生成失败时重新调用
+        
+        Args:
+            ai_manager: AI管理器
+            message: 用户消息
+            future: 预先生成回复的 future
+            timeout: 重新调用时的请求超时（秒）
+            
+        Returns:
+            回复内容
+        """
+        try:
+            response = await future
+        except Exception as e:
+            print(f"预先生成回复失败，重新生成: {str(e)}")
+            return await self.run_in_pool(ai_manager.get_response_sync, message, timeout=timeout)
+        
+        ai_manager.add_to_history(message, response)
+        return response
+    
+    def _collect_references(self, context: Optional[Dict] = None) -> List[str]:
+        """
+        从上游检索结果中整理参考资料
+        
+        Args:
+            context: 上下文（upstream 中包含检索处理器产出的 data）
+            
+        Returns:
+            参考资料文本列表
+        """
+        upstream = context.get("upstream", {}) if context else {}
+        references = []
+        
+        for data in upstream.get("knowledge", []):
+            for result in (data or {}).get("results", []):
+                # 跳过检索服务未创建时的系统提示
+                source = result.get("source") or result.get("metadata", {}).get("source")
+                content = result.get("content", "")
+                if source == "系统提示" or not content:
+                    continue
+                
+                if len(content) > self.MAX_REFERENCE_LENGTH:
+                    content = content[:self.MAX_REFERENCE_LENGTH] + "..."
+                title = result.get("title")
+                references.append(f"[{len(references) + 1}] {title}：{content}" if title else f"[{len(references) + 1}] {content}")
+                
+                if len(references) >= self.MAX_REFERENCES:
+                    return references
+        
+        return references
+    
     def preprocess(self, message: str, context: Optional[Dict] = None) -> Dict[str, Any]:
         """预处理消息"""
         # 可以在这里进行消息清理、过滤等操作
@@ -0,0 +1,187 @@
+"""
+处理器执行器池
+将处理器中CPU密集或阻塞的阶段放到共享的线程池中执行，避免阻塞事件循环，并统计各池的耗时
+"""
+import os
+import time
+import atexit
+import asyncio
+import functools
+import threading
+import dotenv
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+
+# 执行器池名称
+THREAD_POOL = "thread"
+
+
+def _timed_call(func: Callable, args: Tuple, kwargs: Dict) -> Tuple[Any, float, float]:
+    """在工作线程中执行函数并记录开始时间和耗时"""
+    started = time.monotonic()
+    result = func(*args, **kwargs)
+    return result, started, time.monotonic() - started
+
+
+class _PoolStats:
+    """单个执行器池的统计信息"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.active = 0
+        self.run_time_total = 0.0
+        self.run_time_max = 0.0
+        self.wait_time_total = 0.0
+
+    def to_dict(self, max_workers: int) -> Dict[str, Any]:
+        with self.lock:
+            finished = self.completed + self.failed + self.cancelled
+            return {
+                "max_workers": max_workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "active": self.active,
+                "run_time_total_ms": round(self.run_time_total * 1000, 2),
+                "avg_run_ms": round(self.run_time_total / self.completed * 1000, 2) if self.completed else 0.0,
+                "max_run_ms": round(self.run_time_max * 1000, 2),
+                "avg_wait_ms": round(self.wait_time_total / finished * 1000, 2) if finished else 0.0
+            }
+
+
+class ExecutorPools:
+    """共享的执行器池（在首次使用时创建）"""
+
+    def __init__(self):
+        """初始化执行器池"""
+        self._load_executor_config()
+        self._executors: Dict[str, Executor] = {}
+        self._stats: Dict[str, _PoolStats] = {THREAD_POOL: _PoolStats()}
+        self._lock = threading.Lock()
+
+    def _load_executor_config(self):
+        """加载执行器配置"""
+        intent_config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                                          "config", "config_intent.env")
+
+        # 设置配置属性默认值，0 表示按CPU核数设置
+        self.thread_workers = 0
+
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(intent_config_path):
+            intent_config = dotenv.dotenv_values(intent_config_path)
+
+            self.thread_workers = int(intent_config.get("EXECUTOR_THREAD_WORKERS", self.thread_workers))
+
+        cpu_count = os.cpu_count() or 1
+        if self.thread_workers <= 0:
+            self.thread_workers = min(32, cpu_count + 4)
+
+    def _get_executor(self, pool: str) -> Executor:
+        """获取（必要时创建）执行器"""
+        executor = self._executors.get(pool)
+        if executor is not None:
+            return executor
+
+        with self._lock:
+            executor = self._executors.get(pool)
+            if executor is None:
+                if pool == THREAD_POOL:
+                    executor = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="intent-worker")
+                else:
+                    raise ValueError(f"未知的执行器池: {pool}")
+                self._executors[pool] = executor
+        return executor
+
+    async def run(self, pool: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        在指定执行器池中执行函数并等待结果
+
+        Args:
+            pool: 执行器池名称（目前只有 thread）
+            func: 要执行的函数
+            *args: 位置参数
+            **kwargs: 关键字参数
+
+        Returns:
+            函数返回值
+        """
+        executor = self._get_executor(pool)
+        stats = self._stats[pool]
+        with stats.lock:
+            stats.submitted += 1
+            stats.active += 1
+
+        submitted_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        try:
+            result, started, elapsed = await loop.run_in_executor(
+                executor, functools.partial(_timed_call, func, args, kwargs)
+            )
+        except asyncio.CancelledError:
+            # 等待方被取消；已开始执行的函数会在工作线程中继续运行到结束，结果被丢弃
+            with stats.lock:
+                stats.active -= 1
+                stats.cancelled += 1
+            raise
+        except Exception:
+            with stats.lock:
+                stats.active -= 1
+                stats.failed += 1
+            raise
+
+        with stats.lock:
+            stats.active -= 1
+            stats.completed += 1
+            stats.run_time_total += elapsed
+            stats.run_time_max = max(stats.run_time_max, elapsed)
+            stats.wait_time_total += max(0.0, started - submitted_at)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """获取各执行器池的统计信息"""
+        return {
+            THREAD_POOL: self._stats[THREAD_POOL].to_dict(self.thread_workers)
+        }
+
+    def shutdown(self):
+        """关闭所有执行器，尚未开始的任务被取消"""
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def offload(pool: str = THREAD_POOL):
+    """
+    将同步方法标记为CPU密集/阻塞阶段，调用时在共享执行器池中执行并返回可等待对象
+
+    用法::
+
+        @offload()
+        def _rank(self, results): ...
+
+        ranked = await self._rank(results)
+
+    Args:
+        pool: 执行器池名称
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await executor_pools.run(pool, func, *args, **kwargs)
+        wrapper.offload_pool = pool
+        return wrapper
+    return decorator
+
+
+# 单例实例
+executor_pools = ExecutorPools()
+atexit.register(executor_pools.shutdown)
@@ -2,10 +2,16 @@
 意图识别服务
 用于识别用户输入中的意图类型
 """
+import os
+import re
+import copy
+import dotenv
 from typing import List, Dict, Optional
 from enum import Enum
-from dataclasses import dataclass
-import re
+from dataclasses import dataclass, replace
+from .intent_rule_store import IntentRuleStore, IntentRuleSnapshot
+from .result_cache import LRUCache
+from ..nlp.word_segmenter import word_segmenter, DEFAULT_STOP_WORDS
 
 
 class IntentType(Enum):
@@ -29,78 +35,151 @@ class Intent:
 class IntentDetectionService:
     """意图识别服务"""
     
-    def __init__(self):
-        """初始化意图识别服务"""
-        # 意图关键词映射
-        self.intent_keywords = {
-            IntentType.KB_SEARCH: [
+    # 内置默认规则（规则文件不存在或无效时使用）
+    DEFAULT_RULES = {
+        "keywords": {
+            IntentType.CHAT.value: [
+                "总结一下", "解释一下", "你觉得", "怎么看", "给点建议"
+            ],
+            IntentType.KB_SEARCH.value: [
                 "查询", "搜索", "找", "知识库", "资料", "文档",
                 "检索", "了解", "是什么", "什么是", "告诉我"
             ],
-            IntentType.VECTOR_SEARCH: [
+            IntentType.VECTOR_SEARCH.value: [
                 "向量", "相似", "相关", "类似", "embedding",
                 "语义搜索", "相似度", "匹配"
             ],
-            IntentType.MCP_CALL: [
+            IntentType.MCP_CALL.value: [
                 "MCP", "调用", "执行", "运行", "使用工具",
                 "工具", "API", "接口", "功能"
             ],
-            IntentType.VIRTUAL_HUMAN: [
+            IntentType.VIRTUAL_HUMAN.value: [
                 "虚拟人", "数字人", "和他聊", "和她聊", "对话",
                 "交流", "聊天", "互动", "虚拟助手",
                 "转圈", "旋转", "转动", "开始转圈", "转起来", "旋转起来",
                 "停止", "停下", "别转了", "停止转圈", "不要转了", "站好"
             ]
-        }
-        
-        # 意图模式正则表达式
-        self.intent_patterns = {
-            IntentType.KB_SEARCH: [
+        },
+        "patterns": {
+            IntentType.KB_SEARCH.value: [
                 r"(查询|搜索|找).*(知识|资料|文档)",
                 r"(帮我|请).*(查|找|搜索)",
                 r"(什么是|是什么|了解).+",
             ],
-            IntentType.VECTOR_SEARCH: [
+            IntentType.VECTOR_SEARCH.value: [
                 r"(向量|语义).*(搜索|检索|查找)",
                 r"(相似|类似|相关).*(内容|文档|资料)",
             ],
-            IntentType.MCP_CALL: [
+            IntentType.MCP_CALL.value: [
                 r"(调用|使用|执行).*(MCP|工具|功能)",
                 r"MCP.*(调用|执行|运行)",
             ],
-            IntentType.VIRTUAL_HUMAN: [
+            IntentType.VIRTUAL_HUMAN.value: [
                 r"(和|与|跟).*(虚拟人|数字人|他|她).*(聊|交流|对话)",
                 r"虚拟人.*(互动|交流|聊天)",
                 r"(转圈|旋转|转动|转起来|旋转起来)",
                 r"(停止|停下|别转了|停止转圈|不要转了|站好)",
             ]
         }
+    }
+    
+    # 提取搜索关键词时过滤的词
+    SEARCH_STOP_WORDS = DEFAULT_STOP_WORDS | {"找", "什么是", "是什么", "知识库", "资料", "文档"}
+    
+    def __init__(self):
+        """初始化意图识别服务"""
+        # 加载意图识别配置
+        self._load_intent_config()
+        
+        # 意图规则快照存储（关键词自动机 + 预编译正则），规则文件变更时后台重建
+        self.rule_store = IntentRuleStore(
+            self.intent_rules_path,
+            key_type=IntentType,
+            default_rules=self.DEFAULT_RULES,
+            reload_interval=self.intent_rules_reload_interval
+        )
+        self.rule_store.start_watching()
+        
+        # 多意图分句器
+        from .intent_segmenter import ClauseSegmenter
+        self.segmenter = ClauseSegmenter()
+        
+        # 识别结果缓存：键为(规范化消息, 规则快照版本, 上下文推断结果)
+        self.detect_cache = LRUCache(max_entries=self.intent_cache_size)
+        # 参数提取缓存：键为(意图类型, 规范化文本, 规则快照版本)
+        self.params_cache = LRUCache(max_entries=self.intent_cache_size)
+    
+    def _load_intent_config(self):
+        """加载意图识别配置"""
+        config_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "config")
+        intent_config_path = os.path.join(config_dir, "config_intent.env")
         
-    def detect_intents(self, user_message: str, context: Optional[List[Dict]] = None) -> List[Intent]:
+        # 设置配置属性默认值
+        self.intent_rules_path = os.path.join(config_dir, "intent_rules.json")
+        self.intent_rules_reload_interval = 2.0
+        self.intent_cache_size = 2048
+        
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(intent_config_path):
+            intent_config = dotenv.dotenv_values(intent_config_path)
+            
+            rules_file = intent_config.get("INTENT_RULES_FILE")
+            if rules_file:
+                self.intent_rules_path = os.path.join(config_dir, rules_file)
+            self.intent_rules_reload_interval = float(
+                intent_config.get("INTENT_RULES_RELOAD_INTERVAL", self.intent_rules_reload_interval)
+            )
+            self.intent_cache_size = int(intent_config.get("INTENT_CACHE_SIZE", self.intent_cache_size))
+    
+    @property
+    def intent_keywords(self) -> Dict[IntentType, List[str]]:
+        """当前生效的关键词（只读副本，修改请使用 rule_store.update_rules）"""
+        return {k: list(v) for k, v in self.rule_store.snapshot.keywords.items()}
+    
+    @property
+    def intent_patterns(self) -> Dict[IntentType, List[str]]:
+        """当前生效的正则模式（只读副本，修改请使用 rule_store.update_rules）"""
+        return {k: [p.pattern for p in v] for k, v in self.rule_store.snapshot.patterns.items()}
+        
+    def detect_intents(
+        self,
+        user_message: str,
+        context: Optional[List[Dict]] = None,
+        session_state=None
+    ) -> List[Intent]:
         """
         识别用户消息中的意图
         
         Args:
             user_message: 用户输入的消息
-            context: 对话上下文（可选）
+            context: 对话上下文（可选，未提供会话状态时用于构建临时状态）
+            session_state: 会话意图状态 IntentSessionState（可选）
             
         Returns:
             识别出的意图列表
         """
-        intents = []
+        user_message = self._normalize_message(user_message)
+        snapshot = self.rule_store.snapshot
         
-        # 1. 基于关键词的意图识别
-        keyword_intents = self._detect_by_keywords(user_message)
-        intents.extend(keyword_intents)
+        # 基于上下文的意图推断（读取会话状态，O(1)），推断结果作为缓存键的一部分
+        if session_state is None and context:
+            session_state = self.build_session_state(context)
+        context_intents = []
+        if session_state is not None:
+            context_intents = self._detect_by_context(user_message, session_state)
         
-        # 2. 基于正则模式的意图识别
-        pattern_intents = self._detect_by_patterns(user_message)
-        intents.extend(pattern_intents)
+        cache_key = (
+            user_message,
+            snapshot.version,
+            tuple((intent.type, intent.confidence) for intent in context_intents)
+        )
+        cached = self.detect_cache.get(cache_key)
+        if cached is not None:
+            return self._copy_intents(cached)
         
-        # 3. 基于上下文的意图推断
-        if context:
-            context_intents = self._detect_by_context(user_message, context)
-            intents.extend(context_intents)
+        # 1-3. 基于关键词、正则模式和上下文的意图识别
+        intents = self._detect_by_rules(user_message, snapshot)
+        intents.extend(context_intents)
         
         # 4. 去重和合并意图
         merged_intents = self._merge_intents(intents)
@@ -114,19 +193,83 @@ class IntentDetectionService:
                 raw_text=user_message
             ))
         
-        return sorted(merged_intents, key=lambda x: x.confidence, reverse=True)
+        # 6. 多意图时按子句切分，每个意图只保留与之相关的子句
+        if len(merged_intents) > 1:
+            self.segmenter.assign(
+                user_message,
+                merged_intents,
+                lambda clause: self._detect_by_rules(clause, snapshot)
+            )
+        
+        result = sorted(merged_intents, key=lambda x: x.confidence, reverse=True)
+        
+        # 处理器会修改 intent.params，缓存和返回的都是独立副本
+        self.detect_cache.put(cache_key, self._copy_intents(result))
+        return result
+    
+    @staticmethod
+    def _normalize_message(message: str) -> str:
+        """规范化消息：去除首尾空白并合并连续空白"""
+        return re.sub(r"\s+", " ", message).strip()
+    
+    @staticmethod
+    def _copy_intents(intents: List[Intent]) -> List[Intent]:
+        """复制意图列表（参数深拷贝）"""
+        return [replace(intent, params=copy.deepcopy(intent.params)) for intent in intents]
+    
+    def cache_stats(self) -> Dict[str, Dict]:
+        """获取识别缓存统计信息"""
+        return {
+            "detect": self.detect_cache.stats(),
+            "params": self.params_cache.stats(),
+            "rules_version": self.rule_store.snapshot.version
+        }
     
-    def _detect_by_keywords(self, message: str) -> List[Intent]:
-        """基于关键词的意图识别"""
+    def _detect_by_rules(self, user_message: str, snapshot: Optional[IntentRuleSnapshot] = None) -> List[Intent]:
+        """基于关键词和正则模式的意图识别（不依赖上下文）"""
         intents = []
-        message_lower = message.lower()
         
-        for intent_type, keywords in self.intent_keywords.items():
-            matched_keywords = []
-            for keyword in keywords:
-                if keyword in message_lower:
-                    matched_keywords.append(keyword)
+        # 本次识别全程使用同一份规则快照，避免与热更新交错
+        snapshot = snapshot or self.rule_store.snapshot
+        
+        # 1. 基于关键词的意图识别
+        keyword_intents = self._detect_by_keywords(user_message, snapshot)
+        intents.extend(keyword_intents)
+        
+        # 2. 基于正则模式的意图识别
+        pattern_intents = self._detect_by_patterns(user_message, snapshot)
+        intents.extend(pattern_intents)
+        
+        return intents
+    
+    def build_session_state(self, history: List[Dict]):
+        """
+        从对话历史构建会话意图状态（用于没有持久会话状态的调用方）
+        
+        Args:
+            history: 对话历史，支持 {"user": ..., "assistant": ...} 和 {"role": ..., "content": ...} 两种格式
             
+        Returns:
+            IntentSessionState 实例
+        """
+        from .intent_session_state import IntentSessionState
+        
+        state = IntentSessionState()
+        for msg in history:
+            if "user" in msg:
+                user_text = msg.get("user") or ""
+            elif msg.get("role") == "user":
+                user_text = msg.get("content") or ""
+            else:
+                continue
+            state.advance(self._merge_intents(self._detect_by_rules(user_text)))
+        return state
+    
+    def _detect_by_keywords(self, message: str, snapshot: IntentRuleSnapshot) -> List[Intent]:
+        """基于关键词的意图识别（自动机单次扫描）"""
+        intents = []
+        
+        for intent_type, matched_keywords in snapshot.match_keywords(message).items():
             if matched_keywords:
                 confidence = min(len(matched_keywords) * 0.3, 0.9)
                 intents.append(Intent(
@@ -138,56 +281,27 @@ class IntentDetectionService:
         
         return intents
     
-    def _detect_by_patterns(self, message: str) -> List[Intent]:
-        """基于正则模式的意图识别"""
+    def _detect_by_patterns(self, message: str, snapshot: IntentRuleSnapshot) -> List[Intent]:
+        """基于正则模式的意图识别（使用快照中预编译的正则）"""
         intents = []
         
-        for intent_type, patterns in self.intent_patterns.items():
+        for intent_type, patterns in snapshot.patterns.items():
             for pattern in patterns:
-                match = re.search(pattern, message, re.IGNORECASE)
+                match = pattern.search(message)
                 if match:
                     intents.append(Intent(
                         type=intent_type,
                         confidence=0.8,
-                        params={"matched_pattern": pattern, "match": match.group()},
+                        params={"matched_pattern": pattern.pattern, "match": match.group()},
                         raw_text=message
                     ))
                     break  # 每种意图类型只匹配一次
         
         return intents
     
-    def _detect_by_context(self, message: str, context: List[Dict]) -> List[Intent]:
-        """基于上下文的意图推断"""
-        intents = []
-        
-        # 分析最近的对话历史
-        recent_messages = context[-3:] if len(context) >= 3 else context
-        
-        # 简单的上下文推断规则
-        for msg in recent_messages:
-            if msg.get("role") == "user":
-                prev_message = msg.get("content", "").lower()
-                
-                # 如果之前提到了某种意图相关的内容，当前消息可能是延续
-                if "知识库" in prev_message or "查询" in prev_message:
-                    if "这个" in message or "它" in message or "还有" in message:
-                        intents.append(Intent(
-                            type=IntentType.KB_SEARCH,
-                            confidence=0.6,
-                            params={"context_inferred": True},
-                            raw_text=message
-                        ))
-                
-                if "虚拟人" in prev_message:
-                    if "继续" in message or "再" in message:
-                        intents.append(Intent(
-                            type=IntentType.VIRTUAL_HUMAN,
-                            confidence=0.6,
-                            params={"context_inferred": True},
-                            raw_text=message
-                        ))
-        
-        return intents
+    def _detect_by_context(self, message: str, session_state) -> List[Intent]:
+        """基于会话意图状态的上下文推断"""
+        return session_state.infer_follow_ups(message)
     
     def _merge_intents(self, intents: List[Intent]) -> List[Intent]:
         """合并和去重意图"""
@@ -220,16 +334,30 @@ class IntentDetectionService:
         """
         params = intent.params.copy()
         
-        if intent.type == IntentType.KB_SEARCH:
+        cache_key = (intent.type, self._normalize_message(message), self.rule_store.snapshot.version)
+        extracted = self.params_cache.get(cache_key)
+        if extracted is None:
+            extracted = self._extract_params_by_type(intent.type, message)
+            self.params_cache.put(cache_key, extracted)
+        
+        # 提取结果中的列表会被处理器修改，返回副本
+        params.update(copy.deepcopy(extracted))
+        return params
+    
+    def _extract_params_by_type(self, intent_type: IntentType, message: str) -> Dict:
+        """按意图类型从消息中提取参数"""
+        params = {}
+        
+        if intent_type == IntentType.KB_SEARCH:
             # 提取查询关键词
             search_terms = self._extract_search_terms(message)
             params["search_terms"] = search_terms
             
-        elif intent.type == IntentType.VIRTUAL_HUMAN:
+        elif intent_type == IntentType.VIRTUAL_HUMAN:
             # 提取虚拟人相关参数
             params["virtual_human_name"] = self._extract_virtual_human_name(message)
             
-        elif intent.type == IntentType.MCP_CALL:
+        elif intent_type == IntentType.MCP_CALL:
             # 提取MCP调用相关参数
             params["mcp_function"] = self._extract_mcp_function(message)
         
@@ -237,16 +365,8 @@ class IntentDetectionService:
     
     def _extract_search_terms(self, message: str) -> List[str]:
         """提取搜索关键词"""
-        # 移除意图相关的词汇，保留实际的搜索内容
-        stop_words = ["查询", "搜索", "找", "帮我", "请", "什么是", "是什么"]
-        words = message.split()
-        
-        search_terms = []
-        for word in words:
-            if word not in stop_words and len(word) > 1:
-                search_terms.append(word)
-        
-        return search_terms
+        # 本地分词后移除意图相关的词汇和停用词，保留实际的搜索内容
+        return word_segmenter.extract_terms(message, stop_words=self.SEARCH_STOP_WORDS)
     
     def _extract_virtual_human_name(self, message: str) -> Optional[str]:
         """提取虚拟人名称"""
@@ -159,14 +159,13 @@ def customize_intent_detection():
     
     from app.service.llm import intent_detector, IntentType
     
-    # 添加新的关键词
-    intent_detector.intent_keywords[IntentType.KB_SEARCH].extend([
-        "百科", "wiki", "定义", "解释"
-    ])
-    
-    # 添加新的正则模式
-    intent_detector.intent_patterns[IntentType.MCP_CALL].append(
-        r"(执行|运行|调用).*(功能|命令|指令)"
+    # 规则以不可变快照形式生效，更新时会编译新快照并原子替换，进行中的请求不受影响
+    # 长期生效的规则请直接修改 app/config/intent_rules.json，保存后会自动热加载
+    intent_detector.rule_store.update_rules(
+        # 添加新的关键词
+        keywords={IntentType.KB_SEARCH: ["百科", "wiki", "定义", "解释"]},
+        # 添加新的正则模式
+        patterns={IntentType.MCP_CALL: [r"(执行|运行|调用).*(功能|命令|指令)"]}
     )
     
     print("意图识别规则已更新")
@@ -2,17 +2,34 @@
 意图处理器基类
 所有具体的意图处理器都应该继承这个基类
 """
+import copy
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Hashable, Optional, Tuple
 from .intent_detection_service import Intent
+from .result_cache import CachePolicy, LRUCache
+from .executor_pools import THREAD_POOL, executor_pools
 
 
 class IntentHandlerBase(ABC):
     """意图处理器基类"""
     
+    # 处理器消费和产出的数据名称，管理器据此构建同一消息内各意图的执行依赖：
+    # 依赖的产出方执行完毕后才执行本处理器，产出方成功结果中的 data 通过 context["upstream"][名称] 传入
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    
+    # 处理结果缓存策略，None表示不缓存
+    cache_policy: Optional[CachePolicy] = None
+    
     def __init__(self):
         """初始化处理器"""
         self.name = self.__class__.__name__
+        # 单次处理的超时时间（秒），None表示只受请求截止时间约束
+        self.timeout: Optional[float] = None
+        
+        policy = self.cache_policy
+        self.result_cache = LRUCache(policy.max_entries, policy.ttl) if policy else None
         
     @abstractmethod
     async def handle(self, intent: Intent, message: str, context: Optional[Dict] = None) -> Dict[str, Any]:
@@ -46,6 +63,40 @@ class IntentHandlerBase(ABC):
         """
         pass
     
+    @staticmethod
+    def time_remaining(context: Optional[Dict] = None, default: Optional[float] = None) -> Optional[float]:
+        """
+        获取距离请求截止时间的剩余秒数
+        
+        Args:
+            context: 上下文（deadline 为 time.monotonic() 时间点）
+            default: 没有截止时间时的返回值
+            
+        Returns:
+            剩余秒数（不小于0）
+        """
+        deadline = context.get("deadline") if context else None
+        if deadline is None:
+            return default
+        return max(0.0, deadline - time.monotonic())
+    
+    async def run_in_pool(self, func: Callable, *args, pool: str = THREAD_POOL, **kwargs) -> Any:
+        """
+        在共享执行器池中执行CPU密集或阻塞的阶段，避免阻塞事件循环
+        
+        也可以用 executor_pools.offload 装饰器把方法整体标记为在执行器池中执行。
+        
+        Args:
+            func: 同步函数
+            *args: 位置参数
+            pool: 执行器池名称
+            **kwargs: 关键字参数
+            
+        Returns:
+            函数返回值
+        """
+        return await executor_pools.run(pool, func, *args, **kwargs)
+    
     def preprocess(self, message: str, context: Optional[Dict] = None) -> Dict[str, Any]:
         """
         预处理（可选覆盖）
@@ -87,6 +138,15 @@ class IntentHandlerBase(ABC):
             # 预处理
             preprocessed = self.preprocess(message, context)
             
+            # 查询结果缓存
+            cache_key = self._cache_key(intent, preprocessed["message"], preprocessed.get("context"))
+            if cache_key is not None:
+                cached = self.result_cache.get(cache_key)
+                if cached is not None:
+                    result = copy.deepcopy(cached)
+                    result["cached"] = True
+                    return result
+            
             # 主处理
             result = await self.handle(
                 intent, 
@@ -97,6 +157,9 @@ class IntentHandlerBase(ABC):
             # 后处理
             final_result = self.postprocess(result)
             
+            if cache_key is not None:
+                self._store_result(cache_key, final_result)
+            
             return final_result
             
         except Exception as e:
@@ -107,5 +170,39 @@ class IntentHandlerBase(ABC):
                 "need_continue": False
             }
     
+    def _cache_key(self, intent: Intent, message: str, context: Optional[Dict] = None) -> Optional[Hashable]:
+        """计算缓存键，未启用缓存或键无法计算时返回None"""
+        if self.result_cache is None or not self.result_cache.enabled:
+            return None
+        try:
+            key = self.cache_policy.key(intent, message, context)
+            hash(key)
+            return key
+        except Exception as e:
+            print(f"{self.name} 缓存键计算失败: {str(e)}")
+            return None
+    
+    def _store_result(self, cache_key: Hashable, result: Dict[str, Any]):
+        """按缓存策略写入结果：出错或降级（degraded）的结果不缓存，"未找到"的结果按 negative_ttl 缓存"""
+        if not result.get("success") or "error" in result or result.get("degraded"):
+            return
+        
+        ttl = None
+        if self.cache_policy.is_negative(result):
+            ttl = self.cache_policy.negative_ttl
+            if ttl <= 0:
+                return
+        
+        self.result_cache.put(cache_key, copy.deepcopy(result), ttl)
+    
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        获取结果缓存统计
+        
+        Returns:
+            统计信息，未启用缓存时返回None
+        """
+        return self.result_cache.stats() if self.result_cache is not None else None
+    
     def __repr__(self):
         return f"<{self.name}>" 
\ No newline at end of file
@@ -2,10 +2,17 @@
 意图处理器管理器
 负责注册、管理和调度所有的意图处理器
 """
-from typing import Dict, List, Type, Optional, Any
+import os
+import time
+import dotenv
+from typing import Dict, List, Type, Optional, Any, AsyncIterator, Tuple
 import asyncio
 from .intent_handler_base import IntentHandlerBase
 from .intent_detection_service import Intent, IntentType, intent_detector
+from .intent_session_state import IntentSessionStore
+from .bulkhead import Bulkhead, BulkheadFullError
+from .executor_pools import THREAD_POOL, executor_pools
+from .loop_monitor import loop_monitor
 
 # 导入所有的处理器
 from .chat_handler import ChatHandler
@@ -18,12 +25,83 @@ from .virtual_human_handler import VirtualHumanHandler
 class IntentHandlerManager:
     """意图处理器管理器"""
     
+    # 流式输出时同一时刻完成的多个结果的推送顺序（数值越小越先推送）
+    STREAM_PRIORITY = {
+        IntentType.VIRTUAL_HUMAN: 0,
+        IntentType.KB_SEARCH: 1,
+        IntentType.VECTOR_SEARCH: 1,
+        IntentType.MCP_CALL: 2,
+        IntentType.CHAT: 3
+    }
+    
     def __init__(self):
         """初始化管理器"""
         self.handlers: Dict[IntentType, IntentHandlerBase] = {}
+        self.bulkheads: Dict[IntentType, Bulkhead] = {}
+        self.speculation_stats = {"started": 0, "discarded": 0}
         self.intent_detector = intent_detector
+        self._load_manager_config()
+        
+        # 会话级意图状态，每轮更新一次，供上下文意图推断使用
+        self.session_store = IntentSessionStore(
+            max_sessions=self.session_max_count,
+            decay=self.session_slot_decay,
+            min_weight=self.session_slot_min_weight,
+            ttl=self.session_ttl
+        )
         self._register_default_handlers()
     
+    def _load_manager_config(self):
+        """加载意图处理配置"""
+        intent_config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
+                                          "config", "config_intent.env")
+        
+        # 设置配置属性默认值
+        self.session_max_count = 1024
+        self.session_slot_decay = 0.5
+        self.session_slot_min_weight = 0.2
+        self.session_ttl = 1800
+        self.request_timeout = 20.0
+        self.speculative_chat = False
+        self.handler_timeouts: Dict[str, float] = {}
+        self.handler_concurrency: Dict[str, int] = {}
+        self.handler_queue_sizes: Dict[str, int] = {}
+        
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(intent_config_path):
+            intent_config = dotenv.dotenv_values(intent_config_path)
+            
+            self.session_max_count = int(intent_config.get("INTENT_SESSION_MAX_COUNT", self.session_max_count))
+            self.session_slot_decay = float(intent_config.get("INTENT_SESSION_SLOT_DECAY", self.session_slot_decay))
+            self.session_slot_min_weight = float(intent_config.get("INTENT_SESSION_SLOT_MIN_WEIGHT", self.session_slot_min_weight))
+            self.session_ttl = float(intent_config.get("INTENT_SESSION_TTL", self.session_ttl))
+            self.request_timeout = float(intent_config.get("INTENT_REQUEST_TIMEOUT", self.request_timeout))
+            self.speculative_chat = intent_config.get("INTENT_SPECULATIVE_CHAT", "false").lower() == "true"
+            
+            # 处理器级配置，格式：意图类型=数值
+            self.handler_timeouts = self._parse_handler_values(intent_config.get("HANDLER_TIMEOUTS", ""), float)
+            self.handler_concurrency = self._parse_handler_values(intent_config.get("HANDLER_CONCURRENCY", ""), int)
+            self.handler_queue_sizes = self._parse_handler_values(intent_config.get("HANDLER_QUEUE_SIZE", ""), int)
+    
+    @staticmethod
+    def _parse_handler_values(values_str: str, cast) -> Dict[str, Any]:
+        """
+        解析按意图类型配置的数值
+        
+        Args:
+            values_str: 配置字符串，如 "chat=20,kb_search=8"
+            cast: 数值类型转换函数
+            
+        Returns:
+            意图类型 -> 数值
+        """
+        values = {}
+        for pair in values_str.split(","):
+            if "=" in pair:
+                intent_name, value = pair.split("=", 1)
+                values[intent_name.strip()] = cast(value.strip())
+        return values
+    
     def _register_default_handlers(self):
         """注册默认的处理器"""
         # 创建并注册所有默认处理器
@@ -44,6 +122,19 @@ class IntentHandlerManager:
         if not isinstance(handler, IntentHandlerBase):
             raise ValueError(f"处理器必须继承自IntentHandlerBase: {type(handler)}")
         
+        # 处理器未自行设置超时时使用配置中的超时
+        if getattr(handler, "timeout", None) is None:
+            handler.timeout = self.handler_timeouts.get(intent_type.value)
+        
+        # 配置了并发上限的意图类型使用舱壁隔离
+        max_concurrent = self.handler_concurrency.get(intent_type.value)
+        if max_concurrent and intent_type not in self.bulkheads:
+            self.bulkheads[intent_type] = Bulkhead(
+                intent_type.value,
+                max_concurrent,
+                self.handler_queue_sizes.get(intent_type.value, 0)
+            )
+        
         self.handlers[intent_type] = handler
         print(f"已注册意图处理器: {intent_type.value} -> {handler}")
     
@@ -87,11 +178,21 @@ class IntentHandlerManager:
         Returns:
             处理结果
         """
-        # 1. 识别意图
-        # 从context中提取对话历史（如果有的话）
-        conversation_history = context.get("conversation_history", []) if context else []
-        intents = self.intent_detector.detect_intents(message, conversation_history)
+        # 设置请求截止时间，随上下文传递给各处理器
+        context = context if context is not None else {}
+        context.setdefault("deadline", time.monotonic() + self.request_timeout)
         
+        # 与意图处理同时预先生成聊天回复
+        self._start_speculation(message, context)
+        try:
+            return await self._process_message(message, context, parallel)
+        finally:
+            self._finish_speculation(context)
+    
+    async def _process_message(self, message: str, context: Dict, parallel: bool) -> Dict[str, Any]:
+        """识别意图、执行处理器并合并结果"""
+        # 1-2. 识别意图并提取参数
+        intents = self._prepare_intents(message, context)
         if not intents:
             return {
                 "success": False,
@@ -99,10 +200,6 @@ class IntentHandlerManager:
                 "intents": []
             }
         
-        # 2. 提取每个意图的参数
-        for intent in intents:
-            intent.params = self.intent_detector.extract_intent_params(intent, message)
-        
         # 3. 处理意图
         results = []
         
@@ -118,14 +215,336 @@ class IntentHandlerManager:
         
         return final_result
     
+    async def process_message_stream(
+        self,
+        message: str,
+        context: Optional[Dict] = None,
+        parallel: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式处理用户消息，每个处理器完成后立即产出其结果，最后产出合并结果
+        
+        产出的事件格式为 {"event": 事件名, "data": 数据}，事件依次为：
+        intents（识别出的意图）、result（单个处理器结果，按完成先后）、final（合并结果）
+        
+        Args:
+            message: 用户消息
+            context: 上下文信息
+            parallel: 是否并行处理多个意图
+            
+        Yields:
+            处理事件
+        """
+        context = context if context is not None else {}
+        context.setdefault("deadline", time.monotonic() + self.request_timeout)
+        
+        self._start_speculation(message, context)
+        try:
+            async for event in self._process_message_stream(message, context, parallel):
+                yield event
+        finally:
+            self._finish_speculation(context)
+    
+    async def _process_message_stream(
+        self,
+        message: str,
+        context: Dict,
+        parallel: bool
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式识别意图、执行处理器并产出事件"""
+        intents = self._prepare_intents(message, context)
+        if not intents:
+            yield {
+                "event": "final",
+                "data": {
+                    "success": False,
+                    "response": "无法识别您的意图，请重新表述。",
+                    "intents": []
+                }
+            }
+            return
+        
+        yield {"event": "intents", "data": {"intents": self._describe_intents(intents)}}
+        
+        runnable = self._collect_runnable(intents)
+        order, deps = self._plan_execution(runnable)
+        
+        results: List[Dict[str, Any]] = []
+        if parallel and len(runnable) > 1:
+            # 按依赖关系并发执行，按完成先后推送；同时完成的按 STREAM_PRIORITY 排序
+            tasks = self._schedule_graph(runnable, order, deps, message, context)
+            pending = {task: index for index, task in enumerate(tasks)}
+            slots: List[Optional[Dict[str, Any]]] = [None] * len(runnable)
+            try:
+                while pending:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in sorted(done, key=lambda t: self.STREAM_PRIORITY.get(runnable[pending[t]][0].type, 99)):
+                        index = pending.pop(task)
+                        slots[index] = task.result()
+                        yield {"event": "result", "data": slots[index]}
+            finally:
+                # 调用方提前停止迭代时取消尚未完成的处理器
+                for task in pending:
+                    task.cancel()
+            # 合并结果保持意图顺序，与非流式模式一致
+            results = [result for result in slots if result is not None]
+        else:
+            for index in order:
+                intent, handler = runnable[index]
+                result = await self._run_handler(handler, intent, intent.raw_text or message, context)
+                results.append(result)
+                yield {"event": "result", "data": result}
+                
+                if not result.get("need_continue", True):
+                    break
+        
+        yield {"event": "final", "data": self._merge_results(results, intents)}
+    
+    def _start_speculation(self, message: str, context: Dict):
+        """
+        在意图识别之前就开始生成聊天回复，仅聊天意图时处理器直接使用该结果
+        
+        生成过程不记录对话历史，由采用它的聊天处理器记录；未被采用时直接丢弃。
+        
+        Args:
+            message: 用户消息
+            context: 上下文（预先生成的回复以 (消息, future) 形式存入 speculative_reply）
+        """
+        if not context.get("speculative_chat", self.speculative_chat):
+            return
+        # 与聊天处理器预处理后的消息保持一致（去除首尾空白），否则采用时比较不上
+        message = message.strip()
+        ai_manager = context.get("ai_manager")
+        if not hasattr(ai_manager, "generate_response_sync") or not ai_manager.can_speculate(message):
+            return
+        
+        future = asyncio.ensure_future(executor_pools.run(
+            THREAD_POOL, ai_manager.generate_response_sync, message, None, IntentHandlerBase.time_remaining(context)
+        ))
+        context["speculative_reply"] = (message, future)
+        self.speculation_stats["started"] += 1
+    
+    def _finish_speculation(self, context: Dict):
+        """丢弃未被聊天处理器采用的预先生成回复"""
+        speculation = context.pop("speculative_reply", None)
+        if speculation is not None:
+            speculation[1].cancel()
+            self.speculation_stats["discarded"] += 1
+    
+    def _prepare_intents(self, message: str, context: Dict) -> List[Intent]:
+        """
+        识别意图并提取每个意图的参数
+        
+        Args:
+            message: 用户消息
+            context: 上下文
+            
+        Returns:
+            意图列表（可能为空）
+        """
+        # 1. 识别意图
+        # 从context中提取对话历史和会话ID（如果有的话）
+        conversation_history = context.get("conversation_history", [])
+        session_id = context.get("session_id")
+        
+        if session_id:
+            # 使用增量维护的会话状态，仅在会话首次出现时从历史构建一次
+            session_state = self.session_store.get(session_id)
+            if session_state is None:
+                session_state = self.intent_detector.build_session_state(conversation_history)
+                self.session_store.put(session_id, session_state)
+            intents = self.intent_detector.detect_intents(message, session_state=session_state)
+            self.session_store.observe(session_id, intents)
+        else:
+            intents = self.intent_detector.detect_intents(message, conversation_history)
+        
+        # 2. 提取每个意图的参数（多意图时只使用该意图对应的子句）
+        for intent in intents:
+            intent.params = self.intent_detector.extract_intent_params(intent, intent.raw_text)
+        
+        return intents
+    
+    async def _run_handler(
+        self,
+        handler: IntentHandlerBase,
+        intent: Intent,
+        message: str,
+        context: Dict
+    ) -> Dict[str, Any]:
+        """
+        在处理器超时和请求截止时间内执行单个处理器
+        
+        Args:
+            handler: 处理器
+            intent: 意图
+            message: 处理器输入文本
+            context: 上下文（包含 deadline）
+            
+        Returns:
+            处理结果（带 intent_type 标记，超时时带 timed_out 标记）
+        """
+        timeout = handler.time_remaining(context)
+        if getattr(handler, "timeout", None) is not None:
+            timeout = handler.timeout if timeout is None else min(timeout, handler.timeout)
+        
+        try:
+            if timeout is not None and timeout <= 0:
+                raise asyncio.TimeoutError()
+            result = await asyncio.wait_for(self._execute_isolated(handler, intent, message, context), timeout)
+        except BulkheadFullError:
+            result = {
+                "success": False,
+                "response": f"{intent.type.value} 当前繁忙，已跳过。",
+                "error": "Busy",
+                "rejected": True,
+                "need_continue": True
+            }
+        except asyncio.TimeoutError:
+            result = {
+                "success": False,
+                "response": f"{intent.type.value} 处理超时，已跳过。",
+                "error": "Timeout",
+                "timed_out": True,
+                "need_continue": True
+            }
+        except Exception as e:
+            result = {
+                "success": False,
+                "response": f"处理出错: {str(e)}",
+                "error": str(e)
+            }
+        
+        result["intent_type"] = intent.type.value
+        
+        # 发布产出数据，供依赖该数据的处理器使用
+        if result.get("success") and handler.outputs:
+            upstream = context.setdefault("upstream", {})
+            for output in handler.outputs:
+                upstream.setdefault(output, []).append(result.get("data"))
+        
+        return result
+    
+    async def _execute_isolated(
+        self,
+        handler: IntentHandlerBase,
+        intent: Intent,
+        message: str,
+        context: Dict
+    ) -> Dict[str, Any]:
+        """在意图类型对应的舱壁内执行处理器（排队时间计入超时），并监控其是否阻塞事件循环"""
+        bulkhead = self.bulkheads.get(intent.type)
+        if bulkhead is None:
+            return await loop_monitor.monitor(handler.execute(intent, message, context), handler.name)
+        async with bulkhead.slot():
+            return await loop_monitor.monitor(handler.execute(intent, message, context), handler.name)
+    
+    def _collect_runnable(self, intents: List[Intent]) -> List[Tuple[Intent, IntentHandlerBase]]:
+        """
+        获取有可用处理器的意图及其处理器
+        
+        Args:
+            intents: 意图列表
+            
+        Returns:
+            (意图, 处理器) 列表，保持意图顺序
+        """
+        runnable = []
+        for intent in intents:
+            handler = self.get_handler(intent.type)
+            if handler and handler.can_handle(intent):
+                runnable.append((intent, handler))
+        return runnable
+    
+    def _plan_execution(
+        self,
+        runnable: List[Tuple[Intent, IntentHandlerBase]]
+    ) -> Tuple[List[int], List[List[int]]]:
+        """
+        根据处理器声明的输入输出构建本条消息的执行依赖图
+        
+        Args:
+            runnable: (意图, 处理器) 列表
+            
+        Returns:
+            (拓扑顺序, 依赖关系)，deps[i] 为节点 i 依赖的节点下标列表
+        """
+        count = len(runnable)
+        deps = []
+        for i, (_, handler) in enumerate(runnable):
+            inputs = set(handler.inputs)
+            deps.append([
+                j for j, (_, producer) in enumerate(runnable)
+                if j != i and inputs & set(producer.outputs)
+            ])
+        
+        # 拓扑排序，无依赖的节点保持意图顺序
+        indegree = [len(d) for d in deps]
+        order = [i for i in range(count) if indegree[i] == 0]
+        position = 0
+        while position < len(order):
+            done = order[position]
+            position += 1
+            for i in range(count):
+                if done in deps[i]:
+                    indegree[i] -= 1
+                    if indegree[i] == 0:
+                        order.append(i)
+        
+        if len(order) < count:
+            # 依赖存在环时忽略环上节点的依赖，避免互相等待
+            cyclic = [i for i in range(count) if i not in order]
+            print(f"处理器依赖存在环，忽略依赖: {[runnable[i][0].type.value for i in cyclic]}")
+            for i in cyclic:
+                deps[i] = []
+            order.extend(cyclic)
+        
+        return order, deps
+    
+    def _schedule_graph(
+        self,
+        runnable: List[Tuple[Intent, IntentHandlerBase]],
+        order: List[int],
+        deps: List[List[int]],
+        message: str,
+        context: Dict
+    ) -> List[asyncio.Future]:
+        """
+        按依赖图创建处理任务：每个节点在其依赖节点全部结束（成功、失败或超时）后开始执行
+        
+        Returns:
+            与 runnable 对应的任务列表
+        """
+        tasks: List[Optional[asyncio.Future]] = [None] * len(runnable)
+        for index in order:
+            intent, handler = runnable[index]
+            tasks[index] = asyncio.ensure_future(self._run_node(
+                handler, intent, intent.raw_text or message, context,
+                [tasks[dep] for dep in deps[index]]
+            ))
+        return tasks
+    
+    async def _run_node(
+        self,
+        handler: IntentHandlerBase,
+        intent: Intent,
+        message: str,
+        context: Dict,
+        upstream_tasks: List[asyncio.Future]
+    ) -> Dict[str, Any]:
+        """等待依赖节点结束后执行处理器"""
+        if upstream_tasks:
+            await asyncio.wait(upstream_tasks)
+        return await self._run_handler(handler, intent, message, context)
+    
     async def _process_intents_parallel(
         self, 
         intents: List[Intent], 
         message: str, 
-        context: Optional[Dict]
+        context: Dict
     ) -> List[Dict[str, Any]]:
         """
-        并行处理多个意图
+        按依赖图并发处理多个意图：互不依赖的处理器同时执行，
+        依赖检索结果的处理器（如聊天）在检索结束后执行
         
         Args:
             intents: 意图列表
@@ -133,41 +552,28 @@ class IntentHandlerManager:
             context: 上下文
             
         Returns:
-            处理结果列表
+            处理结果列表（保持意图顺序，超时的意图以失败结果占位）
         """
-        tasks = []
+        runnable = self._collect_runnable(intents)
+        if not runnable:
+            return []
         
-        for intent in intents:
-            handler = self.get_handler(intent.type)
-            if handler and handler.can_handle(intent):
-                task = handler.execute(intent, message, context)
-                tasks.append(task)
-        
-        if tasks:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            # 过滤掉异常结果
-            valid_results = []
-            for result in results:
-                if isinstance(result, dict):
-                    valid_results.append(result)
-                elif isinstance(result, Exception):
-                    valid_results.append({
-                        "success": False,
-                        "response": f"处理出错: {str(result)}",
-                        "error": str(result)
-                    })
-            return valid_results
-        
-        return []
+        order, deps = self._plan_execution(runnable)
+        tasks = self._schedule_graph(runnable, order, deps, message, context)
+        try:
+            return list(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
     
     async def _process_intents_sequential(
         self, 
         intents: List[Intent], 
         message: str, 
-        context: Optional[Dict]
+        context: Dict
     ) -> List[Dict[str, Any]]:
         """
-        顺序处理意图
+        顺序处理意图（按依赖图的拓扑顺序）
         
         Args:
             intents: 意图列表
@@ -178,24 +584,17 @@ class IntentHandlerManager:
             处理结果列表
         """
         results = []
+        runnable = self._collect_runnable(intents)
+        order, _ = self._plan_execution(runnable)
         
-        for intent in intents:
-            handler = self.get_handler(intent.type)
-            if handler and handler.can_handle(intent):
-                try:
-                    result = await handler.execute(intent, message, context)
-                    results.append(result)
-                    
-                    # 如果处理器指示不需要继续，则停止
-                    if not result.get("need_continue", True):
-                        break
-                        
-                except Exception as e:
-                    results.append({
-                        "success": False,
-                        "response": f"处理出错: {str(e)}",
-                        "error": str(e)
-                    })
+        for index in order:
+            intent, handler = runnable[index]
+            result = await self._run_handler(handler, intent, intent.raw_text or message, context)
+            results.append(result)
+            
+            # 如果处理器指示不需要继续，则停止
+            if not result.get("need_continue", True):
+                break
         
         return results
     
@@ -220,17 +619,21 @@ class IntentHandlerManager:
         # 合并所有响应
         merged_response = []
         all_data = {}
-        overall_success = True
+        succeeded = 0
+        timed_out_intents = []
+        rejected_intents = []
         
         for i, result in enumerate(results):
+            intent_type = result.get("intent_type") or (intents[i].type.value if i < len(intents) else "unknown")
+            
             if result.get("success", False):
+                succeeded += 1
                 response = result.get("response", "")
                 if response:
                     # 如果只有一个意图，不添加标签前缀
                     if len(results) == 1:
                         merged_response.append(response)
                     else:
-                        intent_type = intents[i].type.value if i < len(intents) else "unknown"
                         merged_response.append(f"【{intent_type}】\n{response}")
                 
                 # 合并数据
@@ -242,7 +645,10 @@ class IntentHandlerManager:
                         # 多个意图时，分别存储
                         all_data[f"intent_{i}"] = result["data"]
             else:
-                overall_success = False
+                if result.get("timed_out"):
+                    timed_out_intents.append(intent_type)
+                elif result.get("rejected"):
+                    rejected_intents.append(intent_type)
                 error_msg = result.get("response", "处理失败")
                 merged_response.append(f"❌ {error_msg}")
         
@@ -250,19 +656,55 @@ class IntentHandlerManager:
         final_response = "\n\n---\n\n".join(merged_response) if merged_response else "处理完成，但没有生成响应。"
         
         return {
-            "success": overall_success,
+            # 只要有处理器成功就返回已完成的部分结果
+            "success": succeeded > 0,
+            "partial": 0 < succeeded < len(results),
+            "timed_out_intents": timed_out_intents,
+            "rejected_intents": rejected_intents,
             "response": final_response,
-            "intents": [
-                {
-                    "type": intent.type.value,
-                    "confidence": intent.confidence,
-                    "params": intent.params
-                } for intent in intents
-            ],
+            "intents": self._describe_intents(intents),
             "data": all_data,
             "results_count": len(results)
         }
     
+    @staticmethod
+    def _describe_intents(intents: List[Intent]) -> List[Dict[str, Any]]:
+        """将意图列表转换为可序列化的描述"""
+        return [
+            {
+                "type": intent.type.value,
+                "confidence": intent.confidence,
+                "params": intent.params,
+                "text": intent.raw_text
+            } for intent in intents
+        ]
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        获取意图处理相关的运行指标
+        
+        Returns:
+            指标字典
+        """
+        return {
+            "detection_cache": self.intent_detector.cache_stats(),
+            "bulkheads": {
+                intent_type.value: bulkhead.stats() for intent_type, bulkhead in self.bulkheads.items()
+            },
+            "result_cache": {
+                intent_type.value: handler.cache_stats()
+                for intent_type, handler in self.handlers.items()
+                if handler.cache_stats() is not None
+            },
+            "executors": executor_pools.stats(),
+            "speculative_chat": {
+                "enabled": self.speculative_chat,
+                "started": self.speculation_stats["started"],
+                "used": self.speculation_stats["started"] - self.speculation_stats["discarded"],
+                "discarded": self.speculation_stats["discarded"]
+            }
+        }
+    
     def list_handlers(self) -> List[Dict[str, str]]:
         """
         列出所有已注册的处理器
@@ -0,0 +1,278 @@
+"""
+意图规则快照存储
+从规则文件加载关键词与正则规则，编译为不可变快照，文件变更时在后台重建并原子替换
+"""
+import os
+import re
+import json
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Pattern, Tuple
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多模式关键词匹配自动机（构建后只读）"""
+
+    def __init__(self, keywords: Iterable[Tuple[str, Any]]):
+        """
+        构建自动机
+
+        Args:
+            keywords: (关键词, 负载) 序列，匹配时返回命中关键词对应的负载
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[Any, ...]] = [()]
+
+        # 1. 构建字典树
+        outputs: List[List[Any]] = [[]]
+        for keyword, payload in keywords:
+            if not keyword:
+                continue
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(payload)
+
+        # 2. 广度优先计算失败指针，并合并后缀状态的输出
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                fallback = self._goto[fail_state].get(char, 0)
+                self._fail[next_state] = fallback if fallback != next_state else 0
+                outputs[next_state].extend(outputs[self._fail[next_state]])
+
+        self._output = [tuple(out) for out in outputs]
+
+    def iter_matches(self, text: str):
+        """
+        扫描文本，逐个产出命中关键词的负载（同一关键词多次出现会多次产出）
+
+        Args:
+            text: 待匹配文本
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield from output[state]
+
+
+@dataclass(frozen=True)
+class IntentRuleSnapshot:
+    """编译后的意图规则快照，创建后不再修改，可在请求间无锁共享"""
+    version: int
+    source: str
+    keywords: Mapping[Any, Tuple[str, ...]]
+    patterns: Mapping[Any, Tuple[Pattern, ...]]
+    automaton: KeywordAutomaton
+
+    def match_keywords(self, message: str) -> Dict[Any, List[str]]:
+        """
+        一次扫描匹配所有意图的关键词
+
+        Args:
+            message: 用户消息
+
+        Returns:
+            意图类型 -> 命中的关键词列表（按规则中的顺序）
+        """
+        hits: Dict[Any, set] = {}
+        for intent_type, index in self.automaton.iter_matches(message.lower()):
+            hits.setdefault(intent_type, set()).add(index)
+
+        return {
+            intent_type: [words[i] for i in sorted(hits[intent_type])]
+            for intent_type, words in self.keywords.items()
+            if intent_type in hits
+        }
+
+    def to_rules(self) -> Dict[str, Dict[str, List[str]]]:
+        """导出为规则文件格式"""
+        return {
+            "keywords": {_key_name(k): list(v) for k, v in self.keywords.items()},
+            "patterns": {_key_name(k): [p.pattern for p in v] for k, v in self.patterns.items()},
+        }
+
+
+def _key_name(key: Any) -> str:
+    """规则键转换为文件中的名称"""
+    return getattr(key, "value", key)
+
+
+class IntentRuleStore:
+    """意图规则存储，读取方只需获取当前快照，写入方以写时复制方式替换快照"""
+
+    def __init__(
+        self,
+        rules_path: Optional[str],
+        key_type: Callable[[str], Any] = str,
+        default_rules: Optional[Dict] = None,
+        reload_interval: float = 0
+    ):
+        """
+        初始化规则存储
+
+        Args:
+            rules_path: 规则文件路径
+            key_type: 将文件中的意图名称转换为意图类型的函数
+            default_rules: 规则文件不存在或无效时使用的默认规则
+            reload_interval: 热更新检查间隔（秒），0表示不检查
+        """
+        self.rules_path = rules_path
+        self.key_type = key_type
+        self.default_rules = default_rules or {"keywords": {}, "patterns": {}}
+        self.reload_interval = reload_interval
+
+        self._version = 0
+        self._write_lock = threading.Lock()
+        self._watcher = None
+        self._stop_event = threading.Event()
+        self._file_mtime = None
+        self._snapshot = self._compile(self.default_rules, "default")
+        self.reload()
+
+    @property
+    def snapshot(self) -> IntentRuleSnapshot:
+        """当前规则快照（引用赋值是原子的，读取无需加锁）"""
+        return self._snapshot
+
+    def _read_rules_file(self) -> Optional[Dict]:
+        """读取规则文件，失败时返回None"""
+        if not self.rules_path or not os.path.exists(self.rules_path):
+            return None
+
+        try:
+            self._file_mtime = os.path.getmtime(self.rules_path)
+            with open(self.rules_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取意图规则文件失败: {e}")
+            return None
+
+    def _compile(self, rules: Dict, source: str) -> IntentRuleSnapshot:
+        """
+        将规则编译为快照
+
+        Args:
+            rules: {"keywords": {意图: [关键词]}, "patterns": {意图: [正则]}}
+            source: 规则来源说明
+
+        Returns:
+            新的规则快照
+        """
+        keywords: Dict[Any, Tuple[str, ...]] = {}
+        for name, words in rules.get("keywords", {}).items():
+            keywords[self.key_type(name)] = tuple(dict.fromkeys(words))
+
+        patterns: Dict[Any, Tuple[Pattern, ...]] = {}
+        for name, regexes in rules.get("patterns", {}).items():
+            patterns[self.key_type(name)] = tuple(re.compile(p, re.IGNORECASE) for p in regexes)
+
+        automaton = KeywordAutomaton(
+            (word.lower(), (intent_type, index))
+            for intent_type, words in keywords.items()
+            for index, word in enumerate(words)
+        )
+
+        self._version += 1
+        return IntentRuleSnapshot(
+            version=self._version,
+            source=source,
+            keywords=MappingProxyType(keywords),
+            patterns=MappingProxyType(patterns),
+            automaton=automaton
+        )
+
+    def reload(self) -> bool:
+        """
+        从规则文件重新加载
+
+        Returns:
+            是否成功替换快照
+        """
+        with self._write_lock:
+            rules = self._read_rules_file()
+            if rules is None:
+                return False
+            try:
+                self._snapshot = self._compile(rules, self.rules_path)
+            except Exception as e:
+                # 规则无效时保留旧快照
+                print(f"编译意图规则失败，继续使用旧规则: {e}")
+                return False
+
+        print(f"意图规则已加载: v{self._snapshot.version} ({self.rules_path})")
+        return True
+
+    def update_rules(
+        self,
+        keywords: Optional[Dict[Any, List[str]]] = None,
+        patterns: Optional[Dict[Any, List[str]]] = None,
+        replace: bool = False
+    ) -> IntentRuleSnapshot:
+        """
+        以写时复制方式更新规则（仅更新内存，规则文件变更后以文件内容为准）
+
+        Args:
+            keywords: 要追加（或替换）的关键词
+            patterns: 要追加（或替换）的正则模式
+            replace: True时替换对应意图的规则，False时追加
+
+        Returns:
+            新的规则快照
+        """
+        with self._write_lock:
+            rules = self._snapshot.to_rules()
+            for section, updates in (("keywords", keywords), ("patterns", patterns)):
+                for key, values in (updates or {}).items():
+                    name = _key_name(key)
+                    current = [] if replace else rules[section].get(name, [])
+                    rules[section][name] = current + list(values)
+
+            self._snapshot = self._compile(rules, "runtime")
+            return self._snapshot
+
+    def start_watching(self):
+        """启动后台线程监视规则文件变更"""
+        if self._watcher or not self.rules_path or self.reload_interval <= 0:
+            return
+
+        def watch():
+            while not self._stop_event.wait(self.reload_interval):
+                try:
+                    mtime = os.path.getmtime(self.rules_path)
+                except OSError:
+                    continue
+                if mtime != self._file_mtime:
+                    self.reload()
+
+        self._watcher = threading.Thread(target=watch, name="intent-rule-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        """停止监视规则文件"""
+        self._stop_event.set()
+        if self._watcher:
+            self._watcher.join(timeout=1)
+            self._watcher = None
@@ -0,0 +1,95 @@
+"""
+多意图分句服务
+将包含多个意图的消息切分为子句，并把每个意图映射到与之相关的子句
+"""
+import re
+from typing import Callable, Dict, List
+from .intent_detection_service import Intent, IntentType
+
+
+class ClauseSegmenter:
+    """子句切分器"""
+
+    # 子句分隔标点
+    DELIMITER_PATTERN = r"[，,。；;！!？?\n]+"
+
+    # 子句之间的连接词（出现在子句开头时去除）
+    CONNECTORS = ("然后", "接着", "之后", "并且", "同时", "另外", "顺便", "还有", "最后")
+
+    def __init__(self):
+        """初始化子句切分器"""
+        self._delimiter = re.compile(self.DELIMITER_PATTERN)
+        self._connector = re.compile(
+            r"^(?:%s)" % "|".join(sorted(map(re.escape, self.CONNECTORS), key=len, reverse=True))
+        )
+
+    def split(self, message: str) -> List[str]:
+        """
+        切分子句
+
+        Args:
+            message: 用户消息
+
+        Returns:
+            去除连接词后的非空子句列表
+        """
+        clauses = []
+        for part in self._delimiter.split(message):
+            part = part.strip()
+            stripped = self._connector.sub("", part).strip()
+            if stripped:
+                clauses.append(stripped)
+        return clauses
+
+    def assign(
+        self,
+        message: str,
+        intents: List[Intent],
+        detect_clause: Callable[[str], List[Intent]]
+    ) -> List[Intent]:
+        """
+        将意图映射到子句，把每个意图的 raw_text 设置为其对应的子句
+
+        没有识别出意图的子句归入前一个有意图的子句（位于开头时归入后一个）；
+        在任何子句中都无法定位的意图（如跨子句的模式、上下文推断）保留完整消息。
+
+        Args:
+            message: 用户消息
+            intents: 对完整消息识别出的意图
+            detect_clause: 对单个子句进行规则识别的函数
+
+        Returns:
+            原意图列表（raw_text 已更新）
+        """
+        clauses = self.split(message)
+        if len(intents) < 2 or len(clauses) < 2:
+            return intents
+
+        clause_types = [{intent.type for intent in detect_clause(clause)} for clause in clauses]
+
+        # 无意图的子句继承相邻子句的意图
+        owners = list(clause_types)
+        last = None
+        for i, types in enumerate(owners):
+            if types:
+                last = types
+            elif last is not None:
+                owners[i] = last
+        following = None
+        for i in range(len(owners) - 1, -1, -1):
+            if owners[i]:
+                following = owners[i]
+            elif following is not None:
+                owners[i] = following
+
+        texts: Dict[IntentType, List[str]] = {}
+        for clause, types in zip(clauses, owners):
+            for intent_type in types:
+                texts.setdefault(intent_type, []).append(clause)
+
+        for intent in intents:
+            parts = texts.get(intent.type)
+            if parts and not intent.params.get("context_inferred"):
+                intent.raw_text = "，".join(parts)
+
+        return intents
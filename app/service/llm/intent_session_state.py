@@ -0,0 +1,144 @@
+"""
+会话级意图状态
+每轮对话结束时增量更新一次，上下文意图推断只需读取状态，无需重新扫描历史
+"""
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from .intent_detection_service import Intent, IntentType
+
+
+# 可以被后续消息承接的意图及其承接指示词
+FOLLOW_UP_MARKERS: Dict[IntentType, Tuple[str, ...]] = {
+    IntentType.KB_SEARCH: ("这个", "它", "还有"),
+    IntentType.VIRTUAL_HUMAN: ("继续", "再"),
+}
+
+
+@dataclass
+class IntentSessionState:
+    """单个会话的意图状态"""
+    last_intent: Optional[IntentType] = None
+    turn: int = 0
+    # 未关闭的承接槽位：意图类型 -> 权重（每轮衰减）
+    open_slots: Dict[IntentType, float] = field(default_factory=dict)
+    updated_at: float = field(default_factory=time.time)
+
+    def advance(self, intents: List[Intent], decay: float = 0.5, min_weight: float = 0.2):
+        """
+        推进一轮对话：衰减已有槽位，并为本轮识别出的可承接意图打开槽位
+
+        Args:
+            intents: 本轮识别出的意图（按置信度降序）
+            decay: 每轮的衰减系数
+            min_weight: 低于此权重的槽位被关闭
+        """
+        self.turn += 1
+        self.updated_at = time.time()
+
+        slots = {}
+        for intent_type, weight in self.open_slots.items():
+            weight *= decay
+            if weight >= min_weight:
+                slots[intent_type] = weight
+
+        for intent in intents:
+            if intent.type in FOLLOW_UP_MARKERS:
+                slots[intent.type] = 1.0
+
+        self.open_slots = slots
+        if intents:
+            self.last_intent = intents[0].type
+
+    def infer_follow_ups(self, message: str, base_confidence: float = 0.6) -> List[Intent]:
+        """
+        根据打开的槽位推断当前消息承接的意图
+
+        Args:
+            message: 当前用户消息
+            base_confidence: 槽位权重为1时的置信度
+
+        Returns:
+            推断出的意图列表
+        """
+        intents = []
+        for intent_type, weight in self.open_slots.items():
+            if any(marker in message for marker in FOLLOW_UP_MARKERS[intent_type]):
+                intents.append(Intent(
+                    type=intent_type,
+                    confidence=round(base_confidence * weight, 3),
+                    params={"context_inferred": True, "slot_weight": round(weight, 3)},
+                    raw_text=message
+                ))
+        return intents
+
+
+class IntentSessionStore:
+    """会话意图状态存储（按最近使用淘汰）"""
+
+    def __init__(self, max_sessions: int = 1024, decay: float = 0.5, min_weight: float = 0.2,
+                 ttl: float = 1800):
+        """
+        初始化会话状态存储
+
+        Args:
+            max_sessions: 最多保留的会话数
+            decay: 槽位每轮衰减系数
+            min_weight: 槽位关闭阈值
+            ttl: 会话状态闲置过期时间（秒）
+        """
+        self.max_sessions = max_sessions
+        self.decay = decay
+        self.min_weight = min_weight
+        self.ttl = ttl
+        self._states: "OrderedDict[str, IntentSessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[IntentSessionState]:
+        """获取会话状态，不存在或已过期时返回None"""
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                return None
+            if time.time() - state.updated_at > self.ttl:
+                del self._states[session_id]
+                return None
+            self._states.move_to_end(session_id)
+            return state
+
+    def put(self, session_id: str, state: IntentSessionState):
+        """保存会话状态"""
+        with self._lock:
+            self._states[session_id] = state
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+
+    def observe(self, session_id: str, intents: List[Intent]) -> IntentSessionState:
+        """
+        记录一轮对话的意图（每轮调用一次）
+
+        Args:
+            session_id: 会话ID
+            intents: 本轮识别出的意图
+
+        Returns:
+            更新后的会话状态
+        """
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None or time.time() - state.updated_at > self.ttl:
+                state = IntentSessionState()
+            state.advance(intents, self.decay, self.min_weight)
+            self._states[session_id] = state
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+            return state
+
+    def reset(self, session_id: str):
+        """清除会话状态"""
+        with self._lock:
+            self._states.pop(session_id, None)
@@ -2,37 +2,193 @@
 意图处理同步适配器
 用于在同步环境（如Flask）中调用异步的意图处理器
 """
+import os
 import asyncio
-from typing import Dict, Any, Optional
-from concurrent.futures import ThreadPoolExecutor
+import atexit
+import queue
+import time
 import threading
+import dotenv
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Coroutine, Dict, Any, Iterator, List, Optional
+from .loop_monitor import loop_monitor
+
+
+class EventLoopWorker:
+    """在独立线程中运行的事件循环，记录在途任务数和调度延迟"""
+    
+    def __init__(self, index: int, lag_interval: float = 0.5):
+        """
+        初始化事件循环线程
+        
+        Args:
+            index: 编号
+            lag_interval: 调度延迟采样间隔（秒）
+        """
+        self.index = index
+        self.lag_interval = lag_interval
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.inflight = 0
+        self.submitted = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+    
+    def start(self):
+        """启动事件循环线程并等待其就绪"""
+        self.thread = threading.Thread(target=self._run, name=f"intent-loop-{self.index}", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+    
+    def _run(self):
+        """线程主函数：运行事件循环，停止后取消剩余任务并关闭循环"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.loop = loop
+        loop.create_task(self._measure_lag())
+        self._ready.set()
+        
+        try:
+            loop.run_forever()
+        finally:
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+    
+    async def _measure_lag(self):
+        """周期性测量调度延迟：定时器实际唤醒时间与预期时间之差"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            loop_monitor.record_lag(self.thread.name, lag)
+    
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        将协程提交到该事件循环
+        
+        Args:
+            coro: 协程
+            
+        Returns:
+            concurrent.futures.Future
+        """
+        with self._lock:
+            self.inflight += 1
+            self.submitted += 1
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(self._on_done)
+        return future
+    
+    def _on_done(self, _future: Future):
+        with self._lock:
+            self.inflight -= 1
+    
+    def stop(self, timeout: float = 5.0):
+        """停止事件循环并等待线程退出"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+    
+    def stats(self) -> Dict[str, Any]:
+        """获取事件循环统计信息"""
+        return {
+            "index": self.index,
+            "inflight": self.inflight,
+            "submitted": self.submitted,
+            "lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2)
+        }
 
 
 class IntentSyncAdapter:
     """同步适配器"""
     
-    def __init__(self):
-        """初始化适配器"""
-        self._loop = None
-        self._thread = None
-        self._executor = ThreadPoolExecutor(max_workers=1)
-        self._start_event_loop()
+    # 没有截止时间配置时的默认超时（秒）
+    DEFAULT_TIMEOUT = 30
+    # 截止时间之后等待合并结果的余量（秒）
+    DEADLINE_GRACE = 1.0
     
-    def _start_event_loop(self):
-        """在后台线程中启动事件循环"""
-        def run_loop():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            self._loop = loop
-            loop.run_forever()
+    def __init__(self, loop_count: Optional[int] = None):
+        """
+        初始化适配器
         
-        self._thread = threading.Thread(target=run_loop, daemon=True)
-        self._thread.start()
+        Args:
+            loop_count: 事件循环数量，默认使用配置（未配置时按CPU核数）
+        """
+        self._load_adapter_config()
+        if loop_count:
+            self.loop_count = loop_count
+        
+        self._workers: List[EventLoopWorker] = []
+        self._dispatch_lock = threading.Lock()
+        self._next_worker = 0
+        self._closed = False
+        # 因超时或客户端断开而取消的请求数
+        self.cancelled = 0
+        self._start_event_loops()
+    
+    def _load_adapter_config(self):
+        """加载事件循环配置"""
+        intent_config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
+                                          "config", "config_intent.env")
+        
+        # 设置配置属性默认值
+        self.loop_count = 0
+        self.loop_lag_interval = 0.5
         
-        # 等待事件循环启动
-        while self._loop is None:
-            import time
-            time.sleep(0.01)
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(intent_config_path):
+            intent_config = dotenv.dotenv_values(intent_config_path)
+            
+            self.loop_count = int(intent_config.get("INTENT_LOOP_COUNT", self.loop_count))
+            self.loop_lag_interval = float(intent_config.get("INTENT_LOOP_LAG_INTERVAL", self.loop_lag_interval))
+        
+        # 0 表示按CPU核数自动设置
+        if self.loop_count <= 0:
+            self.loop_count = min(os.cpu_count() or 1, 8)
+    
+    def _start_event_loops(self):
+        """在后台线程中启动事件循环"""
+        for index in range(self.loop_count):
+            worker = EventLoopWorker(index, self.loop_lag_interval)
+            worker.start()
+            self._workers.append(worker)
+    
+    def _select_worker(self) -> EventLoopWorker:
+        """选择在途任务最少的事件循环，相同时轮转"""
+        with self._dispatch_lock:
+            count = len(self._workers)
+            start = self._next_worker
+            self._next_worker = (start + 1) % count
+            candidates = [self._workers[(start + offset) % count] for offset in range(count)]
+        return min(candidates, key=lambda worker: worker.inflight)
+    
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        将协程提交到负载最低的事件循环
+        
+        Args:
+            coro: 协程
+            
+        Returns:
+            concurrent.futures.Future
+        """
+        if self._closed:
+            coro.close()
+            raise RuntimeError("意图处理适配器已关闭")
+        return self._select_worker().submit(coro)
     
     def process_message_sync(
         self, 
@@ -53,17 +209,24 @@ class IntentSyncAdapter:
         Returns:
             处理结果
         """
-        # 在事件循环中执行异步函数
-        future = asyncio.run_coroutine_threadsafe(
-            handler_manager.process_message(message, context, parallel),
-            self._loop
+        # 设置请求截止时间，处理器管理器按截止时间返回部分结果
+        context = context if context is not None else {}
+        deadline = context.setdefault(
+            "deadline",
+            time.monotonic() + getattr(handler_manager, "request_timeout", self.DEFAULT_TIMEOUT)
         )
         
+        future = None
         try:
-            # 等待结果，设置超时时间
-            result = future.result(timeout=30)
+            # 在负载最低的事件循环中执行异步函数
+            future = self.submit(handler_manager.process_message(message, context, parallel))
+            
+            # 等待结果，超时时间为截止时间加上合并结果的余量
+            result = future.result(timeout=max(0.0, deadline - time.monotonic()) + self.DEADLINE_GRACE)
             return result
-        except asyncio.TimeoutError:
+        except FutureTimeoutError:
+            # 取消仍在事件循环上运行的协程，取消会传递到各处理器
+            self._cancel(future)
             return {
                 "success": False,
                 "response": "处理超时，请稍后重试。",
@@ -76,14 +239,98 @@ class IntentSyncAdapter:
                 "error": str(e)
             }
     
+    def stream_message_sync(
+        self,
+        handler_manager,
+        message: str,
+        context: Optional[Dict] = None,
+        parallel: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        同步方式流式处理消息，逐个产出处理器管理器的流式事件
+        
+        Args:
+            handler_manager: 意图处理器管理器
+            message: 用户消息
+            context: 上下文
+            parallel: 是否并行处理
+            
+        Yields:
+            处理事件 {"event": 事件名, "data": 数据}，最后一个事件总是 final
+        """
+        context = context if context is not None else {}
+        deadline = context.setdefault(
+            "deadline",
+            time.monotonic() + getattr(handler_manager, "request_timeout", self.DEFAULT_TIMEOUT)
+        )
+        
+        events: "queue.Queue" = queue.Queue()
+        finished = object()
+        
+        async def pump():
+            try:
+                async for event in handler_manager.process_message_stream(message, context, parallel):
+                    events.put(event)
+            except Exception as e:
+                events.put({
+                    "event": "final",
+                    "data": {"success": False, "response": f"处理失败：{str(e)}", "error": str(e)}
+                })
+            finally:
+                events.put(finished)
+        
+        try:
+            future = self.submit(pump())
+        except RuntimeError as e:
+            yield {"event": "final", "data": {"success": False, "response": f"处理失败：{str(e)}", "error": str(e)}}
+            return
+        
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=max(0.0, deadline - time.monotonic()) + self.DEADLINE_GRACE)
+                except queue.Empty:
+                    yield {
+                        "event": "final",
+                        "data": {"success": False, "response": "处理超时，请稍后重试。", "error": "Timeout"}
+                    }
+                    return
+                if event is finished:
+                    return
+                yield event
+        finally:
+            # 超时或客户端断开（生成器被关闭）时取消未完成的处理
+            if not future.done():
+                self._cancel(future)
+    
+    def _cancel(self, future: Optional[Future]):
+        """取消事件循环上仍在运行的请求协程"""
+        if future is not None and future.cancel():
+            self.cancelled += 1
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        获取事件循环运行指标
+        
+        Returns:
+            各事件循环的在途任务数、调度延迟分位数和慢回调记录
+        """
+        return {
+            "loop_count": len(self._workers),
+            "cancelled_requests": self.cancelled,
+            "loops": [worker.stats() for worker in self._workers],
+            "monitor": loop_monitor.stats()
+        }
+    
     def cleanup(self):
-        """清理资源"""
-        if self._loop:
-            self._loop.call_soon_threadsafe(self._loop.stop)
-        if self._thread:
-            self._thread.join(timeout=1)
-        self._executor.shutdown(wait=False)
+        """清理资源：停止所有事件循环，取消未完成的任务"""
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            worker.stop()
 
 
 # 创建全局适配器实例
-intent_sync_adapter = IntentSyncAdapter() 
\ No newline at end of file
+intent_sync_adapter = IntentSyncAdapter()
+atexit.register(intent_sync_adapter.cleanup)
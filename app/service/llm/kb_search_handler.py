@@ -3,22 +3,37 @@
 处理知识库查询相关的请求
 """
 import os
+import heapq
+import asyncio
 import dotenv
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from .intent_handler_base import IntentHandlerBase
 from .intent_detection_service import Intent, IntentType
+from .result_cache import CachePolicy
+from ..kb import kb_service, keyword_extractor, faq_store, extractive_summarizer
+
+
+def _search_query_key(intent: Intent, message: str, context: Optional[Dict] = None) -> str:
+    """知识库检索结果的缓存键：实际使用的检索词"""
+    return " ".join(intent.params.get("search_terms", [])) or message
 
 
 class KBSearchHandler(IntentHandlerBase):
     """知识库检索处理器"""
     
+    # 检索结果可作为聊天回答的参考资料
+    outputs = ("knowledge",)
+    
+    # 相同检索词的结果缓存5分钟，未找到的结果缓存30秒
+    cache_policy = CachePolicy(key=_search_query_key, ttl=300, max_entries=512, negative_ttl=30)
+    
     def __init__(self):
         super().__init__()
         # 加载知识库配置
         self._load_kb_config()
         
-        # TODO: 初始化知识库连接或服务
-        self.kb_service = None  # 暂时为None，实际使用时需要注入
+        # 使用本地知识库作为检索后端（KB_BACKEND=local），否则需要外部注入
+        self.kb_service = kb_service if kb_service.enabled else None
     
     def _load_kb_config(self):
         """加载知识库配置"""
@@ -35,6 +50,9 @@ class KBSearchHandler(IntentHandlerBase):
         self.kb_query_model = "gpt-3.5-turbo"
         self.kb_summarize_model = "gpt-4"
         self.kb_debug = False
+        self.kb_search_timeout = 3.0
+        self.kb_llm_keywords = False
+        self.kb_llm_summary = False
         
         # 如果配置文件存在，则加载配置
         if os.path.exists(kb_config_path):
@@ -51,6 +69,9 @@ class KBSearchHandler(IntentHandlerBase):
             self.kb_query_model = kb_config.get("KB_QUERY_MODEL", self.kb_query_model)
             self.kb_summarize_model = kb_config.get("KB_SUMMARIZE_MODEL", self.kb_summarize_model)
             self.kb_debug = kb_config.get("KB_DEBUG", "false").lower() == "true"
+            self.kb_search_timeout = float(kb_config.get("KB_SEARCH_TIMEOUT", self.kb_search_timeout))
+            self.kb_llm_keywords = kb_config.get("KB_LLM_KEYWORDS", "false").lower() == "true"
+            self.kb_llm_summary = kb_config.get("KB_LLM_SUMMARY", "false").lower() == "true"
         
     def can_handle(self, intent: Intent) -> bool:
         """判断是否可以处理该意图"""
@@ -79,15 +100,43 @@ class KBSearchHandler(IntentHandlerBase):
             else:
                 search_query = " ".join(search_terms)
             
+            # 先查常见问题：近似重复的问题直接返回预设答案，不检索知识库也不调用模型
+            question = intent.raw_text or message
+            faq = faq_store.match(question)
+            if faq:
+                return self._faq_result(faq, search_query)
+            
             # 调用知识库检索服务
-            search_results = await self._search_knowledge_base(search_query, context)
+            search_results, failed_kbs = await self._search_knowledge_base(search_query, context)
+            
+            # 所有知识库都失败或超时：返回错误（不缓存），不能当作"未找到"；
+            # 只有部分知识库失败时按正常流程返回（可能为空）的结果，并标记为降级
+            if failed_kbs and len(failed_kbs) == len(self.kb_ids):
+                return {
+                    "success": False,
+                    "response": "抱歉，知识库暂时无法访问，请稍后再试。",
+                    "error": f"所有知识库检索失败或超时: {', '.join(kb['kb_id'] for kb in failed_kbs)}",
+                    "data": {
+                        "intent_type": "kb_search",
+                        "search_query": search_query,
+                        "results_count": 0,
+                        "results": [],
+                        "failed_kbs": failed_kbs
+                    },
+                    "degraded": True,
+                    "need_continue": True
+                }
             
             # 格式化响应
             if search_results:
-                response = await self._format_search_results(search_results)
+                response = await self._format_search_results(search_results, question, context)
             else:
                 response = f"抱歉，在知识库中没有找到关于 '{search_query}' 的相关信息。"
             
+            # 同一问题多次从知识库得到答案后自动加入常见问题
+            if search_results and not failed_kbs and search_results[0].get("source") != "系统提示":
+                faq_store.record_answer(question, response)
+            
             return {
                 "success": True,
                 "response": response,
@@ -95,8 +144,10 @@ class KBSearchHandler(IntentHandlerBase):
                     "intent_type": "kb_search",
                     "search_query": search_query,
                     "results_count": len(search_results),
-                    "results": search_results
+                    "results": search_results,
+                    "failed_kbs": failed_kbs
                 },
+                "degraded": bool(failed_kbs),  # 部分知识库失败或超时，结果不完整
                 "need_continue": True  # 可能需要继续处理其他意图
             }
             
@@ -108,7 +159,39 @@ class KBSearchHandler(IntentHandlerBase):
                 "need_continue": False
             }
     
-    async def _search_knowledge_base(self, query: str, context: Optional[Dict] = None) -> List[Dict]:
+    @staticmethod
+    def _faq_result(faq: Dict[str, Any], search_query: str) -> Dict[str, Any]:
+        """
+        将命中的常见问题包装为处理结果
+        
+        Args:
+            faq: faq_store.match 的返回值
+            search_query: 检索词
+            
+        Returns:
+            处理结果（答案同时作为一条检索结果，供聊天回答引用）
+        """
+        return {
+            "success": True,
+            "response": faq["answer"],
+            "data": {
+                "intent_type": "kb_search",
+                "search_query": search_query,
+                "results_count": 1,
+                "results": [{
+                    "id": faq["id"],
+                    "title": faq["question"],
+                    "content": faq["answer"],
+                    "score": faq["similarity"],
+                    "source": faq["source"]
+                }],
+                "failed_kbs": [],
+                "faq": True
+            },
+            "need_continue": True
+        }
+    
+    async def _search_knowledge_base(self, query: str, context: Optional[Dict] = None) -> Tuple[List[Dict], List[Dict]]:
         """
         执行知识库检索
         
@@ -117,18 +200,24 @@ class KBSearchHandler(IntentHandlerBase):
             context: 上下文
             
         Returns:
-            搜索结果列表
+            (搜索结果列表, 失败或超时的知识库列表)，所有知识库都失败时结果为空
         """
-        # 从上下文中获取LLM服务（如果有）
-        llm_service = context.get("llm_service") if context else None
-        
-        # 使用LLM提取搜索关键词
+        # 在本地提取搜索关键词（逆文档频率取自知识库语料）
         extracted_keywords = []
-        if llm_service:
+        if self.kb_service is kb_service:
+            extracted_keywords = keyword_extractor.extract(query, self.kb_ids)
+            if self.kb_debug:
+                print(f"本地提取的关键词: {extracted_keywords}")
+        
+        # 可选：使用LLM进一步提炼关键词（需要 KB_LLM_KEYWORDS=true 且上下文中有LLM服务）
+        llm_service = context.get("llm_service") if context else None
+        if self.kb_llm_keywords and llm_service:
             try:
                 # 使用LLM服务提取关键词
                 system_prompt = "你是一个专业的搜索关键词提取助手。你的任务是从用户的问题中提取最相关的搜索关键词，以便在知识库中搜索。"
                 prompt = f"从以下问题中提取3-5个最相关的搜索关键词（以逗号分隔）：\n\n'{query}'"
+                if extracted_keywords:
+                    prompt += f"\n\n候选关键词：{'，'.join(extracted_keywords)}"
                 
                 keywords_text = await llm_service.get_response(
                     system_prompt=system_prompt, 
@@ -137,7 +226,7 @@ class KBSearchHandler(IntentHandlerBase):
                 )
                 
                 if keywords_text:
-                    extracted_keywords = [k.strip() for k in keywords_text.split(',')]
+                    extracted_keywords = [k.strip() for k in keywords_text.split(',') if k.strip()]
                     
                     if self.kb_debug:
                         print(f"提取的关键词: {extracted_keywords}")
@@ -150,38 +239,113 @@ class KBSearchHandler(IntentHandlerBase):
             search_query = " ".join(extracted_keywords)
         
         if self.kb_service:
-            # 使用实际的知识库服务
-            try:
-                return await self.kb_service.search(
-                    query=search_query,
-                    kb_ids=self.kb_ids,
-                    max_results=self.kb_max_results,
-                    threshold=self.kb_relevance_threshold
-                )
-            except Exception as e:
-                print(f"知识库搜索失败: {str(e)}")
-                # 返回知识库未创建的提示信息
-                return [{
-                    "title": "知识库未创建",
-                    "content": "知识库服务尚未创建，这是一个待完成的功能。",
-                    "score": 1.0,
-                    "source": "系统提示"
-                }]
-        else:
-            # 返回知识库未创建的提示信息
-            return [{
-                "title": "知识库未创建",
-                "content": "知识库服务尚未创建，这是一个待完成的功能。",
-                "score": 1.0,
-                "source": "系统提示"
-            }]
+            # 并发检索各个知识库，单个知识库失败或超时只影响它自己的结果
+            results, failed_kbs = await self._fan_out_search(search_query, context)
+            if failed_kbs and len(failed_kbs) == len(self.kb_ids):
+                print(f"知识库搜索失败: {failed_kbs}")
+            return results, failed_kbs
+        
+        # 没有配置知识库服务时返回知识库未创建的提示信息
+        return [{
+            "title": "知识库未创建",
+            "content": "知识库服务尚未创建，这是一个待完成的功能。",
+            "score": 1.0,
+            "source": "系统提示"
+        }], []
+    
+    async def _fan_out_search(self, query: str, context: Optional[Dict] = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        并发检索所有知识库，归一化得分后合并为前 kb_max_results 个结果
+        
+        Args:
+            query: 搜索查询
+            context: 上下文（截止时间用于限制单个知识库的超时）
+            
+        Returns:
+            (按相关度降序排列的结果, 失败或超时的知识库列表)
+        """
+        timeout = self.kb_search_timeout
+        remaining = self.time_remaining(context)
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        
+        outcomes = await asyncio.gather(
+            *(self._search_one(kb_id, query, timeout) for kb_id in self.kb_ids),
+            return_exceptions=True
+        )
+        
+        # 同一文档出现在多个知识库中时只保留得分最高的一份
+        best: Dict[Any, Dict] = {}
+        failed_kbs = []
+        for kb_id, outcome in zip(self.kb_ids, outcomes):
+            if isinstance(outcome, BaseException):
+                error = "Timeout" if isinstance(outcome, asyncio.TimeoutError) else str(outcome)
+                failed_kbs.append({"kb_id": kb_id, "error": error})
+                continue
+            for result in self._normalize_scores(outcome):
+                if result["score"] < self.kb_relevance_threshold:
+                    continue
+                identity = result.get("id") or (result.get("title"), result.get("content"))
+                if identity not in best or result["score"] > best[identity]["score"]:
+                    best[identity] = result
+        
+        # 有界小顶堆：只保留得分最高的 kb_max_results 个结果（得分相同时按知识库顺序）
+        heap: List[Tuple[float, int, Dict]] = []
+        for order, result in enumerate(best.values()):
+            entry = (result["score"], -order, result)
+            if len(heap) < self.kb_max_results:
+                heapq.heappush(heap, entry)
+            else:
+                heapq.heappushpop(heap, entry)
+        
+        if failed_kbs and self.kb_debug:
+            print(f"部分知识库检索失败: {failed_kbs}")
+        
+        return [entry[2] for entry in sorted(heap, reverse=True)], failed_kbs
+    
+    async def _search_one(self, kb_id: str, query: str, timeout: float) -> List[Dict]:
+        """在单个知识库中检索（带超时）"""
+        results = await asyncio.wait_for(
+            self.kb_service.search(
+                query=query,
+                kb_ids=[kb_id],
+                max_results=self.kb_max_results,
+                threshold=self.kb_relevance_threshold
+            ),
+            timeout=timeout
+        )
+        for result in results:
+            result.setdefault("kb_id", kb_id)
+        return results
     
-    async def _format_search_results(self, results: List[Dict]) -> str:
+    @staticmethod
+    def _normalize_scores(results: List[Dict]) -> List[Dict]:
+        """
+        将单个知识库的得分归一化到0~1，使不同知识库的结果可以直接比较
+        
+        已经在0~1范围内的得分（如本地知识库的相对得分）保持不变；
+        超出范围的原始得分（如外部服务返回的BM25得分）按该知识库的最高分缩放，原始得分保存在 raw_score 中。
+        """
+        top = max((result.get("score", 0.0) for result in results), default=0.0)
+        if top <= 1.0:
+            return results
+        normalized = []
+        for result in results:
+            raw_score = result.get("score", 0.0)
+            normalized.append({**result, "score": raw_score / top, "raw_score": raw_score})
+        return normalized
+    
+    async def _format_search_results(self, results: List[Dict], query: str = "",
+                                     context: Optional[Dict] = None) -> str:
         """
         格式化搜索结果为用户友好的响应
         
+        默认在本地抽取与问题最相关的句子作为回答；KB_LLM_SUMMARY=true 且上下文中有LLM服务时改用模型总结。
+        
         Args:
             results: 搜索结果列表
+            query: 用户问题
+            context: 上下文
             
         Returns:
             格式化的响应文本
@@ -203,12 +367,12 @@ class KBSearchHandler(IntentHandlerBase):
             
             contents.append(f"标题: {title}\n内容: {content}\n相关度: {score:.2f}\n来源: {source}")
         
-        # 将结果传递给LLM进行总结
+        # 可选：将结果传递给LLM进行总结
         try:
             # 从上下文中获取LLM服务（如果有）
             llm_service = context.get("llm_service") if context else None
             
-            if llm_service:
+            if self.kb_llm_summary and llm_service:
                 system_prompt = "你是一个专业的知识总结助手。你的任务是基于检索到的知识库内容，为用户提供准确、全面的回答。"
                 prompt = f"基于以下知识库检索结果，请为用户提供一个全面、清晰的回答。请仅使用这些检索结果中的信息回答，不要添加未提及的内容。\n\n"
                 prompt += "检索结果:\n"
@@ -227,7 +391,17 @@ class KBSearchHandler(IntentHandlerBase):
         except Exception as e:
             print(f"总结搜索结果时出错: {str(e)}")
         
-        # 如果LLM总结失败，则返回格式化的结果
+        # 本地抽取式摘要：句子打分在线程池中执行，不阻塞事件循环
+        summary = await self.run_in_pool(extractive_summarizer.summarize, query, results)
+        if summary:
+            sources = []
+            for result in results:
+                source = result.get("title") or result.get("source")
+                if source and source not in sources:
+                    sources.append(source)
+            return f"{summary}\n\n参考来源：{'、'.join(sources[:5])}"
+        
+        # 没有可用的句子时，返回格式化的结果
         response_parts = ["为您找到以下相关信息：\n"]
         
         for i, result in enumerate(results[:5], 1):  # 最多显示5个结果
@@ -0,0 +1,163 @@
+"""
+事件循环监控
+采样各事件循环的调度延迟，并按处理器名称记录单步执行时间过长（阻塞事件循环）的协程
+"""
+import os
+import time
+import types
+import threading
+import dotenv
+from collections import deque
+from typing import Any, Coroutine, Deque, Dict, List, Tuple
+
+
+class LoopMonitor:
+    """事件循环调度延迟与慢回调监控"""
+
+    # 慢回调明细最多保留的条数
+    MAX_RECENT_SLOW = 50
+
+    def __init__(self):
+        """初始化监控器"""
+        self._load_monitor_config()
+        self._lock = threading.Lock()
+        self._lag_samples: Dict[str, Deque[float]] = {}
+        self._slow_counts: Dict[str, int] = {}
+        self._slow_max: Dict[str, float] = {}
+        self._recent_slow: Deque[Dict[str, Any]] = deque(maxlen=self.MAX_RECENT_SLOW)
+
+    def _load_monitor_config(self):
+        """加载监控配置"""
+        intent_config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                                          "config", "config_intent.env")
+
+        # 设置配置属性默认值
+        self.slow_callback_threshold = 0.1
+        self.lag_sample_size = 1024
+
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(intent_config_path):
+            intent_config = dotenv.dotenv_values(intent_config_path)
+
+            slow_ms = float(intent_config.get("LOOP_SLOW_CALLBACK_MS", self.slow_callback_threshold * 1000))
+            self.slow_callback_threshold = slow_ms / 1000
+            self.lag_sample_size = int(intent_config.get("LOOP_LAG_SAMPLES", self.lag_sample_size))
+
+    def record_lag(self, loop_name: str, lag: float):
+        """
+        记录一次调度延迟采样
+
+        Args:
+            loop_name: 事件循环名称
+            lag: 延迟（秒）
+        """
+        with self._lock:
+            samples = self._lag_samples.get(loop_name)
+            if samples is None:
+                samples = self._lag_samples[loop_name] = deque(maxlen=self.lag_sample_size)
+            samples.append(lag)
+
+    def record_step(self, name: str, duration: float):
+        """
+        记录协程单步执行时间，超过阈值时记为慢回调
+
+        Args:
+            name: 协程名称（通常为处理器名称）
+            duration: 本步占用事件循环的时间（秒）
+        """
+        if duration < self.slow_callback_threshold:
+            return
+
+        loop_name = threading.current_thread().name
+        print(f"事件循环阻塞 {duration * 1000:.1f}ms: {name} ({loop_name})")
+        with self._lock:
+            self._slow_counts[name] = self._slow_counts.get(name, 0) + 1
+            self._slow_max[name] = max(self._slow_max.get(name, 0.0), duration)
+            self._recent_slow.append({
+                "name": name,
+                "loop": loop_name,
+                "duration_ms": round(duration * 1000, 2),
+                "time": time.time()
+            })
+
+    def monitor(self, coro: Coroutine, name: str) -> Coroutine:
+        """
+        包装协程，记录它每一步占用事件循环的时间
+
+        Args:
+            coro: 协程
+            name: 用于报告的名称
+
+        Returns:
+            包装后的协程
+        """
+        return self._drive(coro, name)
+
+    @types.coroutine
+    def _drive(self, coro: Coroutine, name: str):
+        """逐步驱动原协程，并对每一步（两次挂起之间）计时"""
+        value, error = None, None
+        while True:
+            started = time.perf_counter()
+            try:
+                if error is not None:
+                    signal = coro.throw(error)
+                else:
+                    signal = coro.send(value)
+            except StopIteration as stop:
+                self.record_step(name, time.perf_counter() - started)
+                return stop.value
+            except BaseException:
+                self.record_step(name, time.perf_counter() - started)
+                raise
+            self.record_step(name, time.perf_counter() - started)
+
+            try:
+                value, error = (yield signal), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+    @staticmethod
+    def _percentiles(samples: List[float]) -> Dict[str, float]:
+        """计算延迟分位数（毫秒）"""
+        if not samples:
+            return {"samples": 0, "p50_ms": 0.0, "p90_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(samples)
+        last = len(ordered) - 1
+
+        def pick(q: float) -> float:
+            return round(ordered[min(last, int(q * len(ordered)))] * 1000, 2)
+
+        return {
+            "samples": len(ordered),
+            "p50_ms": pick(0.5),
+            "p90_ms": pick(0.9),
+            "p99_ms": pick(0.99),
+            "max_ms": round(ordered[last] * 1000, 2)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """获取监控统计：各事件循环的延迟分位数和慢回调记录"""
+        with self._lock:
+            lag_samples: List[Tuple[str, List[float]]] = [
+                (loop_name, list(samples)) for loop_name, samples in self._lag_samples.items()
+            ]
+            slow = {
+                name: {"count": count, "max_ms": round(self._slow_max[name] * 1000, 2)}
+                for name, count in self._slow_counts.items()
+            }
+            recent = list(self._recent_slow)
+
+        return {
+            "slow_callback_threshold_ms": round(self.slow_callback_threshold * 1000, 2),
+            "lag": {loop_name: self._percentiles(samples) for loop_name, samples in lag_samples},
+            "slow_callbacks": slow,
+            "recent_slow_callbacks": recent
+        }
+
+
+# 单例实例
+loop_monitor = LoopMonitor()
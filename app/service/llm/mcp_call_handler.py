@@ -298,10 +298,11 @@ class MCPCallHandler(IntentHandlerBase):
         if self.mcp_client:
             # 使用实际的MCP客户端
             try:
+                # 调用超时不超过请求剩余时间
                 return await self.mcp_client.call_function(
                     function_name,
                     params,
-                    timeout=self.mcp_timeout
+                    timeout=min(self.mcp_timeout, self.time_remaining(context, self.mcp_timeout))
                 )
             except Exception as e:
                 print(f"MCP调用失败: {str(e)}")
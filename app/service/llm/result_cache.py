@@ -0,0 +1,141 @@
+"""
+有界LRU缓存
+线程安全，支持可选的过期时间，并记录命中率统计
+"""
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """有界LRU缓存"""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大条目数，0表示禁用缓存
+            ttl: 默认过期时间（秒），None表示不过期
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        """缓存是否启用"""
+        return self.max_entries > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+            default: 未命中时的返回值
+
+        Returns:
+            缓存值或default
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 本条目的过期时间（秒），None时使用默认值
+        """
+        if not self.enabled:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+def default_cache_key(intent, message: str, context: Optional[Dict] = None) -> Hashable:
+    """默认缓存键：意图类型 + 消息 + 意图参数"""
+    return (intent.type.value, message, repr(sorted(intent.params.items())))
+
+
+def default_is_negative(result: Dict[str, Any]) -> bool:
+    """默认的"未找到"判断：处理成功但没有结果"""
+    data = result.get("data")
+    return isinstance(data, dict) and data.get("results_count") == 0
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    处理器结果缓存策略
+
+    处理出错、超时的结果（带 error）从不缓存；
+    处理成功但没有结果的"未找到"结果按 negative_ttl 缓存，negative_ttl 为0时不缓存。
+    """
+    # 缓存键函数 (intent, message, context) -> 可哈希的键
+    key: Callable[..., Hashable] = default_cache_key
+    # 正常结果的过期时间（秒）
+    ttl: float = 300
+    # 最大缓存条目数
+    max_entries: int = 256
+    # "未找到"结果的过期时间（秒）
+    negative_ttl: float = 30
+    # 判断结果是否为"未找到"的函数
+    is_negative: Callable[[Dict[str, Any]], bool] = default_is_negative
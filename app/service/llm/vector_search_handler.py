@@ -7,18 +7,26 @@ import dotenv
 from typing import Dict, Any, Optional, List
 from .intent_handler_base import IntentHandlerBase
 from .intent_detection_service import Intent, IntentType
+from .result_cache import CachePolicy
+from ..vector import vector_store
 
 
 class VectorSearchHandler(IntentHandlerBase):
     """向量库检索处理器"""
     
+    # 检索结果可作为聊天回答的参考资料
+    outputs = ("knowledge",)
+    
+    # 相同查询（及 top_k、阈值参数）的结果缓存5分钟，未找到的结果缓存30秒
+    cache_policy = CachePolicy(ttl=300, max_entries=512, negative_ttl=30)
+    
     def __init__(self):
         super().__init__()
         # 加载向量库配置
         self._load_vector_config()
         
-        # TODO: 初始化向量数据库连接或服务
-        self.vector_db = None  # 暂时为None，实际使用时需要注入
+        # 使用本地向量库作为检索后端（VECTOR_DB_TYPE=local），否则需要外部注入
+        self.vector_db = vector_store if vector_store.enabled else None
         self.embedding_service = None  # 嵌入向量生成服务
     
     def _load_vector_config(self):
@@ -28,7 +36,7 @@ class VectorSearchHandler(IntentHandlerBase):
                                      "config", "config_embedding.env")
         
         # 设置配置属性默认值
-        self.vector_db_type = "milvus"
+        self.vector_db_type = "local"
         self.vector_db_host = "localhost"
         self.vector_db_port = 19530
         self.vector_dimension = 768
@@ -78,6 +86,21 @@ class VectorSearchHandler(IntentHandlerBase):
             # 提取搜索参数
             params = intent.params
             
+            # 没有嵌入服务就无法生成查询向量，直接返回错误（不缓存），不能用随机向量检索
+            if self.embedding_service is None:
+                return {
+                    "success": False,
+                    "response": "抱歉，向量检索暂不可用：未配置嵌入服务。",
+                    "error": "未配置嵌入服务，无法生成查询向量",
+                    "data": {
+                        "intent_type": "vector_search",
+                        "query": message,
+                        "results_count": 0,
+                        "results": []
+                    },
+                    "need_continue": True
+                }
+            
             # 生成查询向量
             query_vector = await self._generate_embedding(message, context)
             
@@ -124,7 +147,13 @@ class VectorSearchHandler(IntentHandlerBase):
             
         Returns:
             嵌入向量
+            
+        Raises:
+            RuntimeError: 未配置嵌入服务
         """
+        if self.embedding_service is None:
+            raise RuntimeError("未配置嵌入服务，无法生成查询向量")
+        
         # 从上下文中获取LLM服务（如果有）
         llm_service = context.get("llm_service") if context else None
         
@@ -151,13 +180,7 @@ class VectorSearchHandler(IntentHandlerBase):
             except Exception as e:
                 print(f"优化查询时出错: {str(e)}")
         
-        if self.embedding_service:
-            # 使用实际的嵌入服务
-            return await self.embedding_service.embed(optimized_text, model=self.embedding_model)
-        else:
-            # 返回模拟的向量（实际使用时需要真实的嵌入模型）
-            import random
-            return [random.random() for _ in range(self.vector_dimension)]  # 模拟向量
+        return await self.embedding_service.embed(optimized_text, model=self.embedding_model)
     
     async def _vector_search(self, query_vector: List[float], top_k: int = 5, threshold: float = 0.7) -> List[Dict]:
         """
@@ -0,0 +1,11 @@
+"""
+自然语言处理服务包
+提供本地中文分词等文本处理功能
+"""
+from .word_segmenter import WordSegmenter, word_segmenter, DEFAULT_STOP_WORDS
+
+__all__ = [
+    'WordSegmenter',
+    'word_segmenter',
+    'DEFAULT_STOP_WORDS',
+]
@@ -0,0 +1,324 @@
+"""
+中文分词服务
+基于词典前缀树构建切分有向无环图，使用动态规划求最大概率切分路径
+
+内置的 core_dict.txt 只是约400个常用词的精简词表，覆盖检索和意图相关的常见词；
+生产环境应通过 SEGMENTER_DICT 指向完整的词频词典（格式与 jieba 的 dict.txt 相同）。
+
+词典更新（add_word、load_user_dict）不原地修改正在使用的前缀树：
+只复制插入路径上的节点生成新树，再与对数总词频一起整体替换，分词时始终读到一致的词典。
+"""
+import os
+import re
+import math
+import threading
+import dotenv
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# 前缀树节点中保存词频的键（空字符串不会与任何字符冲突）
+_FREQ_KEY = ""
+
+# 文本分块：连续汉字、连续字母数字、其他单个字符
+_BLOCK_PATTERN = re.compile(r"([\u4e00-\u9fff\u3400-\u4dbf]+)|([A-Za-z0-9][A-Za-z0-9_.+#\-]*)|(\S)")
+_HAN_PATTERN = re.compile(r"[\u4e00-\u9fff\u3400-\u4dbf]")
+
+# 提取检索词时默认过滤的停用词
+DEFAULT_STOP_WORDS = frozenset([
+    "的", "了", "是", "在", "和", "与", "跟", "就", "也", "都", "还", "吗", "呢", "吧", "啊", "呀",
+    "我", "你", "他", "她", "它", "我们", "你们", "他们", "这", "那", "这个", "那个", "这些", "那些",
+    "一下", "一些", "一个", "什么", "怎么", "怎么样", "为什么", "哪些", "哪个", "多少",
+    "请", "请问", "帮我", "帮忙", "告诉", "告诉我", "可以", "能不能", "是不是", "有没有",
+    "查询", "搜索", "检索", "查找", "查一下", "找一下", "看一下", "了解", "知道",
+    "然后", "接着", "之后", "并且", "同时", "另外", "顺便", "还有", "最后",
+    "讲讲", "说说", "聊聊", "看看",
+])
+
+
+class WordSegmenter:
+    """词典前缀树 + 最大概率路径的中文分词器"""
+
+    # 相邻未登录单字合并成词的最大长度
+    MAX_UNKNOWN_WORD_LENGTH = 4
+
+    def __init__(self, dict_path: Optional[str] = None, user_dict_paths: Iterable[str] = ()):
+        """
+        初始化分词器（词典在首次分词时加载）
+
+        Args:
+            dict_path: 核心词典路径，默认使用配置或内置词典
+            user_dict_paths: 用户词典路径列表
+        """
+        self._load_segmenter_config()
+        if dict_path:
+            self.dict_path = dict_path
+        if user_dict_paths:
+            self.user_dict_paths = list(user_dict_paths)
+
+        # (前缀树, 对数总词频)，只整体替换，不原地修改
+        self._dictionary: Tuple[Dict, float] = ({}, 0.0)
+        # 总词频，只在持有 _init_lock 时读写
+        self._total = 0
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _load_segmenter_config(self):
+        """加载分词配置"""
+        app_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        nlp_config_path = os.path.join(app_dir, "config", "config_nlp.env")
+
+        # 设置配置属性默认值
+        self.dict_path = os.path.join(os.path.dirname(__file__), "dict", "core_dict.txt")
+        self.user_dict_paths: List[str] = []
+
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(nlp_config_path):
+            nlp_config = dotenv.dotenv_values(nlp_config_path)
+
+            dict_path = nlp_config.get("SEGMENTER_DICT")
+            if dict_path:
+                self.dict_path = self._resolve_path(dict_path, app_dir)
+
+            user_dicts = nlp_config.get("SEGMENTER_USER_DICTS", "")
+            self.user_dict_paths = [
+                self._resolve_path(p.strip(), app_dir) for p in user_dicts.split(",") if p.strip()
+            ]
+
+    @staticmethod
+    def _resolve_path(path: str, base_dir: str) -> str:
+        """相对路径以 app 目录为基准"""
+        return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    def initialize(self):
+        """加载核心词典和用户词典（线程安全，只执行一次）"""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            trie: Dict = {}
+            self._load_dictionary(trie, self.dict_path, copy_path=False)
+            for path in self.user_dict_paths:
+                self._load_dictionary(trie, path, copy_path=False)
+            self._publish(trie)
+            self._initialized = True
+
+    def _publish(self, trie: Dict):
+        """替换当前词典（调用方持有 _init_lock）"""
+        self._dictionary = (trie, math.log(self._total) if self._total else 0.0)
+
+    def _load_dictionary(self, trie: Dict, path: str, copy_path: bool = True):
+        """
+        读取词典文件并插入前缀树
+
+        词典每行格式为 "词语 [词频] [词性]"，以 # 开头的行为注释。
+
+        Args:
+            trie: 要插入的前缀树（根节点须为调用方私有）
+            path: 词典文件路径
+            copy_path: 是否复制插入路径上的节点（前缀树与正在使用的词典共享节点时必须为True）
+        """
+        if not os.path.exists(path):
+            print(f"分词词典不存在: {path}")
+            return
+
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                parts = line.split()
+                freq = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+                self._insert(trie, parts[0], freq, copy_path)
+
+    def _insert(self, trie: Dict, word: str, freq: Optional[int] = None, copy_path: bool = True):
+        """插入词语，未指定词频时使用使该词能被完整切出的最小词频"""
+        if freq is None:
+            freq = self._suggest_freq(trie, word)
+
+        node = trie
+        for char in word:
+            child = node.get(char)
+            if child is None:
+                child = {}
+            elif copy_path:
+                child = dict(child)
+            node[char] = child
+            node = child
+
+        self._total += freq - node.get(_FREQ_KEY, 0)
+        node[_FREQ_KEY] = freq
+
+    def _suggest_freq(self, trie: Dict, word: str) -> int:
+        """估算保证该词被完整切出所需的词频"""
+        if not self._total:
+            return 1
+        prob = 1.0
+        for piece in self._cut_block(word, trie, math.log(self._total)):
+            prob *= self._word_freq(piece, trie) / self._total
+        return max(int(prob * self._total) + 1, self._word_freq(word, trie), 1)
+
+    @staticmethod
+    def _word_freq(word: str, trie: Dict) -> int:
+        """获取词频，不在词典中返回0"""
+        node = trie
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                return 0
+        return node.get(_FREQ_KEY, 0)
+
+    def add_word(self, word: str, freq: Optional[int] = None):
+        """
+        动态添加词语
+
+        Args:
+            word: 词语
+            freq: 词频（可选）
+        """
+        self.initialize()
+        with self._init_lock:
+            trie = dict(self._dictionary[0])
+            self._insert(trie, word, freq)
+            self._publish(trie)
+
+    def load_user_dict(self, path: str):
+        """
+        加载用户词典
+
+        Args:
+            path: 用户词典路径，格式与核心词典相同
+        """
+        self.initialize()
+        with self._init_lock:
+            trie = dict(self._dictionary[0])
+            self._load_dictionary(trie, path)
+            self._publish(trie)
+            self.user_dict_paths.append(path)
+
+    @staticmethod
+    def _build_dag(sentence: str, trie: Dict) -> List[List[Tuple[int, int]]]:
+        """
+        沿前缀树构建切分DAG
+
+        Returns:
+            dag[i] 为以 i 开头的候选词 (结束下标, 词频) 列表，未登录字按词频1处理
+        """
+        length = len(sentence)
+        dag = []
+        for start in range(length):
+            candidates = []
+            node = trie
+            end = start
+            while end < length:
+                node = node.get(sentence[end])
+                if node is None:
+                    break
+                freq = node.get(_FREQ_KEY)
+                if freq:
+                    candidates.append((end, freq))
+                end += 1
+            if not candidates or candidates[0][0] != start:
+                candidates.insert(0, (start, 1))
+            dag.append(candidates)
+        return dag
+
+    def _cut_block(self, sentence: str, trie: Dict, log_total: float) -> List[str]:
+        """对连续汉字块计算最大概率切分"""
+        length = len(sentence)
+        dag = self._build_dag(sentence, trie)
+
+        # route[i] = (从i到句尾的最大对数概率, 该步选择的词结束下标)
+        route = [(0.0, 0)] * (length + 1)
+        for start in range(length - 1, -1, -1):
+            route[start] = max(
+                (math.log(freq) - log_total + route[end + 1][0], end)
+                for end, freq in dag[start]
+            )
+
+        words = []
+        start = 0
+        while start < length:
+            end = route[start][1] + 1
+            words.append(sentence[start:end])
+            start = end
+        return self._merge_unknown_chars(words, trie)
+
+    def _merge_unknown_chars(self, words: List[str], trie: Dict) -> List[str]:
+        """将相邻的未登录单字合并为词（如词典外的专有名词），过长的片段按两字切分"""
+        merged = []
+        buffer = ""
+        for word in words + [None]:
+            if word is not None and len(word) == 1 and not self._word_freq(word, trie):
+                buffer += word
+                continue
+            if len(buffer) <= self.MAX_UNKNOWN_WORD_LENGTH:
+                merged.extend([buffer] if buffer else [])
+            else:
+                merged.extend(buffer[i:i + 2] for i in range(0, len(buffer), 2))
+            buffer = ""
+            if word is not None:
+                merged.append(word)
+        return merged
+
+    def cut(self, text: str) -> List[str]:
+        """
+        分词
+
+        Args:
+            text: 待分词文本
+
+        Returns:
+            词语列表（不含空白，字母数字串作为整体）
+        """
+        self.initialize()
+        trie, log_total = self._dictionary
+        words = []
+        for match in _BLOCK_PATTERN.finditer(text):
+            han, alnum, other = match.groups()
+            if han:
+                words.extend(self._cut_block(han, trie, log_total))
+            else:
+                words.append(alnum or other)
+        return words
+
+    def cut_batch(self, texts: Iterable[str]) -> List[List[str]]:
+        """
+        批量分词
+
+        Args:
+            texts: 文本序列
+
+        Returns:
+            每个文本的分词结果
+        """
+        self.initialize()
+        return [self.cut(text) for text in texts]
+
+    def extract_terms(self, text: str, stop_words: Optional[Iterable[str]] = None,
+                      min_length: int = 2) -> List[str]:
+        """
+        提取检索词：分词后去除停用词、标点和过短的词，保持原有顺序并去重
+
+        Args:
+            text: 文本
+            stop_words: 停用词，默认使用内置停用词表
+            min_length: 最短词长
+
+        Returns:
+            检索词列表
+        """
+        stop_words = DEFAULT_STOP_WORDS if stop_words is None else frozenset(stop_words)
+        terms = []
+        for word in self.cut(text):
+            if len(word) < min_length or word in stop_words:
+                continue
+            if not (_HAN_PATTERN.search(word) or word[0].isalnum()):
+                continue
+            if word not in terms:
+                terms.append(word)
+        return terms
+
+
+# 单例实例
+word_segmenter = WordSegmenter()
@@ -0,0 +1,16 @@
+"""
+向量库服务包
+提供基于内存映射 float32 矩阵的本地向量集合
+
+性能测试见 benchmark 模块（可通过 python -m app.service.vector.benchmark 运行）
+"""
+from .collection import VectorCollection, normalize_vectors, top_k_rows
+from .vector_store import VectorStore, vector_store
+
+__all__ = [
+    'VectorCollection',
+    'normalize_vectors',
+    'top_k_rows',
+    'VectorStore',
+    'vector_store',
+]
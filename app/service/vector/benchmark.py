@@ -0,0 +1,208 @@
+"""
+向量检索性能测试
+在临时目录中生成合成向量集合（低维高斯混合分布随机投影到目标维度，近似真实嵌入的聚簇结构），
+测量写入耗时、精确检索的单条查询延迟（p50/p99）和批量查询吞吐；
+指定 --ann 时再建立 IVF 索引，对不同 nprobe 测量相对精确检索的 recall@k 和每秒查询数；
+--quantization 指定要比较的索引量化方式及其内存压缩比。
+
+命令行用法::
+
+    python -m app.service.vector.benchmark [--sizes 100000,1000000] [--dim 768] [--queries 100] [--top-k 10]
+    python -m app.service.vector.benchmark --sizes 1000000 --ann --nprobe 1,4,16,64
+    python -m app.service.vector.benchmark --sizes 1000000 --ann --nprobe 16 --quantization none,int8,pq
+"""
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Sequence
+from .collection import VectorCollection
+
+
+# 生成数据时每批写入的条数
+_WRITE_BATCH = 50000
+
+
+# 合成数据的内在维度：在低维空间按高斯混合分布采样后随机投影到目标维度，
+# 近似真实嵌入"维度高、内在维度低"的结构（直接在高维采样时各簇几乎完全分离，近似索引的召回率没有参考意义）
+_LATENT_DIMENSION = 64
+
+# 簇内噪声相对簇中心的标准差
+_NOISE = 0.8
+
+
+def _synthetic_space(dimension: int, clusters: int, seed: int):
+    """生成簇中心（低维）和投影矩阵"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, _LATENT_DIMENSION)).astype(np.float32)
+    projection = rng.standard_normal((_LATENT_DIMENSION, dimension)).astype(np.float32)
+    return centers, projection
+
+
+def _sample(rng: np.random.Generator, centers: np.ndarray, projection: np.ndarray, count: int) -> np.ndarray:
+    labels = rng.integers(0, len(centers), count)
+    latent = centers[labels] + _NOISE * rng.standard_normal((count, _LATENT_DIMENSION)).astype(np.float32)
+    return latent @ projection
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int = 1024, seed: int = 0) -> Iterator[np.ndarray]:
+    """
+    分批生成合成向量
+
+    Args:
+        count: 总条数
+        dimension: 维度
+        clusters: 簇数
+        seed: 随机种子
+
+    Returns:
+        逐批产出的 float32 矩阵
+    """
+    centers, projection = _synthetic_space(dimension, clusters, seed)
+    rng = np.random.default_rng(seed + 1)
+    for start in range(0, count, _WRITE_BATCH):
+        yield _sample(rng, centers, projection, min(_WRITE_BATCH, count - start))
+
+
+def synthetic_queries(count: int, dimension: int, clusters: int = 1024, seed: int = 0) -> np.ndarray:
+    """生成与数据同分布的查询向量（使用相同的簇中心和投影）"""
+    centers, projection = _synthetic_space(dimension, clusters, seed)
+    return _sample(np.random.default_rng(seed + 2), centers, projection, count)
+
+
+def _percentile_ms(samples: List[float], percentile: float) -> float:
+    return round(float(np.percentile(samples, percentile)) * 1000, 2)
+
+
+def recall_at_k(approximate: List[List[tuple]], exact: List[List[tuple]]) -> float:
+    """近似结果中命中精确前k个结果的比例（对全部查询取平均）"""
+    hits = [
+        len({row for row, _ in found} & {row for row, _ in expected}) / max(1, len(expected))
+        for found, expected in zip(approximate, exact)
+    ]
+    return round(float(np.mean(hits)), 4)
+
+
+def run_ann_benchmark(collection: VectorCollection, query_vectors: np.ndarray, top_k: int,
+                      nprobes: Sequence[int], quantizations: Sequence[str] = ("none",)) -> List[Dict[str, float]]:
+    """
+    建立 IVF 索引，对每种量化方式和每个 nprobe 测量 recall@k 和单条查询吞吐
+
+    量化索引分别测量只按量化编码排序（adc）和用 float32 原始向量重新排序候选（rerank）的结果。
+
+    Returns:
+        测试结果：精确检索、每种量化方式的索引构建耗时和内存压缩比，以及每个 nprobe 的召回率和吞吐
+    """
+    exact = []
+    start = time.perf_counter()
+    for vector in query_vectors:
+        exact.extend(collection.search_batch_sync([vector], top_k, exact=True))
+    results = [{"nprobe": "exact", "recall": 1.0, "qps": round(len(query_vectors) / (time.perf_counter() - start), 1)}]
+
+    for quantization in quantizations:
+        start = time.perf_counter()
+        collection.build_index("ivf", quantization=quantization)
+        index = collection.stats()["index"]
+        results.append({
+            "index": "ivf",
+            "quantization": quantization,
+            "nlist": index["nlist"],
+            "build_s": round(time.perf_counter() - start, 2),
+            "compression": round(index["indexed"] * collection.dimension * 4 / index["code_bytes"], 1),
+        })
+
+        for nprobe in nprobes:
+            for rerank in ((False, True) if quantization != "none" else (False,)):
+                # 预热：把要扫描的簇读入页缓存
+                collection.search_batch_sync(query_vectors, top_k, nprobe=nprobe, rerank=rerank)
+                approximate = []
+                start = time.perf_counter()
+                for vector in query_vectors:
+                    approximate.extend(collection.search_batch_sync([vector], top_k, nprobe=nprobe, rerank=rerank))
+                elapsed = time.perf_counter() - start
+                results.append({
+                    "quantization": quantization,
+                    "mode": "rerank" if rerank else "adc",
+                    "nprobe": nprobe,
+                    "recall": recall_at_k(approximate, exact),
+                    "qps": round(len(query_vectors) / elapsed, 1),
+                })
+    return results
+
+
+def run_benchmark(size: int, dimension: int, queries: int, top_k: int, batch_size: int,
+                  nprobes: Optional[Sequence[int]] = None,
+                  quantizations: Sequence[str] = ("none",)) -> List[Dict[str, float]]:
+    """
+    对一个规模运行测试
+
+    Args:
+        nprobes: 指定时在精确检索测试后建立 IVF 索引，测量这些 nprobe 的召回率和吞吐
+        quantizations: 要测试的索引量化方式
+
+    Returns:
+        测试结果（第一项为精确检索的延迟和吞吐，其后为各索引的召回率和吞吐）
+    """
+    directory = tempfile.mkdtemp(prefix="vector_bench_")
+    try:
+        collection = VectorCollection("bench", directory, dimension)
+        start = time.perf_counter()
+        for batch in synthetic_vectors(size, dimension):
+            collection.add(batch)
+        build_seconds = time.perf_counter() - start
+
+        query_vectors = synthetic_queries(queries, dimension)
+
+        # 预热：把向量文件读入页缓存
+        collection.search_batch_sync(query_vectors[:1], top_k)
+
+        latencies = []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            collection.search_batch_sync([vector], top_k)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for offset in range(0, queries, batch_size):
+            collection.search_batch_sync(query_vectors[offset:offset + batch_size], top_k)
+        batch_seconds = time.perf_counter() - start
+
+        results = [{
+            "size": size,
+            "build_s": round(build_seconds, 2),
+            "p50_ms": _percentile_ms(latencies, 50),
+            "p99_ms": _percentile_ms(latencies, 99),
+            "qps": round(queries / sum(latencies), 1),
+            "batch_qps": round(queries / batch_seconds, 1),
+        }]
+        if nprobes:
+            results.extend(run_ann_benchmark(collection, query_vectors, top_k, nprobes, quantizations))
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="向量检索性能测试")
+    parser.add_argument("--sizes", default="100000,1000000", help="集合规模，逗号分隔")
+    parser.add_argument("--dim", type=int, default=768, help="向量维度")
+    parser.add_argument("--queries", type=int, default=100, help="查询条数")
+    parser.add_argument("--top-k", type=int, default=10, help="每个查询返回的个数")
+    parser.add_argument("--batch-size", type=int, default=32, help="批量查询时每批的查询数")
+    parser.add_argument("--ann", action="store_true", help="同时测试 IVF 近似索引的召回率和吞吐")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="IVF 检索扫描的簇数，逗号分隔")
+    parser.add_argument("--quantization", default="none", help="IVF 索引的量化方式（none、int8、pq），逗号分隔")
+    args = parser.parse_args()
+
+    nprobes = [int(value) for value in args.nprobe.split(",") if value.strip()] if args.ann else None
+    quantizations = [value.strip() for value in args.quantization.split(",") if value.strip()]
+    print(f"维度={args.dim} 查询数={args.queries} top_k={args.top_k} 批大小={args.batch_size}")
+    for size in (int(value) for value in args.sizes.split(",") if value.strip()):
+        for result in run_benchmark(size, args.dim, args.queries, args.top_k, args.batch_size, nprobes, quantizations):
+            print("  ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+向量集合
+一个集合对应一个目录：向量按行归一化后以 float32 矩阵追加写入 vectors.f32，通过内存映射读取；
+记录（id、内容、元数据）以JSON追加写入 records.bin，records.idx 保存每条记录的起始偏移。
+行数以 meta.json 为准，写入时先追加数据再原子替换 meta.json，检索始终读取已发布的快照，不受写入影响。
+集合可以带一个 IVF 近似索引（ivf_* 子目录，由 meta.json 引用）：索引建立后新写入的行在检索时精确扫描，
+未索引的行超过一定比例后在后台重建索引。索引内的向量可以量化存储（int8 或乘积量化），
+检索时先按量化编码取出候选，再用 float32 原始向量重新计算相似度排序
+"""
+import os
+import sys
+import json
+import shutil
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .ivf import IVFIndex
+
+
+_META_FILE = "meta.json"
+_VECTORS_FILE = "vectors.f32"
+_RECORDS_FILE = "records.bin"
+_RECORDS_INDEX_FILE = "records.idx"
+_INDEX_PREFIX = "ivf_"
+
+# 暴力检索时每批参与矩阵乘法的行数（768维时约200MB），控制临时得分矩阵的大小
+_BLOCK_ROWS = 65536
+
+
+def normalize_vectors(vectors: Any) -> np.ndarray:
+    """
+    把向量按行归一化为单位长度（零向量保持为零）
+
+    Args:
+        vectors: 一个向量或向量矩阵
+
+    Returns:
+        float32 二维矩阵
+    """
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按行取得分最高的k列（argpartition 选出候选后只对k个候选排序）
+
+    Args:
+        scores: 得分矩阵（查询数 × 候选数）
+        k: 每行保留的个数
+
+    Returns:
+        (列下标矩阵, 得分矩阵)，每行按得分降序
+    """
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    selected = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-selected, axis=1)
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(selected, order, axis=1)
+
+
+class _Snapshot:
+    """已发布数据的只读视图"""
+
+    def __init__(self, count: int, vectors: Optional[np.ndarray], offsets: Optional[np.ndarray],
+                 records: Optional[np.ndarray], index: Optional[IVFIndex] = None):
+        self.count = count
+        self.vectors = vectors
+        self.offsets = offsets
+        self.records = records
+        self.index = index
+
+
+class VectorCollection:
+    """基于内存映射 float32 矩阵的向量集合（余弦相似度，可选 IVF 近似索引和向量量化）"""
+
+    def __init__(self, name: str, directory: str, dimension: Optional[int] = None, ann_min_rows: int = 0,
+                 nlist: int = 0, nprobe: int = 16, rebuild_ratio: float = 0.2, quantization: str = "none",
+                 pq_segments: int = 0, rerank: bool = True, rerank_factor: int = 4):
+        """
+        打开（或创建）向量集合
+
+        Args:
+            name: 集合名称
+            directory: 集合目录
+            dimension: 向量维度，已有集合以 meta.json 为准，新集合在首次写入时确定
+            ann_min_rows: 行数达到此值时自动建立 IVF 索引，0表示不自动建立（可调用 build_index）
+            nlist: IVF 簇数，0表示按规模自动选择
+            nprobe: 检索时扫描的簇数
+            rebuild_ratio: 未索引的行数超过已索引行数的此比例时在后台重建索引
+            quantization: 自动建立的索引的量化方式（none、int8、pq）
+            pq_segments: 乘积量化段数，0表示维度的1/4
+            rerank: 量化索引是否用 float32 原始向量重新排序候选
+            rerank_factor: 重新排序的候选数为 top_k 的倍数
+        """
+        self.name = name
+        self.directory = directory
+        self.dimension = dimension
+        self.ann_min_rows = ann_min_rows
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rebuild_ratio = rebuild_ratio
+        self.quantization = quantization
+        self.pq_segments = pq_segments
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+
+        # 写入者之间互斥；检索只读取当前快照，不加锁
+        self._write_lock = threading.Lock()
+        # 同一时间只有一个索引构建
+        self._index_lock = threading.Lock()
+        self._snapshot = _Snapshot(0, None, None, None)
+        # 索引设置：None 表示按 ann_min_rows 自动建立；否则为 {"type": "ivf" 或 "flat", "nlist", "quantization", "name"}，
+        # flat 且不量化时没有索引目录（精确检索），flat 且量化时索引只有一个簇
+        self._index_meta: Optional[Dict[str, Any]] = None
+        self._next_index = 0
+        self._load()
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def _load(self):
+        """读取 meta.json 并映射已发布的数据"""
+        meta_path = self._path(_META_FILE)
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"向量集合字节序不匹配: {self.directory}")
+        self.dimension = meta["dimension"]
+        self._index_meta = meta.get("index")
+        self._next_index = meta.get("next_index", 0)
+
+        index = None
+        if self._index_meta and self._index_meta.get("name"):
+            index = IVFIndex(self._path(self._index_meta["name"]))
+        self._snapshot = self._map(meta["count"], meta["records_size"], index)
+        self._remove_orphan_indexes()
+
+    def _remove_orphan_indexes(self):
+        """删除 meta.json 未引用的索引目录（构建或替换中途失败遗留的）"""
+        referenced = self._index_meta.get("name") if self._index_meta else None
+        for name in os.listdir(self.directory):
+            if name.startswith(_INDEX_PREFIX) and name != referenced:
+                shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def _map(self, count: int, records_size: int, index: Optional[IVFIndex] = None) -> _Snapshot:
+        """按已发布的行数映射数据文件"""
+        if count == 0:
+            return _Snapshot(0, None, None, None)
+        vectors = np.memmap(self._path(_VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, self.dimension))
+        offsets = np.memmap(self._path(_RECORDS_INDEX_FILE), dtype=np.uint64, mode="r", shape=(count + 1,))
+        records = np.memmap(self._path(_RECORDS_FILE), dtype=np.uint8, mode="r", shape=(records_size,))
+        return _Snapshot(count, vectors, offsets, records, index)
+
+    @property
+    def count(self) -> int:
+        """向量条数"""
+        return self._snapshot.count
+
+    def add(self, vectors: Any, records: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+        """
+        追加向量和对应的记录
+
+        Args:
+            vectors: 向量矩阵（条数 × 维度）
+            records: 记录列表 [{"id", "content", "metadata"}]，与向量一一对应，缺省时只生成ID
+
+        Returns:
+            写入的条数
+        """
+        matrix = normalize_vectors(vectors)
+        if records is not None and len(records) != len(matrix):
+            raise ValueError("向量条数与记录条数不一致")
+
+        with self._write_lock:
+            if self.dimension is None:
+                self.dimension = matrix.shape[1]
+            if matrix.shape[1] != self.dimension:
+                raise ValueError(f"向量维度不匹配: 集合为 {self.dimension}，写入为 {matrix.shape[1]}")
+
+            snapshot = self._snapshot
+            count = snapshot.count
+            records_size = int(snapshot.offsets[-1]) if snapshot.count else 0
+
+            encoded = []
+            offsets = []
+            position = records_size
+            for row in range(len(matrix)):
+                record = dict(records[row]) if records is not None else {}
+                record.setdefault("id", f"{self.name}_{count + row}")
+                data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+                encoded.append(data)
+                position += len(data)
+                offsets.append(position)
+
+            os.makedirs(self.directory, exist_ok=True)
+            # 截掉上次未发布（中途失败）的数据后再追加
+            self._append(_VECTORS_FILE, count * self.dimension * 4, matrix.tobytes())
+            self._append(_RECORDS_FILE, records_size, b"".join(encoded))
+            index_bytes = np.array(offsets, dtype=np.uint64).tobytes()
+            if count == 0:
+                index_bytes = np.zeros(1, dtype=np.uint64).tobytes() + index_bytes
+            self._append(_RECORDS_INDEX_FILE, count * 8 + 8 if count else 0, index_bytes)
+
+            count += len(matrix)
+            self._write_meta(count, position)
+            self._snapshot = self._map(count, position, snapshot.index)
+
+        self._maybe_build_index()
+        return len(matrix)
+
+    def _append(self, filename: str, published_size: int, data: bytes):
+        """截断到已发布的大小后追加数据"""
+        path = self._path(filename)
+        with open(path, "ab") as f:
+            f.truncate(published_size)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_meta(self, count: int, records_size: int):
+        """原子写入 meta.json（发布新写入的数据或索引，调用方需持有写锁）"""
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = self._path(_META_FILE)
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "name": self.name,
+                "dimension": self.dimension,
+                "count": count,
+                "records_size": records_size,
+                "metric": "cosine",
+                "byteorder": sys.byteorder,
+                "index": self._index_meta,
+                "next_index": self._next_index,
+            }, f)
+        os.replace(tmp_path, meta_path)
+
+    def _maybe_build_index(self):
+        """行数达到阈值或未索引的行过多时，在后台线程中建立索引"""
+        snapshot = self._snapshot
+        index_meta = self._index_meta
+        if snapshot.count == 0:
+            return
+        if snapshot.index is not None:
+            if snapshot.count - snapshot.index.count <= snapshot.index.count * self.rebuild_ratio:
+                return
+        elif index_meta is None:
+            if not (self.ann_min_rows and snapshot.count >= self.ann_min_rows):
+                return
+        elif index_meta["type"] == "flat" and index_meta.get("quantization", "none") == "none":
+            return
+        if not self._index_lock.acquire(blocking=False):
+            return
+        threading.Thread(target=self._background_build, name=f"vector-index-{self.name}", daemon=True).start()
+
+    def _background_build(self):
+        """后台建立索引（调用方已获取索引锁）"""
+        index_meta = self._index_meta or {}
+        try:
+            self._build_index(index_meta.get("type", "ivf"), index_meta.get("nlist"), index_meta.get("quantization"))
+        except Exception as e:
+            print(f"向量集合 {self.name} 建立索引失败: {str(e)}")
+        finally:
+            self._index_lock.release()
+
+    def build_index(self, index_type: str = "ivf", nlist: Optional[int] = None,
+                    quantization: Optional[str] = None) -> Dict[str, Any]:
+        """
+        建立（或替换）集合的索引
+
+        Args:
+            index_type: ivf 建立 IVF 近似索引（空集合在写入数据后建立）；flat 不分簇，
+                        不量化时删除索引、始终精确检索，量化时扫描全部编码
+            nlist: IVF 簇数，缺省使用集合配置（0表示按规模自动选择）
+            quantization: none、int8 或 pq，缺省使用集合配置
+
+        Returns:
+            新的索引设置
+        """
+        if index_type not in ("ivf", "flat"):
+            raise ValueError(f"不支持的索引类型: {index_type}")
+        if quantization not in (None, "none", "int8", "pq"):
+            raise ValueError(f"不支持的量化方式: {quantization}")
+        with self._index_lock:
+            return self._build_index(index_type, nlist, quantization)
+
+    def _build_index(self, index_type: str, nlist: Optional[int], quantization: Optional[str]) -> Dict[str, Any]:
+        """建立索引并发布（调用方需持有索引锁）"""
+        nlist = self.nlist if nlist is None else nlist
+        quantization = self.quantization if quantization is None else quantization
+        snapshot = self._snapshot
+        index = None
+        # 记录请求的簇数（0为自动），重建时按新的规模重新选择
+        index_meta: Dict[str, Any] = {"type": index_type, "nlist": nlist if index_type == "ivf" else 1,
+                                      "quantization": quantization}
+        if (index_type == "ivf" or quantization != "none") and snapshot.count:
+            with self._write_lock:
+                name = f"{_INDEX_PREFIX}{self._next_index}"
+                self._next_index += 1
+            index = IVFIndex.build(self._path(name), snapshot.vectors, index_meta["nlist"], quantization,
+                                   self.pq_segments)
+            index_meta["name"] = name
+
+        with self._write_lock:
+            old_name = self._index_meta.get("name") if self._index_meta else None
+            self._index_meta = index_meta
+            current = self._snapshot
+            records_size = int(current.offsets[-1]) if current.count else 0
+            self._write_meta(current.count, records_size)
+            self._snapshot = self._map(current.count, records_size, index)
+
+        # 正在使用旧索引的检索持有内存映射，删除目录不影响其完成
+        if old_name:
+            shutil.rmtree(self._path(old_name), ignore_errors=True)
+
+        print(f"向量集合 {self.name} 索引已更新: {index_meta}")
+        return index_meta
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """读取指定行的记录"""
+        snapshot = self._snapshot
+        start, end = int(snapshot.offsets[row]), int(snapshot.offsets[row + 1])
+        return json.loads(snapshot.records[start:end].tobytes().decode("utf-8"))
+
+    @staticmethod
+    def _scan(matrix: np.ndarray, vectors: np.ndarray, start: int, end: int,
+              top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        精确扫描 [start, end) 行：查询矩阵与向量矩阵分块相乘，每块用 argpartition 保留前k个，最后合并
+
+        Returns:
+            (行号矩阵, 相似度矩阵)，每行按相似度降序
+        """
+        candidate_rows = []
+        candidate_scores = []
+        for block_start in range(start, end, _BLOCK_ROWS):
+            block = vectors[block_start:min(block_start + _BLOCK_ROWS, end)]
+            columns, scores = top_k_rows(matrix @ block.T, top_k)
+            candidate_rows.append(columns + block_start)
+            candidate_scores.append(scores)
+
+        columns, scores = top_k_rows(np.hstack(candidate_scores), top_k)
+        return np.take_along_axis(np.hstack(candidate_rows), columns, axis=1), scores
+
+    def _index_search(self, snapshot: _Snapshot, matrix: np.ndarray, top_k: int, nprobe: int,
+                      rerank: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        用索引逐条检索，索引建立后新写入的行精确扫描后合并；
+        量化索引的得分是近似值，重新排序时先取 top_k × rerank_factor 个候选，再按 float32 原始向量计算相似度
+
+        Returns:
+            (行号矩阵, 相似度矩阵)，每行按相似度降序（结果不足k个时以 -inf 补齐）
+        """
+        index = snapshot.index
+        rerank = rerank and index.quantizer is not None
+        shortlist = top_k * self.rerank_factor if rerank else top_k
+
+        rows = np.zeros((len(matrix), shortlist), dtype=np.int64)
+        scores = np.full((len(matrix), shortlist), -np.inf, dtype=np.float32)
+        for position, query in enumerate(matrix):
+            query_rows, query_scores = index.search(query, shortlist, nprobe)
+            rows[position, :len(query_rows)] = query_rows
+            scores[position, :len(query_scores)] = query_scores
+
+        if snapshot.count > index.count:
+            tail_rows, tail_scores = self._scan(matrix, snapshot.vectors, index.count, snapshot.count, shortlist)
+            columns, scores = top_k_rows(np.hstack([scores, tail_scores]), shortlist)
+            rows = np.take_along_axis(np.hstack([rows, tail_rows]), columns, axis=1)
+
+        if rerank:
+            for position, query in enumerate(matrix):
+                valid = scores[position] > -np.inf
+                candidates = rows[position, valid]
+                # 按行号升序读取原始向量（顺序访问内存映射）
+                candidates.sort()
+                scores[position, valid] = snapshot.vectors[candidates] @ query
+                rows[position, valid] = candidates
+            columns, scores = top_k_rows(scores, top_k)
+            rows = np.take_along_axis(rows, columns, axis=1)
+        return rows, scores
+
+    def search_batch_sync(self, queries: Any, top_k: int = 5, threshold: Optional[float] = None,
+                          nprobe: Optional[int] = None, exact: bool = False,
+                          rerank: Optional[bool] = None) -> List[List[Tuple[int, float]]]:
+        """
+        批量检索：有索引时只扫描与查询最相似的 nprobe 个簇（量化索引扫描编码），否则精确扫描全部向量
+
+        Args:
+            queries: 查询向量矩阵（查询数 × 维度）
+            top_k: 每个查询返回的个数
+            threshold: 相似度阈值，低于此值的结果被过滤
+            nprobe: 扫描的簇数，缺省使用集合配置
+            exact: 为 True 时忽略索引，精确检索
+            rerank: 量化索引是否用原始向量重新排序，缺省使用集合配置
+
+        Returns:
+            每个查询的 [(行号, 相似度)]，按相似度降序
+        """
+        matrix = normalize_vectors(queries)
+        snapshot = self._snapshot
+        if snapshot.count == 0 or top_k <= 0:
+            return [[] for _ in range(len(matrix))]
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"查询向量维度不匹配: 集合为 {self.dimension}，查询为 {matrix.shape[1]}")
+
+        if snapshot.index is not None and not exact:
+            rows, scores = self._index_search(snapshot, matrix, top_k, nprobe or self.nprobe,
+                                              self.rerank if rerank is None else rerank)
+        else:
+            rows, scores = self._scan(matrix, snapshot.vectors, 0, snapshot.count, top_k)
+        return [
+            [(int(row), float(score)) for row, score in zip(query_rows, query_scores)
+             if score > -np.inf and (threshold is None or score >= threshold)]
+            for query_rows, query_scores in zip(rows, scores)
+        ]
+
+    def search_sync(self, vector: Any, top_k: int = 5, threshold: Optional[float] = None,
+                    nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        检索与查询向量最相似的记录
+
+        Args:
+            vector: 查询向量
+            top_k: 返回的最大结果数
+            threshold: 相似度阈值
+            nprobe: IVF 索引扫描的簇数，缺省使用集合配置
+
+        Returns:
+            [{"id", "content", "similarity", "metadata"}]，按相似度降序
+        """
+        results = []
+        for row, similarity in self.search_batch_sync([vector], top_k, threshold, nprobe)[0]:
+            record = self.record(row)
+            results.append({
+                "id": record.get("id"),
+                "content": record.get("content", ""),
+                "similarity": similarity,
+                "metadata": record.get("metadata", {}),
+            })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """获取集合统计信息"""
+        snapshot = self._snapshot
+        index = snapshot.index
+        return {
+            "name": self.name,
+            "count": snapshot.count,
+            "dimension": self.dimension,
+            "vector_bytes": snapshot.count * (self.dimension or 0) * 4,
+            "index": {
+                "type": self._index_meta.get("type", "ivf") if self._index_meta else "ivf",
+                "nlist": index.nlist,
+                "nprobe": self.nprobe,
+                "indexed": index.count,
+                "quantization": index.quantization,
+                "code_bytes": index.code_bytes,
+            } if index is not None else {"type": "flat", "quantization": "none"},
+            "indexing": self._index_lock.locked(),
+        }
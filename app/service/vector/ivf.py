@@ -0,0 +1,245 @@
+"""
+IVF（倒排文件）近似最近邻索引
+用球面 k-means 把向量划分为 nlist 个簇，向量按所属簇连续存放；
+检索时只扫描与查询最相似的 nprobe 个簇，nprobe 越大召回率越高、速度越慢。
+簇内向量可以量化存储（见 quantization 模块）：编码的是向量与簇中心的残差，
+内积可拆为 查询·簇中心 + 查询·残差，后者由量化器按非对称距离计算。
+
+索引目录文件：
+    ivf.json            nlist、已索引的行数、量化方式
+    centroids.npy       簇中心（nlist × 维度，已归一化）
+    offsets.npy         每个簇在 rows/vectors 中的起止位置（nlist + 1）
+    rows.npy            按簇排列的原始行号
+    vectors.f32         按簇排列的向量（未量化时，与 rows.npy 一一对应）
+    codes.bin           按簇排列的残差编码（量化时，与 rows.npy 一一对应）
+    quantizer.npz       量化参数（量化时）
+"""
+import os
+import json
+import shutil
+import numpy as np
+from typing import Optional, Tuple
+from .quantization import create_quantizer, load_quantizer
+
+
+_IVF_META_FILE = "ivf.json"
+_CENTROIDS_FILE = "centroids.npy"
+_OFFSETS_FILE = "offsets.npy"
+_ROWS_FILE = "rows.npy"
+_LIST_VECTORS_FILE = "vectors.f32"
+_CODES_FILE = "codes.bin"
+
+# 分块计算所属簇时每块的行数
+_ASSIGN_BLOCK_ROWS = 16384
+
+
+def default_nlist(count: int) -> int:
+    """按集合规模选择簇数（约为行数的平方根）"""
+    return max(1, min(65536, int(np.sqrt(count))))
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    分块计算每个向量最相似的簇中心
+
+    Args:
+        vectors: 归一化向量矩阵
+        centroids: 归一化簇中心
+
+    Returns:
+        每行所属簇的编号
+    """
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + _ASSIGN_BLOCK_ROWS])
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(sample: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    球面 k-means：按内积分配，簇中心取均值后重新归一化
+
+    Args:
+        sample: 训练样本（归一化向量）
+        nlist: 簇数
+        iterations: 迭代次数
+        seed: 随机种子
+
+    Returns:
+        归一化簇中心（nlist × 维度）
+    """
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+        non_empty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty]
+        centroids[non_empty] = np.add.reduceat(sample[order], starts, axis=0)
+
+        # 空簇用随机样本重新初始化
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids /= norms
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """只读 IVF 索引（簇内为 float32 向量或量化编码）"""
+
+    def __init__(self, path: str):
+        """
+        打开索引
+
+        Args:
+            path: 索引目录
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+
+        with open(os.path.join(path, _IVF_META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.nlist: int = meta["nlist"]
+        self.count: int = meta["count"]
+        self.dimension: int = meta["dimension"]
+        self.quantization: str = meta.get("quantization", "none")
+
+        self.centroids = np.load(os.path.join(path, _CENTROIDS_FILE))
+        self.offsets = np.load(os.path.join(path, _OFFSETS_FILE))
+        self.rows = np.load(os.path.join(path, _ROWS_FILE), mmap_mode="r")
+
+        # 未量化时簇内存放 float32 向量，量化时存放残差编码
+        self.quantizer = load_quantizer(path)
+        if self.quantizer is None:
+            self.vectors = np.memmap(os.path.join(path, _LIST_VECTORS_FILE), dtype=np.float32, mode="r",
+                                     shape=(self.count, self.dimension))
+        else:
+            self.vectors = np.memmap(os.path.join(path, _CODES_FILE), dtype=self.quantizer.code_dtype, mode="r",
+                                     shape=(self.count, self.quantizer.code_size))
+
+    @property
+    def code_bytes(self) -> int:
+        """簇内向量（或编码）占用的字节数"""
+        return self.vectors.nbytes
+
+    @classmethod
+    def build(cls, path: str, vectors: np.ndarray, nlist: int = 0, quantization: str = "none",
+              pq_segments: int = 0, sample_size: int = 0, iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        """
+        训练簇中心（和量化器）并写入索引
+
+        Args:
+            path: 索引目录（写入临时目录后原子替换）
+            vectors: 归一化向量矩阵（通常为内存映射）
+            nlist: 簇数，0表示按规模自动选择
+            quantization: none、int8 或 pq
+            pq_segments: 乘积量化段数，0表示维度的1/4
+            sample_size: 训练样本数，0表示取簇数的64倍（至多全部向量）
+            iterations: k-means 迭代次数
+            seed: 随机种子
+
+        Returns:
+            打开的索引
+        """
+        count, dimension = vectors.shape
+        nlist = nlist or default_nlist(count)
+        sample_size = min(count, sample_size or max(nlist * 64, 10000))
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(count, sample_size, replace=False))
+        sample = np.asarray(vectors[sample_rows])
+        centroids = train_centroids(sample, nlist, iterations, seed)
+        nlist = len(centroids)
+
+        quantizer = None
+        if quantization != "none":
+            quantizer = create_quantizer(quantization, dimension, pq_segments)
+            quantizer.train(sample - centroids[assign_lists(sample, centroids)])
+
+        assignments = assign_lists(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=nlist)))).astype(np.int64)
+
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, _CENTROIDS_FILE), centroids)
+        np.save(os.path.join(tmp_path, _OFFSETS_FILE), offsets)
+        np.save(os.path.join(tmp_path, _ROWS_FILE), order.astype(np.int64))
+
+        # 按簇顺序写入向量（或残差编码），检索时每个簇是一段连续内存
+        if quantizer is None:
+            list_vectors = np.memmap(os.path.join(tmp_path, _LIST_VECTORS_FILE), dtype=np.float32, mode="w+",
+                                     shape=(count, dimension))
+        else:
+            quantizer.save(tmp_path)
+            list_vectors = np.memmap(os.path.join(tmp_path, _CODES_FILE), dtype=quantizer.code_dtype, mode="w+",
+                                     shape=(count, quantizer.code_size))
+        for start in range(0, count, _ASSIGN_BLOCK_ROWS):
+            rows = order[start:start + _ASSIGN_BLOCK_ROWS]
+            # 按行号升序读取原矩阵（顺序访问内存映射），再放回簇内顺序
+            ascending = np.argsort(rows)
+            block = np.empty((len(rows), dimension), dtype=np.float32)
+            block[ascending] = vectors[rows[ascending]]
+            if quantizer is not None:
+                block = quantizer.encode(block - centroids[assignments[rows]])
+            list_vectors[start:start + len(rows)] = block
+        list_vectors.flush()
+        del list_vectors
+
+        with open(os.path.join(tmp_path, _IVF_META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"nlist": nlist, "count": count, "dimension": dimension, "quantization": quantization}, f)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def probe(self, centroid_scores: np.ndarray, nprobe: int) -> np.ndarray:
+        """选出与查询最相似的 nprobe 个簇"""
+        nprobe = min(nprobe, self.nlist)
+        if nprobe < self.nlist:
+            return np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.arange(self.nlist)
+
+    def search(self, query: np.ndarray, top_k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        在选中的簇内计算相似度（未量化时为精确值，量化时为近似值）
+
+        Args:
+            query: 归一化查询向量
+            top_k: 返回的个数
+            nprobe: 扫描的簇数
+
+        Returns:
+            (原始行号, 相似度)，按相似度降序
+        """
+        centroid_scores = self.centroids @ query
+        prepared: Optional[np.ndarray] = self.quantizer.prepare(query) if self.quantizer is not None else None
+
+        parts_rows = []
+        parts_scores = []
+        for list_id in self.probe(centroid_scores, nprobe):
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            if prepared is None:
+                parts_scores.append(self.vectors[start:end] @ query)
+            else:
+                parts_scores.append(centroid_scores[list_id] + self.quantizer.score(self.vectors[start:end], prepared))
+            parts_rows.append(self.rows[start:end])
+        if not parts_scores:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.concatenate(parts_scores)
+        rows = np.concatenate(parts_rows)
+        if top_k < len(scores):
+            selected = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[selected], scores[selected]
+        order = np.argsort(-scores)
+        return rows[order], scores[order]
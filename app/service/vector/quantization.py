@@ -0,0 +1,210 @@
+"""
+向量量化
+索引中的向量可以量化存储以减少内存：
+    int8  标量量化：每维按训练样本的最大绝对值缩放为 -127~127，内存为 float32 的 1/4
+    pq    乘积量化：向量切分为 M 段，每段用 256 个码字之一（1字节）表示，内存为 float32 的 4×维度/M 分之一
+检索时采用非对称距离计算（ADC）：查询向量保持 float32，只有库内向量是量化后的，
+int8 把查询乘以缩放系数后直接与编码做内积，pq 先算出查询每段与各码字的内积表，再按编码查表求和
+"""
+import os
+import numpy as np
+from typing import Optional
+
+
+_QUANTIZER_FILE = "quantizer.npz"
+
+# 编码和打分时每块的行数
+_ENCODE_BLOCK_ROWS = 65536
+
+# 乘积量化每段的码字数（编码为1字节）
+_PQ_CODEWORDS = 256
+
+# 乘积量化训练码本最多使用的样本数（每个码字约40个样本已足够，更多样本只会拖慢训练）
+_PQ_TRAIN_ROWS = _PQ_CODEWORDS * 40
+
+
+class ScalarQuantizer:
+    """int8 标量量化（每维独立缩放，对称量化）"""
+
+    kind = "int8"
+
+    def __init__(self, scale: Optional[np.ndarray] = None):
+        """
+        Args:
+            scale: 每维的缩放系数（解码值 = 编码 × 缩放系数）
+        """
+        self.scale = scale
+
+    @property
+    def code_size(self) -> int:
+        """每个向量的编码字节数"""
+        return len(self.scale)
+
+    @property
+    def code_dtype(self):
+        return np.int8
+
+    def train(self, sample: np.ndarray):
+        """按样本每维的最大绝对值确定缩放系数"""
+        scale = np.abs(sample).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        self.scale = scale.astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """编码为 int8"""
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def prepare(self, query: np.ndarray) -> np.ndarray:
+        """把缩放系数并入查询向量，之后与编码直接做内积"""
+        return (query * self.scale).astype(np.float32)
+
+    def score(self, codes: np.ndarray, prepared: np.ndarray) -> np.ndarray:
+        """编码与查询的近似内积"""
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _ENCODE_BLOCK_ROWS):
+            block = codes[start:start + _ENCODE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ prepared
+        return scores
+
+    def save(self, path: str):
+        np.savez(os.path.join(path, _QUANTIZER_FILE), kind=self.kind, scale=self.scale)
+
+
+class ProductQuantizer:
+    """乘积量化（每段256个码字，编码每段1字节）"""
+
+    kind = "pq"
+
+    def __init__(self, segments: int, codebooks: Optional[np.ndarray] = None):
+        """
+        Args:
+            segments: 段数 M（需整除向量维度）
+            codebooks: 码本（M × 256 × 每段维度）
+        """
+        self.segments = segments
+        self.codebooks = codebooks
+
+    @property
+    def code_size(self) -> int:
+        """每个向量的编码字节数"""
+        return self.segments
+
+    @property
+    def code_dtype(self):
+        return np.uint8
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(行数 × 维度) -> (段数 × 行数 × 每段维度)"""
+        return vectors.reshape(len(vectors), self.segments, -1).transpose(1, 0, 2)
+
+    def train(self, sample: np.ndarray, iterations: int = 10, seed: int = 0):
+        """
+        每段分别用 k-means 训练码本
+
+        Args:
+            sample: 训练样本
+            iterations: k-means 迭代次数
+            seed: 随机种子
+        """
+        if sample.shape[1] % self.segments:
+            raise ValueError(f"乘积量化段数 {self.segments} 不能整除向量维度 {sample.shape[1]}")
+        rng = np.random.default_rng(seed)
+        if len(sample) > _PQ_TRAIN_ROWS:
+            sample = sample[np.sort(rng.choice(len(sample), _PQ_TRAIN_ROWS, replace=False))]
+        codewords = min(_PQ_CODEWORDS, len(sample))
+        subvectors = self._split(sample)
+        codebooks = np.zeros((self.segments, _PQ_CODEWORDS, subvectors.shape[2]), dtype=np.float32)
+
+        for segment, data in enumerate(subvectors):
+            centroids = data[rng.choice(len(data), codewords, replace=False)].copy()
+            for _ in range(iterations):
+                assignments = self._nearest(data, centroids)
+                counts = np.bincount(assignments, minlength=codewords)
+                # 每段维度很小，逐维用 bincount 求和比 np.add.at 快得多
+                sums = np.stack([np.bincount(assignments, weights=data[:, dim], minlength=codewords)
+                                 for dim in range(data.shape[1])], axis=1)
+                non_empty = counts > 0
+                centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+                # 空码字用随机样本重新初始化
+                empty = np.flatnonzero(~non_empty)
+                if len(empty):
+                    centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+            codebooks[segment, :codewords] = centroids
+        self.codebooks = codebooks
+
+    @staticmethod
+    def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """按欧氏距离求最近的码字（|c|² - 2x·c 合并为一次矩阵乘法）"""
+        augmented_data = np.hstack([data, np.ones((len(data), 1), dtype=data.dtype)])
+        augmented_centroids = np.hstack([-2 * centroids, (centroids ** 2).sum(axis=1, keepdims=True)])
+        return np.argmin(augmented_data @ augmented_centroids.T, axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """编码为每段1字节"""
+        codes = np.empty((len(vectors), self.segments), dtype=np.uint8)
+        for segment, data in enumerate(self._split(vectors)):
+            codes[:, segment] = self._nearest(data, self.codebooks[segment])
+        return codes
+
+    def prepare(self, query: np.ndarray) -> np.ndarray:
+        """
+        计算查询每段与各码字的内积表，展平为一维，便于按 段号×256+编码 查表
+
+        Returns:
+            内积表（段数 × 256，展平）
+        """
+        subqueries = query.reshape(self.segments, -1)
+        table = np.einsum("md,mkd->mk", subqueries, self.codebooks)
+        return table.astype(np.float32).ravel()
+
+    def score(self, codes: np.ndarray, prepared: np.ndarray) -> np.ndarray:
+        """按编码查内积表求和，得到近似内积"""
+        offsets = np.arange(self.segments, dtype=np.int64) * _PQ_CODEWORDS
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _ENCODE_BLOCK_ROWS):
+            block = codes[start:start + _ENCODE_BLOCK_ROWS]
+            scores[start:start + len(block)] = prepared[block + offsets].sum(axis=1)
+        return scores
+
+    def save(self, path: str):
+        np.savez(os.path.join(path, _QUANTIZER_FILE), kind=self.kind, codebooks=self.codebooks)
+
+
+def create_quantizer(kind: str, dimension: int, pq_segments: int = 0):
+    """
+    创建未训练的量化器
+
+    Args:
+        kind: int8 或 pq
+        dimension: 向量维度
+        pq_segments: 乘积量化段数，0表示维度的1/4（每4维一段，内存为 float32 的1/16）
+
+    Returns:
+        量化器
+    """
+    if kind == "int8":
+        return ScalarQuantizer()
+    if kind == "pq":
+        segments = pq_segments or max(1, dimension // 4)
+        if dimension % segments:
+            raise ValueError(f"乘积量化段数 {segments} 不能整除向量维度 {dimension}")
+        return ProductQuantizer(segments)
+    raise ValueError(f"不支持的量化方式: {kind}")
+
+
+def load_quantizer(path: str):
+    """
+    从索引目录读取量化器
+
+    Returns:
+        量化器，未量化的索引返回None
+    """
+    quantizer_path = os.path.join(path, _QUANTIZER_FILE)
+    if not os.path.exists(quantizer_path):
+        return None
+    data = np.load(quantizer_path)
+    kind = str(data["kind"])
+    if kind == "int8":
+        return ScalarQuantizer(data["scale"])
+    codebooks = data["codebooks"]
+    return ProductQuantizer(len(codebooks), codebooks)
@@ -0,0 +1,176 @@
+"""
+向量库服务
+管理本地向量集合的打开和检索，提供向量检索处理器使用的异步检索接口
+"""
+import os
+import re
+import threading
+import dotenv
+from typing import Any, Dict, List, Optional, Sequence
+from .collection import VectorCollection
+
+
+# 集合名称只允许字母、数字、下划线和连字符（用作目录名）
+_COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+
+class VectorStore:
+    """本地向量库服务"""
+
+    def __init__(self):
+        """初始化向量库服务（集合在首次使用时打开）"""
+        self._load_vector_config()
+        self._collections: Dict[str, VectorCollection] = {}
+        self._lock = threading.Lock()
+
+    def _load_vector_config(self):
+        """加载向量库配置"""
+        app_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        vector_config_path = os.path.join(app_dir, "config", "config_embedding.env")
+
+        # 设置配置属性默认值
+        self.db_type = "local"
+        self.dimension = 768
+        self.collection_name = "default_vectors"
+        self.collections: List[str] = []
+        self.index_dir = os.path.join(os.path.dirname(app_dir), "data", "vectors")
+        self.ann_min_rows = 200000
+        self.ivf_nlist = 0
+        self.ivf_nprobe = 16
+        self.ivf_rebuild_ratio = 0.2
+        self.quantization = "none"
+        self.pq_segments = 0
+        self.rerank = True
+        self.rerank_factor = 4
+
+        # 如果配置文件存在，则加载配置
+        if os.path.exists(vector_config_path):
+            vector_config = dotenv.dotenv_values(vector_config_path)
+
+            self.db_type = vector_config.get("VECTOR_DB_TYPE", self.db_type).lower()
+            self.dimension = int(vector_config.get("VECTOR_DIMENSION", self.dimension))
+            self.collection_name = vector_config.get("VECTOR_COLLECTION_NAME", self.collection_name)
+            self.collections = [name.strip() for name in vector_config.get("VECTOR_COLLECTIONS", "").split(",")
+                                if name.strip()]
+            index_dir = vector_config.get("VECTOR_INDEX_DIR")
+            if index_dir:
+                # 相对路径以项目根目录为基准
+                self.index_dir = index_dir if os.path.isabs(index_dir) else os.path.join(os.path.dirname(app_dir), index_dir)
+            self.ann_min_rows = int(vector_config.get("VECTOR_ANN_MIN_ROWS", self.ann_min_rows))
+            self.ivf_nlist = int(vector_config.get("VECTOR_IVF_NLIST", self.ivf_nlist))
+            self.ivf_nprobe = int(vector_config.get("VECTOR_IVF_NPROBE", self.ivf_nprobe))
+            self.ivf_rebuild_ratio = float(vector_config.get("VECTOR_IVF_REBUILD_RATIO", self.ivf_rebuild_ratio))
+            self.quantization = vector_config.get("VECTOR_QUANTIZATION", self.quantization).lower()
+            self.pq_segments = int(vector_config.get("VECTOR_PQ_SEGMENTS", self.pq_segments))
+            self.rerank = vector_config.get("VECTOR_RERANK", "true").lower() == "true"
+            self.rerank_factor = int(vector_config.get("VECTOR_RERANK_FACTOR", self.rerank_factor))
+
+        # 默认集合始终是已配置的集合
+        if self.collection_name not in self.collections:
+            self.collections.insert(0, self.collection_name)
+
+    @property
+    def enabled(self) -> bool:
+        """是否使用本地向量库作为检索后端"""
+        return self.db_type == "local"
+
+    def get_collection(self, collection_name: str) -> VectorCollection:
+        """
+        获取（必要时打开）向量集合
+
+        Args:
+            collection_name: 集合名称
+
+        Returns:
+            集合实例
+        """
+        collection = self._collections.get(collection_name)
+        if collection is not None:
+            return collection
+
+        if not _COLLECTION_NAME_PATTERN.match(collection_name):
+            raise ValueError(f"无效的集合名称: {collection_name}")
+
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is None:
+                collection = VectorCollection(collection_name, os.path.join(self.index_dir, collection_name),
+                                              dimension=self.dimension, ann_min_rows=self.ann_min_rows,
+                                              nlist=self.ivf_nlist, nprobe=self.ivf_nprobe,
+                                              rebuild_ratio=self.ivf_rebuild_ratio, quantization=self.quantization,
+                                              pq_segments=self.pq_segments, rerank=self.rerank,
+                                              rerank_factor=self.rerank_factor)
+                self._collections[collection_name] = collection
+        return collection
+
+    def add(self, collection_name: str, vectors: Any, records: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+        """
+        向集合追加向量
+
+        Args:
+            collection_name: 集合名称
+            vectors: 向量矩阵（条数 × 维度）
+            records: 与向量一一对应的记录 [{"id", "content", "metadata"}]
+
+        Returns:
+            写入的条数
+        """
+        return self.get_collection(collection_name).add(vectors, records)
+
+    def build_index(self, collection_name: str, index_type: str = "ivf", nlist: Optional[int] = None,
+                    quantization: Optional[str] = None) -> Dict[str, Any]:
+        """
+        为集合建立（或删除）近似索引
+
+        Args:
+            collection_name: 集合名称
+            index_type: ivf 或 flat（不量化时删除索引，始终精确检索）
+            nlist: IVF 簇数，缺省使用配置
+            quantization: none、int8 或 pq，缺省使用配置
+
+        Returns:
+            新的索引设置
+        """
+        return self.get_collection(collection_name).build_index(index_type, nlist, quantization)
+
+    def search_sync(self, vector: Sequence[float], collection_name: str, top_k: int = 5,
+                    threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        同步检索
+
+        Args:
+            vector: 查询向量
+            collection_name: 集合名称
+            top_k: 返回的最大结果数
+            threshold: 相似度阈值
+
+        Returns:
+            [{"id", "content", "similarity", "metadata"}]，按相似度降序
+        """
+        return self.get_collection(collection_name).search_sync(vector, top_k, threshold)
+
+    async def search(self, vector: Sequence[float], collection_name: str, top_k: int = 5,
+                     threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        异步检索（在共享线程池中执行，矩阵运算期间释放GIL，不阻塞事件循环）
+
+        Args:
+            vector: 查询向量
+            collection_name: 集合名称
+            top_k: 返回的最大结果数
+            threshold: 相似度阈值
+
+        Returns:
+            [{"id", "content", "similarity", "metadata"}]，按相似度降序
+        """
+        # llm 包会导入各处理器，处理器又导入本包，在此处导入以免循环导入
+        from ..llm.executor_pools import THREAD_POOL, executor_pools
+        return await executor_pools.run(THREAD_POOL, self.search_sync, vector, collection_name, top_k, threshold)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """获取已打开集合的统计信息"""
+        return [collection.stats() for collection in list(self._collections.values())]
+
+
+# 单例实例
+vector_store = VectorStore()